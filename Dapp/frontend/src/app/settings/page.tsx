@@ -4,7 +4,7 @@ import { useState, useEffect } from 'react';
 import { useRouter } from 'next/navigation';
 import { storage, StorageKeys } from '@/lib/utils';
 import { passkeyService } from '@/services/passkeyService';
-import { User } from '@/services/authService';
+import { User, authHeaders } from '@/services/authService';
 import AnimatedBackground from '@/components/AnimatedBackground';
 
 const CROPS = ['coffee', 'rice', 'maize', 'banana', 'mango', 'coconut', 'orange', 'apple', 'grapes', 'cotton', 'jute'];
@@ -56,7 +56,7 @@ export default function SettingsPage() {
 
       const response = await fetch(`/api/auth/profile/${user.id}`, {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({
           full_name: formData.full_name,
           email: formData.email || undefined,
@@ -108,7 +108,7 @@ export default function SettingsPage() {
 
       const response = await fetch(`/api/auth/profile/${user.id}`, {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({
           passkey_credential_id: passkeyResult.credentialId,
           passkey_public_key: passkeyResult.publicKey,
@@ -75,8 +75,23 @@ export default function RealtimeIoT({ onMetricClick }: RealtimeIoTProps = {}) {
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 30000);
-    return () => clearInterval(interval);
+
+    // New readings are pushed over SSE; polling only refreshes the hourly trend
+    const interval = setInterval(fetchData, 300000);
+    const source = new EventSource(`${API_URL}/api/realtime/stream`);
+    source.addEventListener('reading', (event) => {
+      try {
+        setLatest(JSON.parse((event as MessageEvent).data));
+        setError(null);
+      } catch (err) {
+        console.error('Invalid realtime reading:', err);
+      }
+    });
+
+    return () => {
+      clearInterval(interval);
+      source.close();
+    };
   }, []);
 
   if (loading) {
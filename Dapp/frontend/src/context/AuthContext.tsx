@@ -3,7 +3,7 @@
 import React, { createContext, useContext, useState, useEffect, ReactNode } from 'react';
 import { passkeyService } from '@/services/passkeyService';
 import { generateWalletAddress } from '@/services/walletFromPasskey';
-import { registerPasskey, registerWithPIN, loginPasskey, loginWithPIN, User } from '@/services/authService';
+import { registerPasskey, registerWithPIN, loginPasskey, loginWithPIN, clearSession, User } from '@/services/authService';
 import { storage, StorageKeys } from '@/lib/utils';
 
 interface AuthContextType {
@@ -314,6 +314,7 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
       setUser(null);
       storage.remove(StorageKeys.USER);
       storage.remove(StorageKeys.AUTH_METHOD);
+      clearSession();
       console.log('👋 Logged out successfully');
     } catch (err) {
       console.error('❌ Logout error:', err);
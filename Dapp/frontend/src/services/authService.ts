@@ -6,6 +6,26 @@
 // Use relative path - Next.js will proxy to Flask
 const API_URL = '';
 
+// Signed session token returned by login/registration (sent as Bearer token)
+const SESSION_TOKEN_KEY = 'aquamind_session_token';
+
+function saveSession(result: { success: boolean; token?: string }): void {
+  if (result.success && result.token && typeof window !== 'undefined') {
+    localStorage.setItem(SESSION_TOKEN_KEY, result.token);
+  }
+}
+
+export function clearSession(): void {
+  if (typeof window !== 'undefined') {
+    localStorage.removeItem(SESSION_TOKEN_KEY);
+  }
+}
+
+export function authHeaders(): Record<string, string> {
+  const token = typeof window !== 'undefined' ? localStorage.getItem(SESSION_TOKEN_KEY) : null;
+  return token ? { Authorization: `Bearer ${token}` } : {};
+}
+
 export interface RegisterData {
   full_name: string;
   phone: string;
@@ -52,6 +72,8 @@ export interface RegisterResponse {
   wallet_address?: string;
   message?: string;
   error?: string;
+  token?: string;
+  token_expires_in?: number;
 }
 
 export interface LoginResponse {
@@ -59,6 +81,8 @@ export interface LoginResponse {
   user?: User;
   message?: string;
   error?: string;
+  token?: string;
+  token_expires_in?: number;
 }
 
 /**
@@ -75,6 +99,7 @@ export async function registerPasskey(data: RegisterData): Promise<RegisterRespo
     });
 
     const result = await response.json();
+    saveSession(result);
     return result;
   } catch (error: any) {
     console.error('❌ Register API error:', error);
@@ -101,6 +126,7 @@ export async function loginPasskey(credentialId: string): Promise<LoginResponse>
     });
 
     const result = await response.json();
+    saveSession(result);
     return result;
   } catch (error: any) {
     console.error('❌ Login API error:', error);
@@ -116,7 +142,9 @@ export async function loginPasskey(credentialId: string): Promise<LoginResponse>
  */
 export async function getUserProfile(userId: number): Promise<LoginResponse> {
   try {
-    const response = await fetch(`${API_URL}/api/auth/profile/${userId}`);
+    const response = await fetch(`${API_URL}/api/auth/profile/${userId}`, {
+      headers: authHeaders(),
+    });
     const result = await response.json();
     return result;
   } catch (error: any) {
@@ -140,6 +168,7 @@ export async function updateUserProfile(
       method: 'PUT',
       headers: {
         'Content-Type': 'application/json',
+        ...authHeaders(),
       },
       body: JSON.stringify(data),
     });
@@ -169,6 +198,7 @@ export async function registerWithPIN(data: RegisterPINData): Promise<RegisterRe
     });
 
     const result = await response.json();
+    saveSession(result);
     return result;
   } catch (error: any) {
     console.error('❌ Register PIN API error:', error);
@@ -193,6 +223,7 @@ export async function loginWithPIN(emailOrPhone: string, pin: string): Promise<L
     });
 
     const result = await response.json();
+    saveSession(result);
     return result;
   } catch (error: any) {
     console.error('❌ Login PIN API error:', error);
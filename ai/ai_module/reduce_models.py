@@ -0,0 +1,313 @@
+"""
+Reduce Models - Smaller forests for production, with an accuracy/latency report
+The models were sized in soil_training.ipynb for accuracy only (200-tree
+classifier, 22 × 100-tree validators, 100-tree anomaly detector). For each
+model this tool builds reduced candidates:
+
+- full:        the trained forest, predicting single-threaded (n_jobs=1)
+- trees=K:     the first K trees of the trained forest
+- distill KxD: a new K-tree forest with max_depth D, trained on the
+               full model's predictions for train.csv + val.csv
+
+and measures them on data/test.csv: quality, single-row latency (what
+/api/ai/analyze does), batch latency (whole test set) and tree memory.
+
+Quality:
+- crop_classifier: accuracy against the test labels
+- soil_health_scorer, crop validators: share of test rows given the same
+  rating band (85/70/55) as the full model; MAE to the full model
+- anomaly_detector: share of test rows given the same anomaly flag
+
+The operating point of a model is the fastest single-row candidate losing at
+most --max-loss quality against the full model. With --write it is saved
+under models/reduced/ and recorded in models/operating_points.json, which
+the AI service's ModelRegistry loads instead of the original .pkl
+
+    python reduce_models.py                          # report only
+    python reduce_models.py --models validators --write
+    python reduce_models.py --max-loss 0.02 --write --report reduction_report.json
+"""
+
+import argparse
+import copy
+import json
+import pickle
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+# Paths
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / 'data'
+MODELS_DIR = BASE_DIR / 'models'
+REDUCED_DIR = MODELS_DIR / 'reduced'
+OPERATING_POINTS_PATH = MODELS_DIR / 'operating_points.json'
+
+CORE_MODELS = {
+    'crop_classifier': 'crop_classifier.pkl',
+    'soil_health_scorer': 'soil_health_scorer.pkl',
+    'anomaly_detector': 'anomaly_detector.pkl',
+}
+
+# Per-tree attributes of sklearn 1.3 forests (IsolationForest keeps several)
+PER_TREE_ATTRS = (
+    'estimators_',
+    'estimators_features_',
+    '_seeds',
+    '_average_path_length_per_tree',
+    '_decision_path_lengths',
+)
+
+# Same bands as inference.py (soil health rating, crop verdict)
+RATING_BANDS = (85, 70, 55)
+
+
+# ==============================================================================
+# DATA
+# ==============================================================================
+
+def load_split(name: str):
+    df = pd.read_csv(DATA_DIR / f'{name}.csv')
+    return df.drop('label', axis=1).to_numpy(), df['label'].to_numpy()
+
+
+# ==============================================================================
+# CANDIDATES
+# ==============================================================================
+
+def single_threaded(model):
+    """Shallow copy predicting in the calling thread (the notebook saved n_jobs=-1)"""
+    m = copy.copy(model)
+    m.n_jobs = 1
+    m.verbose = 0
+    return m
+
+
+def first_trees(model, k: int):
+    """The first k trees of a trained forest"""
+    m = single_threaded(model)
+    for attr in PER_TREE_ATTRS:
+        value = getattr(model, attr, None)
+        if value is not None and len(value) == model.n_estimators:
+            setattr(m, attr, value[:k])
+    m.n_estimators = k
+    return m
+
+
+def distill(model, X: np.ndarray, n_estimators: int, max_depth: int):
+    """Smaller forest fit on the full model's predictions"""
+    student_cls = RandomForestClassifier if hasattr(model, 'classes_') else RandomForestRegressor
+    student = student_cls(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        min_samples_split=5,
+        random_state=42,
+        n_jobs=1
+    )
+    return student.fit(X, model.predict(X))
+
+
+def candidates(model, X_fit: np.ndarray, args):
+    yield 'full', single_threaded(model)
+    for k in args.trees:
+        if k < model.n_estimators:
+            yield f'trees={k}', first_trees(model, k)
+    # IsolationForest has no labels to distill from; tree subsets only
+    if hasattr(model, 'offset_'):
+        return
+    for k in args.distill_trees:
+        for d in args.distill_depths:
+            yield f'distill {k}x{d}', distill(model, X_fit, k, d)
+
+
+# ==============================================================================
+# MEASUREMENTS
+# ==============================================================================
+
+def tree_nbytes(model) -> int:
+    """Node and value arrays of every tree (same measure as models_loader.model_nbytes)"""
+    total = 0
+    for est in model.estimators_:
+        state = est.tree_.__getstate__()
+        total += state['nodes'].nbytes + state['values'].nbytes
+    return total
+
+
+def band(scores: np.ndarray) -> np.ndarray:
+    return np.searchsorted(-np.array(RATING_BANDS), -scores, side='right')
+
+
+def quality(kind: str, pred: np.ndarray, reference: np.ndarray, y_test: np.ndarray) -> dict:
+    if kind == 'classifier':
+        return {'quality': float((pred == y_test).mean())}
+    if kind == 'regressor':
+        return {
+            'quality': float((band(pred) == band(reference)).mean()),
+            'mae_to_full': float(np.abs(pred - reference).mean()),
+        }
+    return {'quality': float((pred == reference).mean())}
+
+
+def latency_ms(model, X: np.ndarray, repeats: int) -> tuple:
+    model.predict(X[:1])  # warm-up
+    single = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        start = time.perf_counter()
+        model.predict(row)
+        single.append((time.perf_counter() - start) * 1000)
+
+    batch = []
+    for _ in range(max(3, repeats // 10)):
+        start = time.perf_counter()
+        model.predict(X)
+        batch.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(single), statistics.median(batch)
+
+
+def evaluate(model, data: dict, args) -> list:
+    X_test, y_test = data['test']
+    kind = 'classifier' if hasattr(model, 'classes_') else 'anomaly' if hasattr(model, 'offset_') else 'regressor'
+    reference = model.predict(X_test)
+
+    results = []
+    baseline = None
+    for variant, candidate in candidates(model, data['fit'], args):
+        pred = candidate.predict(X_test)
+        single_ms, batch_ms = latency_ms(candidate, X_test, args.repeats)
+        result = {
+            'variant': variant,
+            'n_estimators': len(candidate.estimators_),
+            'max_depth': candidate.max_depth if variant.startswith('distill') else getattr(model, 'max_depth', None),
+            'single_row_ms': round(single_ms, 3),
+            'batch_ms': round(batch_ms, 3),
+            'tree_bytes': tree_nbytes(candidate),
+            'pickle_bytes': len(pickle.dumps(candidate)),
+            **quality(kind, pred, reference, y_test),
+        }
+        if baseline is None:
+            baseline = result['quality']
+        result['loss'] = round(baseline - result['quality'], 4)
+        result['model'] = candidate
+        results.append(result)
+
+    return results
+
+
+def choose(results: list, max_loss: float) -> dict:
+    eligible = [r for r in results if r['loss'] <= max_loss]
+    return min(eligible, key=lambda r: (r['single_row_ms'], r['tree_bytes']))
+
+
+def print_table(name: str, results: list, chosen: dict) -> None:
+    print(f"\n📊 {name}")
+    print(f"   {'variant':<16} {'trees':>5} {'quality':>8} {'loss':>7} {'1-row ms':>9} "
+          f"{'batch ms':>9} {'tree MB':>8}")
+    for r in results:
+        marker = '⭐' if r is chosen else '  '
+        print(f" {marker}{r['variant']:<16} {r['n_estimators']:>5} {r['quality']:>8.4f} {r['loss']:>7.4f} "
+              f"{r['single_row_ms']:>9.3f} {r['batch_ms']:>9.3f} {r['tree_bytes'] / 1e6:>8.2f}")
+
+
+# ==============================================================================
+# OPERATING POINTS
+# ==============================================================================
+
+def write_operating_point(key: str, chosen: dict, original_file: str) -> dict:
+    path = REDUCED_DIR / f'{key}.pkl'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(chosen['model'], path)
+    return {
+        'file': str(path.relative_to(MODELS_DIR)),
+        'original_file': original_file,
+        **{k: v for k, v in chosen.items() if k != 'model'},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', default='crop_classifier,soil_health_scorer,anomaly_detector,validators',
+                        help='comma-separated: crop_classifier, soil_health_scorer, anomaly_detector, '
+                             'validators (all 22) or validator:<crop>')
+    parser.add_argument('--trees', default='100,50,25,10')
+    parser.add_argument('--distill-trees', default='25,10')
+    parser.add_argument('--distill-depths', default='12,8')
+    parser.add_argument('--max-loss', type=float, default=0.01,
+                        help='largest quality drop against the full model for an operating point')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--write', action='store_true', help='save operating points for the AI service')
+    parser.add_argument('--report', help='write every candidate\'s metrics to this JSON file')
+    args = parser.parse_args()
+
+    args.trees = [int(k) for k in args.trees.split(',') if k]
+    args.distill_trees = [int(k) for k in args.distill_trees.split(',') if k]
+    args.distill_depths = [int(d) for d in args.distill_depths.split(',') if d]
+
+    X_train, _ = load_split('train')
+    X_val, _ = load_split('val')
+    data = {'fit': np.vstack([X_train, X_val]), 'test': load_split('test')}
+
+    targets = []
+    crops = json.loads((MODELS_DIR / 'crop_validators' / 'model_list.json').read_text())['crops']
+    for name in args.models.split(','):
+        if name in CORE_MODELS:
+            targets.append((name, CORE_MODELS[name]))
+        elif name == 'validators':
+            targets += [(f'crop_validators/{c}', f'crop_validators/{c}_validator.pkl') for c in crops]
+        elif name.startswith('validator:'):
+            crop = name.split(':', 1)[1]
+            targets.append((f'crop_validators/{crop}', f'crop_validators/{crop}_validator.pkl'))
+        else:
+            parser.error(f"unknown model '{name}'")
+
+    print("=" * 80)
+    print("✂️  REDUCING MODELS")
+    print("=" * 80)
+
+    operating_points = {}
+    if OPERATING_POINTS_PATH.exists():
+        operating_points = json.loads(OPERATING_POINTS_PATH.read_text()).get('models', {})
+
+    report = {}
+    for key, file in targets:
+        path = MODELS_DIR / file
+        if not path.exists():
+            print(f"\n⚠️  {key}: {path} not found, skipped")
+            continue
+
+        model = joblib.load(path)
+        original_ms, _ = latency_ms(model, data['test'][0], args.repeats)
+        results = evaluate(model, data, args)
+        chosen = choose(results, args.max_loss)
+
+        print_table(key, results, chosen)
+        print(f"   as saved (n_jobs={model.n_jobs}): {original_ms:.3f} ms per row")
+
+        report[key] = [{k: v for k, v in r.items() if k != 'model'} for r in results]
+        if args.write:
+            operating_points[key] = write_operating_point(key, chosen, file)
+
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Report saved: {args.report}")
+
+    if args.write:
+        OPERATING_POINTS_PATH.write_text(json.dumps({
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'max_loss': args.max_loss,
+            'test_samples': len(data['test'][1]),
+            'models': operating_points,
+        }, indent=2))
+        print(f"\n💾 Operating points saved: {OPERATING_POINTS_PATH}")
+        print("   Restart the AI service to load them")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,11 @@ Query DB, aggregate sensor data, and save AI insights
 """
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import os
-from typing import Dict, Optional
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
 import logging
 import json
 from datetime import datetime
@@ -15,11 +17,43 @@ from dotenv import load_dotenv
 
 from schemas import AIAnalysisResponse
 
+# service_client.py lives at the repo root, shared with the ingest servers
+# (appended: modules of this directory keep precedence)
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.append(str(REPO_ROOT))
+
+from service_client import CircuitOpenError, get_service
+
 # Load environment variables
 load_dotenv('config.env')
 
 logger = logging.getLogger(__name__)
 
+# Readings without an explicit device belong to this device (migration 013)
+DEFAULT_DEVICE_ID = os.getenv("DEFAULT_DEVICE_ID", "default")
+
+# Stored online daily stats (sensor_daily_stats, migration 019) are used
+# while at most this share of the day's readings is missing from them
+ONLINE_STATS_MAX_MISSING = float(os.getenv("ONLINE_STATS_MAX_MISSING", "0.01"))
+
+# Feature -> sensor_readings column in sensor_daily_stats.stats
+STATS_FEATURE_COLUMNS = {
+    'soil_temperature': 'soil_temperature_c',
+    'soil_moisture': 'soil_moisture_pct',
+    'conductivity': 'conductivity_us_cm',
+    'ph': 'ph_value',
+    'nitrogen': 'nitrogen_mg_kg',
+    'phosphorus': 'phosphorus_mg_kg',
+    'potassium': 'potassium_mg_kg',
+    'salt': 'salt_mg_l',
+    'air_temperature': 'air_temperature_c',
+    'air_humidity': 'air_humidity_pct',
+}
+
+# Node.js bridge calls (pooled keep-alive connection + circuit breaker)
+node_bridge = get_service("node_bridge")
+
 
 def get_db_conn():
     """Get PostgreSQL connection"""
@@ -32,26 +66,75 @@ def get_db_conn():
     )
 
 
-def aggregate_daily_data(date: str) -> Optional[Dict]:
+def aggregate_from_daily_stats(cur, date: str, device_id: str) -> Optional[Dict]:
+    """
+    Aggregate from the online stats maintained at ingest (one row instead of
+    the day's readings). None when there is no row or its stats do not cover
+    the day's readings; the caller then scans sensor_readings.
+    """
+    cur.execute("""
+        SELECT stats, stats_count, reading_count
+        FROM sensor_daily_stats
+        WHERE device_id = %s AND date_vn = %s
+    """, (device_id, date))
+    row = cur.fetchone()
+    if not row or not row['stats'] or row['reading_count'] == 0:
+        return None
+    if row['reading_count'] - row['stats_count'] > ONLINE_STATS_MAX_MISSING * row['reading_count']:
+        return None
+
+    stats = row['stats'] if isinstance(row['stats'], dict) else json.loads(row['stats'])
+    columns = stats['stats']
+    if any(columns.get(c, {}).get('count', 0) == 0 for c in STATS_FEATURE_COLUMNS.values()):
+        return None
+
+    features = {feature: float(columns[c]['mean']) for feature, c in STATS_FEATURE_COLUMNS.items()}
+    features['is_raining'] = stats['rain'] / stats['count'] > 0.5
+    return {
+        'date': date,
+        'device_id': device_id,
+        'sample_count': stats['count'],
+        'features': features,
+        'metadata': {
+            'min_soil_temp': float(columns['soil_temperature_c']['min']),
+            'max_soil_temp': float(columns['soil_temperature_c']['max']),
+            'min_moisture': float(columns['soil_moisture_pct']['min']),
+            'max_moisture': float(columns['soil_moisture_pct']['max'])
+        }
+    }
+
+
+def aggregate_daily_data(date: str, device_id: str = DEFAULT_DEVICE_ID) -> Optional[Dict]:
     """
     Aggregate sensor data for a specific date
     
     Args:
         date: Date string in YYYY-MM-DD format
+        device_id: Device whose readings are aggregated
     
     Returns:
         Dict with aggregated features and metadata
         None if no data found
     """
-    logger.info(f"📊 Aggregating data for {date}...")
+    logger.info(f"📊 Aggregating data for {date} (device: {device_id})...")
     
     conn = get_db_conn()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            try:
+                aggregated = aggregate_from_daily_stats(cur, date, device_id)
+            except psycopg2.errors.UndefinedTable:
+                conn.rollback()  # before migration 019
+                aggregated = None
+            if aggregated:
+                logger.info(f"   ✅ Aggregated {aggregated['sample_count']} samples (online stats)")
+                return aggregated
+
             # Query: Aggregate all 11 parameters for the date
-            query = """SELECT COUNT(*) as sample_count, AVG(soil_temperature_c) as soil_temperature, AVG(soil_moisture_pct) as soil_moisture, AVG(conductivity_us_cm) as conductivity, AVG(ph_value) as ph, AVG(nitrogen_mg_kg) as nitrogen, AVG(phosphorus_mg_kg) as phosphorus, AVG(potassium_mg_kg) as potassium, AVG(salt_mg_l) as salt, AVG(air_temperature_c) as air_temperature, AVG(air_humidity_pct) as air_humidity, (SUM(CASE WHEN is_raining THEN 1 ELSE 0 END)::float / COUNT(*)) > 0.5 as is_raining, MIN(soil_temperature_c) as min_soil_temp, MAX(soil_temperature_c) as max_soil_temp, MIN(soil_moisture_pct) as min_moisture, MAX(soil_moisture_pct) as max_moisture FROM sensor_readings WHERE DATE(measured_at_vn) = %s"""
+            query = """SELECT COUNT(*) as sample_count, AVG(soil_temperature_c) as soil_temperature, AVG(soil_moisture_pct) as soil_moisture, AVG(conductivity_us_cm) as conductivity, AVG(ph_value) as ph, AVG(nitrogen_mg_kg) as nitrogen, AVG(phosphorus_mg_kg) as phosphorus, AVG(potassium_mg_kg) as potassium, AVG(salt_mg_l) as salt, AVG(air_temperature_c) as air_temperature, AVG(air_humidity_pct) as air_humidity, (SUM(CASE WHEN is_raining THEN 1 ELSE 0 END)::float / COUNT(*)) > 0.5 as is_raining, MIN(soil_temperature_c) as min_soil_temp, MAX(soil_temperature_c) as max_soil_temp, MIN(soil_moisture_pct) as min_moisture, MAX(soil_moisture_pct) as max_moisture FROM sensor_readings WHERE device_id = %s AND measured_at_vn >= %s::date AND measured_at_vn < %s::date + 1"""
             
-            cur.execute(query, (date,))
+            # Range predicate (not DATE(...)) so only the day's partition is scanned
+            cur.execute(query, (device_id, date, date))
             result = cur.fetchone()
             
             if not result or result['sample_count'] == 0:
@@ -61,6 +144,7 @@ def aggregate_daily_data(date: str) -> Optional[Dict]:
             # Prepare aggregated features
             aggregated = {
                 'date': date,
+                'device_id': device_id,
                 'sample_count': result['sample_count'],
                 'features': {
                     'soil_temperature': float(result['soil_temperature']),
@@ -111,7 +195,7 @@ def save_daily_insight(date: str, aggregated_data: Dict, ai_result: AIAnalysisRe
     try:
         with conn.cursor() as cur:
             # Insert into daily_insights table (simplified schema - 26 columns)
-            insert_query = """INSERT INTO daily_insights (date_vn, total_readings, soil_temperature_avg, soil_moisture_avg, conductivity_avg, ph_avg, nitrogen_avg, phosphorus_avg, potassium_avg, salt_avg, air_temperature_avg, air_humidity_avg, is_raining_majority, recommended_crop, crop_confidence, soil_health_score, soil_health_rating, has_anomaly, anomaly_score, summary_status, summary_text, ai_analysis_json, recommendations_json) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (date_vn) DO UPDATE SET total_readings = EXCLUDED.total_readings, soil_temperature_avg = EXCLUDED.soil_temperature_avg, soil_moisture_avg = EXCLUDED.soil_moisture_avg, conductivity_avg = EXCLUDED.conductivity_avg, ph_avg = EXCLUDED.ph_avg, nitrogen_avg = EXCLUDED.nitrogen_avg, phosphorus_avg = EXCLUDED.phosphorus_avg, potassium_avg = EXCLUDED.potassium_avg, salt_avg = EXCLUDED.salt_avg, air_temperature_avg = EXCLUDED.air_temperature_avg, air_humidity_avg = EXCLUDED.air_humidity_avg, is_raining_majority = EXCLUDED.is_raining_majority, recommended_crop = EXCLUDED.recommended_crop, crop_confidence = EXCLUDED.crop_confidence, soil_health_score = EXCLUDED.soil_health_score, soil_health_rating = EXCLUDED.soil_health_rating, has_anomaly = EXCLUDED.has_anomaly, anomaly_score = EXCLUDED.anomaly_score, summary_status = EXCLUDED.summary_status, summary_text = EXCLUDED.summary_text, ai_analysis_json = EXCLUDED.ai_analysis_json, recommendations_json = EXCLUDED.recommendations_json, updated_at = NOW() RETURNING id"""
+            insert_query = """INSERT INTO daily_insights (device_id, date_vn, total_readings, soil_temperature_avg, soil_moisture_avg, conductivity_avg, ph_avg, nitrogen_avg, phosphorus_avg, potassium_avg, salt_avg, air_temperature_avg, air_humidity_avg, is_raining_majority, recommended_crop, crop_confidence, soil_health_score, soil_health_rating, has_anomaly, anomaly_score, summary_status, summary_text, ai_analysis_json, recommendations_json) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (device_id, date_vn) DO UPDATE SET total_readings = EXCLUDED.total_readings, soil_temperature_avg = EXCLUDED.soil_temperature_avg, soil_moisture_avg = EXCLUDED.soil_moisture_avg, conductivity_avg = EXCLUDED.conductivity_avg, ph_avg = EXCLUDED.ph_avg, nitrogen_avg = EXCLUDED.nitrogen_avg, phosphorus_avg = EXCLUDED.phosphorus_avg, potassium_avg = EXCLUDED.potassium_avg, salt_avg = EXCLUDED.salt_avg, air_temperature_avg = EXCLUDED.air_temperature_avg, air_humidity_avg = EXCLUDED.air_humidity_avg, is_raining_majority = EXCLUDED.is_raining_majority, recommended_crop = EXCLUDED.recommended_crop, crop_confidence = EXCLUDED.crop_confidence, soil_health_score = EXCLUDED.soil_health_score, soil_health_rating = EXCLUDED.soil_health_rating, has_anomaly = EXCLUDED.has_anomaly, anomaly_score = EXCLUDED.anomaly_score, summary_status = EXCLUDED.summary_status, summary_text = EXCLUDED.summary_text, ai_analysis_json = EXCLUDED.ai_analysis_json, recommendations_json = EXCLUDED.recommendations_json, updated_at = NOW() RETURNING id"""
             
             # Prepare AI analysis summary JSON
             ai_summary = {
@@ -155,6 +239,7 @@ def save_daily_insight(date: str, aggregated_data: Dict, ai_result: AIAnalysisRe
             summary_text = f"Soil Health: {ai_result.soil_health.rating} ({ai_result.soil_health.overall_score:.1f}/100). Recommended crop: {ai_result.crop_recommendation.best_crop}. {'ANOMALY DETECTED!' if ai_result.anomaly_detection.is_anomaly else 'Normal conditions.'}"
             
             cur.execute(insert_query, (
+                aggregated_data.get('device_id', DEFAULT_DEVICE_ID),
                 date,
                 aggregated_data['sample_count'],
                 aggregated_data['features']['soil_temperature'],
@@ -198,7 +283,8 @@ def push_to_blockchain(
     daily_insight_id: int,
     date: str,
     ai_result: AIAnalysisResponse,
-    sample_count: int
+    sample_count: int,
+    device_id: str = DEFAULT_DEVICE_ID
 ) -> tuple[bool, str, str]:
     """
     Push daily AI insight to blockchain via Node.js bridge
@@ -208,6 +294,7 @@ def push_to_blockchain(
         date: Date string (YYYY-MM-DD)
         ai_result: AI analysis result
         sample_count: Number of samples aggregated
+        device_id: Device the insight belongs to
     
     Returns:
         Tuple: (success: bool, tx_hash: str, status: str)
@@ -239,14 +326,9 @@ def push_to_blockchain(
         logger.info(f"\n🔗 Pushing to blockchain: {endpoint}")
         logger.info(f"   📦 Payload: {json.dumps(payload, indent=2)}")
         
-        # Send POST request
-        response = requests.post(
-            endpoint,
-            json=payload,
-            timeout=30  # 30 seconds timeout for blockchain transaction
-        )
-        
-        response.raise_for_status()  # Raise error for 4xx/5xx
+        # Send POST request (raises HTTPError for 4xx/5xx, CircuitOpenError
+        # without calling while the bridge is marked down)
+        response = node_bridge.post_json(endpoint, payload)
         
         result = response.json()
         tx_hash = result.get('txHash', '')
@@ -256,29 +338,34 @@ def push_to_blockchain(
         logger.info(f"      • Block: {result.get('blockNumber')}")
         
         # Update database with blockchain status
-        update_blockchain_status(date, 'confirmed', tx_hash)
+        update_blockchain_status(date, 'confirmed', tx_hash, device_id)
         
         return (True, tx_hash, 'confirmed')
         
+    except CircuitOpenError as e:
+        logger.warning(f"⚠️ Blockchain push skipped: {e}")
+        update_blockchain_status(date, 'failed', None, device_id)
+        return (False, '', 'failed')
+        
     except requests.exceptions.Timeout:
-        logger.error("❌ Blockchain push timeout (30s)")
-        update_blockchain_status(date, 'failed', None)
+        logger.error(f"❌ Blockchain push timeout ({node_bridge.timeout[1]:.0f}s)")
+        update_blockchain_status(date, 'failed', None, device_id)
         return (False, '', 'failed')
         
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Blockchain push failed: {e}")
         if hasattr(e.response, 'text'):
             logger.error(f"   Response: {e.response.text}")
-        update_blockchain_status(date, 'failed', None)
+        update_blockchain_status(date, 'failed', None, device_id)
         return (False, '', 'failed')
         
     except Exception as e:
         logger.error(f"❌ Unexpected error pushing to blockchain: {e}")
-        update_blockchain_status(date, 'failed', None)
+        update_blockchain_status(date, 'failed', None, device_id)
         return (False, '', 'failed')
 
 
-def update_blockchain_status(date: str, status: str, tx_hash: str = None):
+def update_blockchain_status(date: str, status: str, tx_hash: str = None, device_id: str = DEFAULT_DEVICE_ID):
     """
     Update blockchain status in daily_insights table
     
@@ -286,6 +373,7 @@ def update_blockchain_status(date: str, status: str, tx_hash: str = None):
         date: Date string (YYYY-MM-DD)
         status: Status (confirmed/failed)
         tx_hash: Transaction hash (optional)
+        device_id: Device the insight belongs to
     """
     try:
         conn = get_db_conn()
@@ -296,18 +384,156 @@ def update_blockchain_status(date: str, status: str, tx_hash: str = None):
                     SET blockchain_status = %s, 
                         blockchain_tx_hash = %s,
                         blockchain_pushed_at = NOW()
-                    WHERE date_vn = %s
-                """, (status, tx_hash, date))
+                    WHERE date_vn = %s AND device_id = %s
+                """, (status, tx_hash, date, device_id))
             else:
                 cur.execute("""
                     UPDATE daily_insights 
                     SET blockchain_status = %s,
                         blockchain_pushed_at = NOW()
-                    WHERE date_vn = %s
-                """, (status, date))
+                    WHERE date_vn = %s AND device_id = %s
+                """, (status, date, device_id))
             conn.commit()
         conn.close()
         logger.info(f"   ✅ Updated blockchain_status: {status}")
     except Exception as e:
         logger.error(f"   ⚠️  Failed to update blockchain_status: {e}")
 
+
+
+
+# Users whose farm a device's readings describe: the device's owner, or for
+# an unowned (shared) device, every user without a device of their own
+DEVICE_USERS_FILTER = """
+    u.is_active = TRUE
+    AND (
+        EXISTS (SELECT 1 FROM devices d WHERE d.device_id = %(device_id)s AND d.user_id = u.id)
+        OR (
+            NOT EXISTS (SELECT 1 FROM devices d WHERE d.device_id = %(device_id)s AND d.user_id IS NOT NULL)
+            AND NOT EXISTS (SELECT 1 FROM devices d WHERE d.user_id = u.id)
+        )
+    )
+"""
+
+
+def load_linked_users(device_id: str = DEFAULT_DEVICE_ID) -> List[Dict]:
+    """
+    Users of a device linked to a Zalo chat (recipients of the daily report)
+    
+    Returns:
+        List of dicts: id, full_name, farm_name, zalo_chat_id, current_crop
+    """
+    conn = get_db_conn()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT u.id, u.full_name, u.farm_name, u.zalo_chat_id, u.current_crop
+                FROM users u
+                WHERE u.zalo_chat_id IS NOT NULL AND """ + DEVICE_USERS_FILTER + """
+                ORDER BY u.id
+            """, {'device_id': device_id})
+            return [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def load_report_devices() -> List[str]:
+    """
+    Devices that get a daily report when none is named: every active owned
+    device, plus the shared default device (whose report covers the users
+    without a device of their own)
+    """
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT device_id
+                FROM devices
+                WHERE is_active = TRUE AND user_id IS NOT NULL
+                ORDER BY device_id
+            """)
+            return [DEFAULT_DEVICE_ID] + [row[0] for row in cur.fetchall() if row[0] != DEFAULT_DEVICE_ID]
+    finally:
+        conn.close()
+
+
+def load_crop_growers(device_id: str = DEFAULT_DEVICE_ID) -> List[Dict]:
+    """
+    Users of a device with a current_crop set
+    
+    Returns:
+        List of dicts: id, current_crop
+    """
+    conn = get_db_conn()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT u.id, u.current_crop
+                FROM users u
+                WHERE u.current_crop IS NOT NULL AND """ + DEVICE_USERS_FILTER + """
+                ORDER BY u.id
+            """, {'device_id': device_id})
+            return [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def load_current_crops() -> List[str]:
+    """Distinct users.current_crop values across all users (validator preload)"""
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT current_crop
+                FROM users
+                WHERE current_crop IS NOT NULL
+            """)
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def save_user_crop_validations(
+    date: str,
+    device_id: str,
+    daily_insight_id: int,
+    user_validations: List[tuple]
+) -> int:
+    """
+    Upsert per-user crop validations for one day (single statement)
+    
+    Args:
+        date: Date string (YYYY-MM-DD)
+        device_id: Device the insight belongs to
+        daily_insight_id: daily_insights row the validations were computed from
+        user_validations: [(user_id, CropValidation), ...]
+    
+    Returns:
+        Number of rows written
+    """
+    if not user_validations:
+        return 0
+    
+    rows = [
+        (user_id, device_id, date, daily_insight_id, v.crop, v.suitability_score, v.verdict)
+        for user_id, v in user_validations
+    ]
+    
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO user_crop_validations
+                    (user_id, device_id, date_vn, daily_insight_id, crop, suitability_score, verdict)
+                VALUES %s
+                ON CONFLICT (user_id, device_id, date_vn) DO UPDATE SET
+                    daily_insight_id = EXCLUDED.daily_insight_id,
+                    crop = EXCLUDED.crop,
+                    suitability_score = EXCLUDED.suitability_score,
+                    verdict = EXCLUDED.verdict,
+                    created_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh'
+            """, rows, page_size=1000)
+        conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
@@ -0,0 +1,61 @@
+"""
+Embedded Inference - Run the AI analysis inside another Python process
+For callers on the same host as the models (the Flask app's analyze_date):
+same input validation (SoilDataInput), same models and same output as
+POST /api/ai/analyze, without the HTTP hop and the JSON round trip
+
+Models are loaded once per process, on first use or via warm_up().
+"""
+
+import threading
+
+from pydantic import ValidationError
+
+from schemas import SoilDataInput
+from models_loader import get_model_registry, ModelRegistry
+from inference import analyze_soil
+
+_load_lock = threading.Lock()
+
+
+class AnalysisInputError(ValueError):
+    """Payload rejected before inference (HTTP path: 400/422)"""
+
+
+def warm_up() -> ModelRegistry:
+    """Load all models into this process (no-op once loaded)"""
+    models = get_model_registry()
+    if not models.validate_loaded():
+        with _load_lock:
+            if not models.validate_loaded():
+                models.load_all()
+    return models
+
+
+def analyze(payload: dict) -> dict:
+    """
+    Analyze one soil data payload
+
+    Args:
+        payload: Same JSON object as the body of POST /api/ai/analyze
+
+    Returns:
+        AIAnalysisResponse as a JSON-compatible dict (identical to the HTTP
+        response body apart from timestamp and processing_time_ms)
+    """
+    try:
+        data = SoilDataInput(**payload)
+    except ValidationError as e:
+        raise AnalysisInputError(str(e)) from e
+
+    models = warm_up()
+
+    # Same checks as the /api/ai/analyze endpoint
+    if data.mode == "validation":
+        if not data.selected_crop:
+            raise AnalysisInputError("selected_crop is required for validation mode")
+        available_crops = models.get_crop_names()
+        if data.selected_crop not in available_crops:
+            raise AnalysisInputError(f"Invalid crop '{data.selected_crop}'. Available: {available_crops}")
+
+    return analyze_soil(data, models).model_dump(mode="json")
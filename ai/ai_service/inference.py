@@ -315,8 +315,15 @@ def analyze_aggregated_data(aggregated_features: Dict[str, float], models: Model
     Returns:
         AIAnalysisResponse
     """
-    # Convert aggregated data to SoilDataInput format
-    data = SoilDataInput(
+    # Daily reports are always discovery mode
+    data = aggregated_to_input(aggregated_features)
+    
+    return analyze_soil(data, models)
+
+
+def aggregated_to_input(aggregated_features: Dict[str, float]) -> SoilDataInput:
+    """Convert daily aggregated features (float averages) to SoilDataInput"""
+    return SoilDataInput(
         soil_temperature=aggregated_features['soil_temperature'],
         soil_moisture=aggregated_features['soil_moisture'],
         conductivity=int(aggregated_features['conductivity']),
@@ -328,10 +335,51 @@ def analyze_aggregated_data(aggregated_features: Dict[str, float], models: Model
         air_temperature=aggregated_features['air_temperature'],
         air_humidity=aggregated_features['air_humidity'],
         is_raining=aggregated_features.get('is_raining', False),  # Or majority vote
-        mode="discovery"  # Daily reports are always discovery mode
+        mode="discovery"
     )
+
+
+def validate_crops(X_scaled: np.ndarray, crops, models: ModelRegistry) -> Dict[str, CropValidation]:
+    """
+    Model 3 for several crops on one scaled vector
     
-    return analyze_soil(data, models)
+    Each distinct crop's validator runs once, however many users grow it;
+    crops without a validator are left out of the result.
+    
+    Args:
+        X_scaled: Scaled features (1, 11)
+        crops: Crop names (duplicates / unknown names allowed)
+        models: ModelRegistry
+    
+    Returns:
+        {crop: CropValidation}
+    """
+    return {
+        crop: validate_crop(X_scaled, crop, models)
+        for crop in sorted(set(crops))
+        if crop in models.crop_validators
+    }
+
+
+def validate_daily_crops(aggregated_features: Dict[str, float], crops, models: ModelRegistry) -> Dict[str, CropValidation]:
+    """
+    Validate users' current crops against one day's aggregate
+    
+    Args:
+        aggregated_features: Dict with 11 aggregated parameters (avg values)
+        crops: users.current_crop values (raw, duplicates allowed)
+        models: ModelRegistry
+    
+    Returns:
+        {normalized crop: CropValidation} for crops that have a validator
+    """
+    X_scaled = preprocess_soil_data(aggregated_to_input(aggregated_features), models)
+    return validate_crops(X_scaled, [normalize_crop_name(c) for c in crops], models)
+
+
+def normalize_crop_name(crop: str) -> str:
+    """users.current_crop as a validator key ("Coffee " -> "coffee")"""
+    return (crop or '').strip().lower().replace(' ', '')
 
 
 # ==============================================================================
@@ -595,3 +643,48 @@ def generate_recommendations(
     
     return recommendations
 
+
+# ==============================================================================
+# DAILY MESSAGES - Per-user Zalo text
+# ==============================================================================
+
+RATING_VI = {
+    "EXCELLENT": "rất tốt",
+    "GOOD": "tốt",
+    "FAIR": "trung bình",
+    "POOR": "kém",
+}
+
+
+def format_daily_message(
+    date: str,
+    user: Dict[str, Any],
+    ai_result: AIAnalysisResponse,
+    validation: CropValidation = None
+) -> str:
+    """
+    Short daily report for one farmer: shared soil analysis plus the
+    validation of the crop they grow (if it has a validator)
+    """
+    lines = [
+        f"📅 Báo cáo ngày {date} - {user.get('farm_name') or user.get('full_name') or 'nông trại của bạn'}",
+        f"🌱 Sức khỏe đất: {RATING_VI.get(ai_result.soil_health.rating, ai_result.soil_health.rating)} "
+        f"({ai_result.soil_health.overall_score:.0f}/100)",
+    ]
+    
+    if validation is not None:
+        lines.append(
+            f"🌾 Mức phù hợp với cây {validation.crop}: "
+            f"{RATING_VI.get(validation.verdict, validation.verdict)} ({validation.suitability_score:.0f}/100)"
+        )
+    else:
+        lines.append(f"🌾 Cây trồng phù hợp nhất hôm nay: {ai_result.crop_recommendation.best_crop}")
+    
+    if ai_result.anomaly_detection.is_anomaly:
+        lines.append("🚨 Phát hiện dữ liệu cảm biến bất thường, vui lòng kiểm tra thiết bị và ruộng.")
+    
+    top = next(iter(ai_result.recommendations), None)
+    if top is not None:
+        lines.append(f"💡 {top.message}")
+    
+    return "\n".join(lines)
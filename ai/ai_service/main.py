@@ -4,25 +4,51 @@ Main entry point for AI analysis service
 """
 
 from fastapi import FastAPI, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
+from typing import Optional
 
 from schemas import (
     SoilDataInput,
     AIAnalysisResponse,
     HealthCheckResponse,
     DailyAggregateInput,
-    DailyAnalysisResponse
+    DailyAnalysisResponse,
+    DailyInsightsInput,
+    DailyInsightsResponse,
+    DeviceDailyInsights,
+    UserDailyInsight
 )
 from models_loader import get_model_registry, ModelRegistry
-from inference import analyze_soil, analyze_aggregated_data
-from daily_aggregator import aggregate_daily_data, save_daily_insight, push_to_blockchain
+from serialization import FastJSONResponse
+from single_flight import AsyncSingleFlight
+from write_behind import AnalysisWriteBehind
+from inference import (
+    analyze_soil,
+    analyze_aggregated_data,
+    format_daily_message,
+    normalize_crop_name,
+    validate_daily_crops
+)
+from daily_aggregator import (
+    aggregate_daily_data,
+    save_daily_insight,
+    push_to_blockchain,
+    load_crop_growers,
+    load_current_crops,
+    load_linked_users,
+    load_report_devices,
+    save_user_crop_validations
+)
+from service_client import service_metrics  # repo root, on sys.path via daily_aggregator
 
 # Load environment variables
 load_dotenv()
@@ -37,6 +63,12 @@ logger = logging.getLogger(__name__)
 # Track startup time for uptime
 START_TIME = time.time()
 
+# Identical concurrent analyze / analyze-daily requests share one computation
+analyze_flight = AsyncSingleFlight()
+
+# /api/ai/analyze results -> ai_analysis, batched in a background thread
+analysis_writer = AnalysisWriteBehind()
+
 # Lifespan event handler
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -47,8 +79,12 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 80)
     
     try:
+        analysis_writer.start()
+        
         # Just initialize registry, don't load all models yet
         models = get_model_registry()
+        # Validators of crops users grow are loaded with the core models
+        models.preload_source = lambda: {normalize_crop_name(c) for c in load_current_crops()}
         logger.info("✅ Model registry initialized (models will load on first request)")
         
         logger.info("\n✅ AI Service ready to accept requests!")
@@ -63,13 +99,15 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🛑 Shutting down AI Service...")
+    await run_in_threadpool(analysis_writer.close)
 
 # Create FastAPI app with lifespan
 app = FastAPI(
     title="Pione AI Service",
     description="AI Analysis Service for Soil Data (4 Models)",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -123,7 +161,7 @@ async def health_check():
             "crop_classifier",
             "soil_health_scorer",
             "anomaly_detector",
-            f"crop_validators ({len(models.crop_validators)})"
+            f"crop_validators ({len(models.crop_validators)}, on demand)"
         ],
         uptime_seconds=round(uptime, 2)
     )
@@ -144,6 +182,36 @@ async def get_models_info():
     }
 
 
+@app.get("/api/ai/services", tags=["Health"])
+async def get_services():
+    """
+    Latency and circuit breaker state of outbound calls (Node bridge)
+    """
+    return service_metrics()
+
+
+@app.get("/api/ai/write-behind", tags=["Health"])
+async def get_write_behind():
+    """
+    Buffer and counters of the ai_analysis write-behind (analyze results)
+    """
+    return analysis_writer.stats()
+
+
+def analyze_and_record(data: SoilDataInput, models: ModelRegistry) -> AIAnalysisResponse:
+    """
+    Blocking part of analyze (runs in the threadpool, once per flight)
+    
+    The result is queued for ai_analysis here rather than by each caller,
+    so coalesced requests persist it once
+    """
+    result = analyze_soil(data, models)
+    
+    # Persisted to ai_analysis in the background (batched)
+    analysis_writer.submit(result)
+    return result
+
+
 @app.post("/api/ai/analyze", response_model=AIAnalysisResponse, tags=["Analysis"])
 async def analyze_soil_data(data: SoilDataInput):
     """
@@ -192,11 +260,9 @@ async def analyze_soil_data(data: SoilDataInput):
                     detail=f"Invalid crop '{data.selected_crop}'. Available: {available_crops}"
                 )
         
-        # Run analysis
+        # Run analysis (identical concurrent requests share one run)
         logger.info(f"\n📨 Received analysis request (mode: {data.mode})")
-        result = analyze_soil(data, models)
-        
-        return result
+        return await analyze_flight.do(("analyze", data.model_dump_json()), analyze_and_record, data, models)
         
     except HTTPException:
         raise
@@ -205,6 +271,74 @@ async def analyze_soil_data(data: SoilDataInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def run_daily_analysis(date: str, device_id: str, models: ModelRegistry) -> DailyAnalysisResponse:
+    """
+    Blocking part of analyze-daily (runs in the threadpool)
+    
+    Raises HTTPException(404) when the date has no sensor data
+    """
+    # 1. Aggregate data from DB
+    aggregated_data = aggregate_daily_data(date, device_id)
+    
+    if not aggregated_data:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No sensor data found for date {date} (device: {device_id})"
+        )
+    
+    logger.info(f"   ✅ Aggregated {aggregated_data['sample_count']} samples")
+    
+    # 2. Run AI analysis on aggregated data
+    ai_result = analyze_aggregated_data(aggregated_data['features'], models)
+    
+    # 3. Save to daily_insights table
+    record_id = save_daily_insight(date, aggregated_data, ai_result)
+    
+    logger.info(f"   ✅ Saved to daily_insights (ID: {record_id})")
+    
+    # 4. Validate each farmer's current crop: one validator run per distinct
+    #    crop on the day's vector, however many users grow it
+    crop_validations = {}
+    try:
+        growers = load_crop_growers(device_id)
+        crop_validations = validate_daily_crops(
+            aggregated_data['features'], [g['current_crop'] for g in growers], models
+        )
+        user_validations = [
+            (g['id'], crop_validations[normalize_crop_name(g['current_crop'])])
+            for g in growers
+            if normalize_crop_name(g['current_crop']) in crop_validations
+        ]
+        saved = save_user_crop_validations(date, device_id, record_id, user_validations)
+        logger.info(f"   ✅ Crop validations: {len(crop_validations)} crops, {saved} users")
+    except Exception as e:
+        logger.warning(f"   ⚠️ Crop validation skipped: {e}")
+    
+    # 5. Push to blockchain (async, don't block response)
+    blockchain_success, tx_hash, blockchain_status = push_to_blockchain(
+        daily_insight_id=record_id,
+        date=date,
+        ai_result=ai_result,
+        sample_count=aggregated_data['sample_count'],
+        device_id=device_id
+    )
+    
+    if blockchain_success:
+        logger.info(f"   ✅ Pushed to blockchain successfully (TX: {tx_hash})")
+    else:
+        logger.warning(f"   ⚠️ Blockchain push failed (status: {blockchain_status}, but DB saved)")
+    
+    return DailyAnalysisResponse(
+        date=date,
+        device_id=device_id,
+        aggregated_data=aggregated_data,
+        ai_analysis=ai_result,
+        saved_to_db=True,
+        record_id=record_id,
+        crop_validations=crop_validations
+    )
+
+
 @app.post("/api/ai/analyze-daily", response_model=DailyAnalysisResponse, tags=["Daily Aggregation"])
 async def analyze_daily(request: DailyAggregateInput):
     """
@@ -214,7 +348,8 @@ async def analyze_daily(request: DailyAggregateInput):
     2. Aggregate (AVG) 11 parameters
     3. Run AI analysis
     4. Save to daily_insights table
-    5. Return result (for n8n to send to Zalo)
+    5. Validate users' current crops (stored in user_crop_validations)
+    6. Return result (for n8n to send to Zalo)
     
     Args:
         request: DailyAggregateInput with date
@@ -238,52 +373,194 @@ async def analyze_daily(request: DailyAggregateInput):
                     detail=f"Models not loaded: {str(e)}"
                 )
         
-        logger.info(f"\n📅 Daily aggregation request for date: {request.date}")
-        
-        # 1. Aggregate data from DB
-        aggregated_data = aggregate_daily_data(request.date)
+        logger.info(f"\n📅 Daily aggregation request for date: {request.date} (device: {request.device_id})")
         
-        if not aggregated_data:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No sensor data found for date {request.date}"
-            )
-        
-        logger.info(f"   ✅ Aggregated {aggregated_data['sample_count']} samples")
+        # n8n schedules and manual runs for the same date share one
+        # aggregate + upsert + blockchain push
+        return await analyze_flight.do(
+            ("analyze-daily", request.date, request.device_id),
+            run_daily_analysis, request.date, request.device_id, models
+        )
         
-        # 2. Run AI analysis on aggregated data
-        ai_result = analyze_aggregated_data(aggregated_data['features'], models)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Daily aggregation error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def today_vn() -> str:
+    """Today's date in Vietnam (UTC+7), YYYY-MM-DD"""
+    return datetime.now(timezone(timedelta(hours=7))).strftime('%Y-%m-%d')
+
+
+def build_daily_insights(
+    date: str,
+    device_id: str,
+    daily: Optional[DailyAnalysisResponse]
+) -> DeviceDailyInsights:
+    """
+    Per-user reports of one device from its daily analysis (runs in the threadpool)
+    
+    Crop validations come from the daily analysis (one validator run per
+    distinct current_crop), so adding users adds no inference.
+    """
+    users = load_linked_users(device_id)
+    
+    if daily is None:
+        message = f"📅 Báo cáo ngày {date}: chưa có dữ liệu cảm biến nào trong ngày."
+        return DeviceDailyInsights(
+            device_id=device_id,
+            has_data=False,
+            users=[
+                UserDailyInsight(
+                    user_id=u['id'],
+                    device_id=device_id,
+                    zalo_chat_id=u['zalo_chat_id'],
+                    full_name=u['full_name'],
+                    current_crop=u['current_crop'],
+                    message=message
+                )
+                for u in users
+            ]
+        )
+    
+    ai_result = daily.ai_analysis
+    features = daily.aggregated_data['features']
+    
+    validations = daily.crop_validations
+    logger.info(f"   ✅ {device_id}: {len(users)} users, {len(validations)} crop validations")
+    
+    insights = []
+    for u in users:
+        validation = validations.get(normalize_crop_name(u['current_crop']))
+        insights.append(UserDailyInsight(
+            user_id=u['id'],
+            device_id=device_id,
+            zalo_chat_id=u['zalo_chat_id'],
+            full_name=u['full_name'],
+            current_crop=u['current_crop'],
+            crop_validation=validation,
+            message=format_daily_message(date, u, ai_result, validation)
+        ))
+    
+    summary = {
+        "date": date,
+        "device_id": device_id,
+        "sample_count": daily.aggregated_data['sample_count'],
+        "features": {k: round(v, 2) if isinstance(v, float) else v for k, v in features.items()},
+        "soil_health": ai_result.soil_health.model_dump(),
+        "best_crop": ai_result.crop_recommendation.best_crop,
+        "is_anomaly": ai_result.anomaly_detection.is_anomaly,
+        "recommendations": [rec.message for rec in ai_result.recommendations[:3]]
+    }
+    
+    return DeviceDailyInsights(
+        device_id=device_id,
+        has_data=True,
+        record_id=daily.record_id,
+        summary=summary,
+        users=insights
+    )
+
+
+async def device_daily_insights(
+    date: str,
+    device_id: str,
+    models: ModelRegistry,
+    raise_errors: bool
+) -> DeviceDailyInsights:
+    """Run (or join) one device's analyze-daily and build its users' reports"""
+    try:
+        daily = await analyze_flight.do(
+            ("analyze-daily", date, device_id),
+            run_daily_analysis, date, device_id, models
+        )
+    except HTTPException as e:
+        if e.status_code != 404:
+            if raise_errors:
+                raise
+            logger.error(f"❌ Daily analysis failed for device {device_id}: {e.detail}")
+            return DeviceDailyInsights(device_id=device_id, has_data=False, error=str(e.detail))
+        daily = None  # No readings today: users still get a short notice
+    except Exception as e:
+        if raise_errors:
+            raise
+        # One failing device must not cost every other farm its report
+        logger.error(f"❌ Daily analysis failed for device {device_id}: {e}", exc_info=True)
+        return DeviceDailyInsights(device_id=device_id, has_data=False, error=str(e))
+    
+    return await run_in_threadpool(build_daily_insights, date, device_id, daily)
+
+
+@app.post("/api/ai/analyze-daily-insights", response_model=DailyInsightsResponse, tags=["Daily Aggregation"])
+async def analyze_daily_insights(request: Optional[DailyInsightsInput] = None):
+    """
+    Daily report for every linked user in one call (n8n Zalo workflow)
+    
+    1. Pick the devices: the requested one, or every owned device plus the
+       shared default device
+    2. Per device, run (or join) the day's analyze-daily: aggregate, AI,
+       save, blockchain
+    3. Load each device's users with a zalo_chat_id (devices.user_id: the
+       owner, or for the shared device the users without a device)
+    4. Attach each user's crop validation from their device's analysis
+    5. Return one ready-to-send message per user, and a summary per device
+    
+    Args:
+        request: Optional date/device (empty body = today, every device)
+    
+    Returns:
+        DailyInsightsResponse with per-device summaries and per-user messages
+    """
+    start_time = time.time()
+    request = request or DailyInsightsInput()
+    date = request.date or today_vn()
+    
+    try:
+        models = get_model_registry()
         
-        # 3. Save to daily_insights table
-        record_id = save_daily_insight(request.date, aggregated_data, ai_result)
+        # Lazy load models if not loaded yet
+        if not models.validate_loaded():
+            try:
+                logger.info("🔄 Lazy loading models (first request)...")
+                models.load_all()
+                logger.info("✅ Models loaded successfully!")
+            except Exception as e:
+                logger.error(f"❌ Failed to load models: {e}")
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Models not loaded: {str(e)}"
+                )
         
-        logger.info(f"   ✅ Saved to daily_insights (ID: {record_id})")
+        if request.device_id:
+            device_ids = [request.device_id]
+        else:
+            device_ids = await run_in_threadpool(load_report_devices)
         
-        # 4. Push to blockchain (async, don't block response)
-        blockchain_success, tx_hash, blockchain_status = push_to_blockchain(
-            daily_insight_id=record_id,
-            date=request.date,
-            ai_result=ai_result,
-            sample_count=aggregated_data['sample_count']
-        )
+        logger.info(f"\n📨 Daily insights fan-out for date: {date} (devices: {', '.join(device_ids)})")
         
-        if blockchain_success:
-            logger.info(f"   ✅ Pushed to blockchain successfully (TX: {tx_hash})")
-        else:
-            logger.warning(f"   ⚠️ Blockchain push failed (status: {blockchain_status}, but DB saved)")
+        devices = await asyncio.gather(*(
+            device_daily_insights(date, device_id, models, raise_errors=request.device_id is not None)
+            for device_id in device_ids
+        ))
         
-        return DailyAnalysisResponse(
-            date=request.date,
-            aggregated_data=aggregated_data,
-            ai_analysis=ai_result,
-            saved_to_db=True,
-            record_id=record_id
+        single = devices[0] if len(devices) == 1 else None
+        return DailyInsightsResponse(
+            date=date,
+            device_id=request.device_id,
+            has_data=any(d.has_data for d in devices),
+            record_id=single.record_id if single else None,
+            summary=single.summary if single else None,
+            users=[u for d in devices for u in d.users],
+            devices=devices,
+            processing_time_ms=round((time.time() - start_time) * 1000, 2)
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Daily aggregation error: {e}", exc_info=True)
+        logger.error(f"❌ Daily insights error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
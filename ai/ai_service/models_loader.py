@@ -3,7 +3,7 @@ Model Registry - Load all AI models into memory
 Loads 26 .pkl files:
 - 1 Crop Classifier
 - 1 Soil Health Scorer
-- 22 Crop Validators
+- 22 Crop Validators (on demand, LRU within VALIDATOR_MEMORY_BUDGET_MB)
 - 1 Anomaly Detector
 - 1 Feature Scaler
 - 1 Label Encoder
@@ -13,11 +13,161 @@ import joblib
 import os
 from pathlib import Path
 import json
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Iterable, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Resident size allowed for crop validators (~1.7 MB each); the least
+# recently used ones are evicted beyond it (the one in use always stays)
+VALIDATOR_MEMORY_BUDGET_MB = float(os.getenv('VALIDATOR_MEMORY_BUDGET_MB', '16'))
+
+# Load validators for crops in users.current_crop together with the core models
+VALIDATOR_PRELOAD = os.getenv('VALIDATOR_PRELOAD', 'true').lower() == 'true'
+
+# Load the reduced models chosen by ai_module/reduce_models.py --write
+# (MODELS_PATH/operating_points.json) instead of the original .pkl files
+USE_OPERATING_POINTS = os.getenv('USE_OPERATING_POINTS', 'true').lower() == 'true'
+
+
+def model_nbytes(model: Any, path: Path = None) -> int:
+    """
+    Approximate resident size of a model
+    
+    Tree ensembles: node and value arrays of every tree (what dominates their
+    memory); other models: size of the .pkl file
+    """
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is not None:
+        total = 0
+        for est in estimators:
+            tree = getattr(est, 'tree_', None)
+            if tree is None:
+                continue
+            state = tree.__getstate__()
+            total += state['nodes'].nbytes + state['values'].nbytes
+        if total:
+            return total
+    return path.stat().st_size if path is not None and path.exists() else 0
+
+
+class LazyValidatorStore:
+    """
+    Dict-like view of the crop validators that loads them on first use
+    
+    `crop in store`, `store.keys()` and `len(store)` cover every available
+    crop (model_list.json); `store[crop]` loads the validator if needed and
+    evicts least recently used ones while over the memory budget.
+    
+    Disk loads run outside the store lock (one at a time per crop), so hits
+    for other crops and info() never wait for a cold load.
+    """
+    
+    def __init__(self, validators_dir: Path, budget_bytes: int):
+        self.validators_dir = validators_dir
+        self.budget_bytes = budget_bytes
+        self.crops: list = []
+        self.paths: Dict[str, Path] = {}  # crop -> reduced model (operating points)
+        self._resident: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def set_crops(self, crops: Iterable[str]) -> None:
+        self.crops = list(crops)
+    
+    def __contains__(self, crop) -> bool:
+        return crop in self.crops
+    
+    def __len__(self) -> int:
+        return len(self.crops)
+    
+    def __iter__(self):
+        return iter(self.crops)
+    
+    def keys(self) -> list:
+        return list(self.crops)
+    
+    def __getitem__(self, crop: str) -> Any:
+        if crop not in self.crops:
+            raise KeyError(crop)
+        model = self._get_resident(crop)
+        if model is not None:
+            return model
+        
+        with self._lock:
+            load_lock = self._load_locks.setdefault(crop, threading.Lock())
+        with load_lock:
+            # Loaded by another request while this one waited
+            model = self._get_resident(crop)
+            if model is not None:
+                return model
+            
+            path = self.path_for(crop)
+            model = joblib.load(path)
+            size = model_nbytes(model, path)
+            with self._lock:
+                self.misses += 1
+                self._resident[crop] = model
+                self._sizes[crop] = size
+                self._evict_locked(keep=crop)
+                resident = len(self._resident)
+        logger.info(f"   📦 Loaded {crop} validator ({size / 1e6:.1f} MB, {resident} resident)")
+        return model
+    
+    def _get_resident(self, crop: str) -> Any:
+        with self._lock:
+            model = self._resident.get(crop)
+            if model is not None:
+                self.hits += 1
+                self._resident.move_to_end(crop)
+            return model
+    
+    def path_for(self, crop: str) -> Path:
+        return self.paths.get(crop) or self.validators_dir / f'{crop}_validator.pkl'
+    
+    def _evict_locked(self, keep: str) -> None:
+        while self.resident_bytes() > self.budget_bytes and len(self._resident) > 1:
+            crop = next(c for c in self._resident if c != keep)
+            del self._resident[crop]
+            self.evictions += 1
+            logger.info(f"   ♻️  Evicted {crop} validator (LRU)")
+    
+    def preload(self, crops: Iterable[str]) -> list:
+        """Load validators for the given crops (unknown names ignored)"""
+        loaded = []
+        for crop in crops:
+            if crop in self.crops:
+                self[crop]
+                loaded.append(crop)
+        return loaded
+    
+    def resident_bytes(self) -> int:
+        return sum(self._sizes[c] for c in self._resident)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._resident.clear()
+    
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "available": len(self.crops),
+                "resident": list(self._resident),
+                "resident_bytes": self.resident_bytes(),
+                "budget_bytes": self.budget_bytes,
+                "model_bytes": {c: self._sizes[c] for c in self._resident},
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
 
 class ModelRegistry:
     """
@@ -37,7 +187,6 @@ class ModelRegistry:
             
         self.crop_classifier = None
         self.soil_health_scorer = None
-        self.crop_validators: Dict[str, Any] = {}
         self.anomaly_detector = None
         self.feature_scaler = None
         self.label_encoder = None
@@ -50,6 +199,16 @@ class ModelRegistry:
         self.scaler_path = Path(os.getenv('SCALER_PATH', str(project_root / 'ai_module' / 'data' / 'feature_scaler.pkl')))
         self.encoder_path = Path(os.getenv('ENCODER_PATH', str(project_root / 'ai_module' / 'data' / 'label_encoder.pkl')))
         
+        self.crop_validators = LazyValidatorStore(
+            self.models_path / 'crop_validators',
+            int(VALIDATOR_MEMORY_BUDGET_MB * 1024 * 1024)
+        )
+        self.model_sizes: Dict[str, int] = {}
+        self.operating_points: Dict[str, dict] = {}
+        
+        # Returns crop names to preload (users.current_crop); set by the app
+        self.preload_source: Optional[Callable[[], Iterable[str]]] = None
+        
         self._initialized = True
         self._loaded = False
     
@@ -66,6 +225,8 @@ class ModelRegistry:
         logger.info("=" * 80)
         
         try:
+            self.operating_points = self._read_operating_points()
+            
             # 1. Load Feature Scaler
             logger.info(f"📦 Loading feature scaler from {self.scaler_path}...")
             self.feature_scaler = joblib.load(self.scaler_path)
@@ -77,43 +238,61 @@ class ModelRegistry:
             logger.info(f"   ✅ Label encoder loaded ({len(self.label_encoder.classes_)} classes)")
             
             # 3. Load Crop Classifier
-            classifier_path = self.models_path / 'crop_classifier.pkl'
+            classifier_path = self._model_path('crop_classifier', 'crop_classifier.pkl')
             logger.info(f"📦 Loading crop classifier from {classifier_path}...")
             self.crop_classifier = joblib.load(classifier_path)
             logger.info("   ✅ Crop classifier loaded")
             
             # 4. Load Soil Health Scorer
-            scorer_path = self.models_path / 'soil_health_scorer.pkl'
+            scorer_path = self._model_path('soil_health_scorer', 'soil_health_scorer.pkl')
             logger.info(f"📦 Loading soil health scorer from {scorer_path}...")
             self.soil_health_scorer = joblib.load(scorer_path)
             logger.info("   ✅ Soil health scorer loaded")
             
             # 5. Load Anomaly Detector
-            anomaly_path = self.models_path / 'anomaly_detector.pkl'
+            anomaly_path = self._model_path('anomaly_detector', 'anomaly_detector.pkl')
             logger.info(f"📦 Loading anomaly detector from {anomaly_path}...")
             self.anomaly_detector = joblib.load(anomaly_path)
             logger.info("   ✅ Anomaly detector loaded")
             
-            # 6. Load 22 Crop Validators
+            # 6. Register Crop Validators (loaded on first use)
             validators_dir = self.models_path / 'crop_validators'
             model_list_path = validators_dir / 'model_list.json'
             
-            logger.info(f"📦 Loading crop validators from {validators_dir}...")
+            logger.info(f"📦 Registering crop validators from {validators_dir}...")
             
             # Read model list
             with open(model_list_path, 'r') as f:
                 model_list = json.load(f)
             
             crop_names = model_list['crops']
-            logger.info(f"   Found {len(crop_names)} crop validators to load...")
+            self.crop_validators.paths = {
+                c: self._model_path(f'crop_validators/{c}', f'crop_validators/{c}_validator.pkl')
+                for c in crop_names
+                if f'crop_validators/{c}' in self.operating_points
+            }
+            missing = [c for c in crop_names if not self.crop_validators.path_for(c).exists()]
+            if missing:
+                raise FileNotFoundError(f"Crop validators missing: {missing}")
             
-            for i, crop in enumerate(crop_names, 1):
-                validator_path = validators_dir / f'{crop}_validator.pkl'
-                self.crop_validators[crop] = joblib.load(validator_path)
-                if i % 5 == 0 or i == len(crop_names):
-                    logger.info(f"   ✅ Loaded {i}/{len(crop_names)} validators...")
+            self.crop_validators.set_crops(crop_names)
+            logger.info(f"   ✅ {len(crop_names)} crop validators available "
+                        f"(budget {VALIDATOR_MEMORY_BUDGET_MB:.0f} MB)")
             
-            logger.info(f"   ✅ All {len(crop_names)} crop validators loaded")
+            for name, path in (
+                ('crop_classifier', classifier_path),
+                ('soil_health_scorer', scorer_path),
+                ('anomaly_detector', anomaly_path),
+            ):
+                self.model_sizes[name] = model_nbytes(getattr(self, name), path)
+            
+            # Validators for crops that users actually grow
+            if VALIDATOR_PRELOAD and self.preload_source is not None:
+                try:
+                    preloaded = self.crop_validators.preload(self.preload_source())
+                    logger.info(f"   ✅ Preloaded validators: {preloaded or 'none'}")
+                except Exception as e:
+                    logger.warning(f"   ⚠️ Validator preload skipped: {e}")
             
             # Mark as loaded
             self._loaded = True
@@ -124,10 +303,10 @@ class ModelRegistry:
             logger.info(f"   • Crop Classifier: ✅")
             logger.info(f"   • Soil Health Scorer: ✅")
             logger.info(f"   • Anomaly Detector: ✅")
-            logger.info(f"   • Crop Validators: ✅ ({len(self.crop_validators)} models)")
+            logger.info(f"   • Crop Validators: ✅ ({len(self.crop_validators)} available, on demand)")
             logger.info(f"   • Feature Scaler: ✅")
             logger.info(f"   • Label Encoder: ✅")
-            logger.info(f"\n   TOTAL: 26 files loaded into memory")
+            logger.info(f"\n   TOTAL: 5 files loaded, {len(self.crop_validators)} validators on demand")
             logger.info("=" * 80 + "\n")
             
         except FileNotFoundError as e:
@@ -137,6 +316,28 @@ class ModelRegistry:
             logger.error(f"❌ Error loading models: {e}")
             raise
     
+    def load_anomaly_models(self) -> None:
+        """Load only the feature scaler and anomaly detector (bulk rescoring jobs)"""
+        self.operating_points = self._read_operating_points()
+        self.feature_scaler = joblib.load(self.scaler_path)
+        self.anomaly_detector = joblib.load(self._model_path('anomaly_detector', 'anomaly_detector.pkl'))
+    
+    def _read_operating_points(self) -> Dict[str, dict]:
+        """Reduced models recorded by reduce_models.py --write (key -> entry)"""
+        path = self.models_path / 'operating_points.json'
+        if not USE_OPERATING_POINTS or not path.exists():
+            return {}
+        with open(path, 'r') as f:
+            points = json.load(f).get('models', {})
+        logger.info("📐 Operating points: " + ", ".join(
+            f"{key} ({entry['variant']})" for key, entry in points.items()
+        ))
+        return points
+    
+    def _model_path(self, key: str, default_file: str) -> Path:
+        entry = self.operating_points.get(key)
+        return self.models_path / (entry['file'] if entry else default_file)
+    
     def get_crop_names(self) -> list:
         """Get list of all crop names"""
         if self.label_encoder is None:
@@ -152,6 +353,9 @@ class ModelRegistry:
             "soil_health_scorer": self.soil_health_scorer is not None,
             "anomaly_detector": self.anomaly_detector is not None,
             "crop_validators_count": len(self.crop_validators),
+            "crop_validators": self.crop_validators.info(),
+            "model_bytes": dict(self.model_sizes),
+            "operating_points": {key: entry['variant'] for key, entry in self.operating_points.items()},
             "feature_scaler": self.feature_scaler is not None,
             "label_encoder": self.label_encoder is not None,
             "available_crops": self.get_crop_names() if self.label_encoder else []
@@ -163,7 +367,7 @@ class ModelRegistry:
             self.crop_classifier is not None,
             self.soil_health_scorer is not None,
             self.anomaly_detector is not None,
-            len(self.crop_validators) == 22,
+            len(self.crop_validators) > 0,
             self.feature_scaler is not None,
             self.label_encoder is not None
         ])
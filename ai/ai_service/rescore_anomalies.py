@@ -0,0 +1,327 @@
+"""
+Anomaly Rescoring - Score every historical sensor reading with Model 4
+/api/ai/analyze-daily only scores daily averages; this job writes one
+ai_analysis row per raw reading (analysis_type 'anomaly-rescore') with the
+IsolationForest result in anomaly_detection (migration 017)
+
+Readings are split into fixed id ranges of --range-size ids. Each range is
+read in chunks of --chunk-size rows (keyset on id), scaled and scored in one
+vectorized score_samples call per chunk, and bulk-inserted together with the
+range's high-water mark in one transaction, so an interrupted run resumes
+after its last committed chunk. Ranges are independent: --workers N scores
+N of them in parallel processes, and separate hosts can take disjoint
+--from-id/--to-id slices (rounded out to range boundaries).
+
+--fill-flags instead writes sensor_readings.anomaly_score / is_anomaly
+(migration 018) for readings the ingest-time stream left NULL (stream
+disabled, dropped under load, or failed after its retries). It reads only
+NULL rows and updates them in one statement per chunk, so it needs no
+progress rows: a rerun skips whatever an earlier run already filled.
+
+    python rescore_anomalies.py
+    python rescore_anomalies.py --workers 4 --chunk-size 20000
+    python rescore_anomalies.py --from-id 0 --to-id 5000000 --model-version 1.1
+    python rescore_anomalies.py --fill-flags --workers 4
+"""
+
+import argparse
+import logging
+import time
+from multiprocessing import Pool
+from typing import Optional
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from daily_aggregator import get_db_conn
+from models_loader import get_model_registry
+from serialization import dumps
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ANALYSIS_TYPE = 'anomaly-rescore'
+
+# Same order as inference.preprocess_soil_data
+FEATURE_COLUMNS = (
+    'soil_temperature_c',
+    'soil_moisture_pct',
+    'conductivity_us_cm',
+    'ph_value',
+    'nitrogen_mg_kg',
+    'phosphorus_mg_kg',
+    'potassium_mg_kg',
+    'salt_mg_l',
+    'air_temperature_c',
+    'air_humidity_pct',
+    'is_raining::int',
+)
+
+SELECT_CHUNK_SQL = f"""
+    SELECT id, {', '.join(FEATURE_COLUMNS)}
+    FROM sensor_readings
+    WHERE id > %s AND id < %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+INSERT_RESULTS_SQL = f"""
+    INSERT INTO ai_analysis (sensor_reading_id, analysis_type, analysis_mode, anomaly_detection, model_version)
+    VALUES %s
+    ON CONFLICT (sensor_reading_id, model_version) WHERE analysis_type = '{ANALYSIS_TYPE}' DO NOTHING
+"""
+
+
+SELECT_UNFLAGGED_SQL = f"""
+    SELECT id, measured_at_vn, {', '.join(FEATURE_COLUMNS)}
+    FROM sensor_readings
+    WHERE id > %s AND id < %s AND anomaly_score IS NULL
+    ORDER BY id
+    LIMIT %s
+"""
+
+# measured_at bounds let Postgres prune sensor_readings partitions
+# (same as anomaly_stream.FLAG_READINGS_SQL)
+FILL_FLAGS_SQL = """
+    UPDATE sensor_readings AS s
+    SET anomaly_score = v.score, is_anomaly = v.flag
+    FROM (VALUES %s) AS v(id, score, flag)
+    WHERE s.id = v.id
+      AND s.anomaly_score IS NULL
+      AND s.measured_at_vn BETWEEN {bounds}
+"""
+
+
+def score_chunk(rows: list, models) -> tuple:
+    """
+    Anomaly results for a chunk of (id, 11 features) rows
+
+    Returns:
+        (ids, scores, flags) for the rows with all 11 features present
+    """
+    data = np.array(rows, dtype=float)  # NULL -> nan
+    complete = ~np.isnan(data[:, 1:]).any(axis=1)
+    ids = data[complete, 0].astype(np.int64)
+    if not len(ids):
+        return ids, np.empty(0), np.empty(0, dtype=bool)
+
+    X_scaled = models.feature_scaler.transform(data[complete, 1:])
+    scores = models.anomaly_detector.score_samples(X_scaled)
+    # IsolationForest.predict: -1 where score_samples - offset_ < 0
+    flags = scores < models.anomaly_detector.offset_
+    return ids, scores, flags
+
+
+def result_rows(ids, scores, flags, model_version: str) -> list:
+    return [
+        (
+            int(reading_id), ANALYSIS_TYPE, 'anomaly',
+            dumps({
+                "is_anomaly": bool(flag),
+                "anomaly_score": round(float(score), 6),
+                "status": "🚨 ANOMALY" if flag else "✅ NORMAL",
+            }).decode(),
+            model_version,
+        )
+        for reading_id, score, flag in zip(ids, scores, flags)
+    ]
+
+
+def start_range(cur, model_version: str, range_start: int, range_end: int, reset: bool) -> int:
+    """High-water mark to resume the range from (range_start - 1 when new)"""
+    if reset:
+        cur.execute("""
+            DELETE FROM anomaly_rescore_progress
+            WHERE model_version = %s AND range_start = %s AND range_end = %s
+        """, (model_version, range_start, range_end))
+    cur.execute("""
+        INSERT INTO anomaly_rescore_progress (model_version, range_start, range_end, high_water_mark)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (model_version, range_start, range_end) DO NOTHING
+    """, (model_version, range_start, range_end, range_start - 1))
+    cur.execute("""
+        SELECT high_water_mark FROM anomaly_rescore_progress
+        WHERE model_version = %s AND range_start = %s AND range_end = %s
+    """, (model_version, range_start, range_end))
+    return cur.fetchone()[0]
+
+
+def rescore_range(range_start: int, range_end: int, chunk_size: int, model_version: str, reset: bool = False) -> dict:
+    """Score readings with range_start <= id < range_end, resuming after the high-water mark"""
+    models = get_model_registry()
+    if models.anomaly_detector is None:
+        models.load_anomaly_models()
+
+    scored = anomalies = 0
+    high_water_mark = range_start - 1
+    start_time = time.time()
+
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            high_water_mark = start_range(cur, model_version, range_start, range_end, reset)
+            conn.commit()
+
+            while True:
+                cur.execute(SELECT_CHUNK_SQL, (high_water_mark, range_end, chunk_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+
+                ids, scores, flags = score_chunk(rows, models)
+                if len(ids):
+                    execute_values(cur, INSERT_RESULTS_SQL, result_rows(ids, scores, flags, model_version), page_size=1000)
+
+                high_water_mark = rows[-1][0]
+                cur.execute("""
+                    UPDATE anomaly_rescore_progress
+                    SET high_water_mark = %s,
+                        rows_scored = rows_scored + %s,
+                        anomalies = anomalies + %s,
+                        updated_at = NOW()
+                    WHERE model_version = %s AND range_start = %s AND range_end = %s
+                """, (high_water_mark, len(ids), int(flags.sum()), model_version, range_start, range_end))
+                conn.commit()
+
+                scored += len(ids)
+                anomalies += int(flags.sum())
+
+        elapsed = time.time() - start_time
+        if scored:
+            logger.info(f"✅ ids [{range_start}, {range_end}): {scored} readings, {anomalies} anomalies "
+                        f"({scored / max(elapsed, 1e-9):.0f} rows/s)")
+        return {"range_start": range_start, "range_end": range_end, "scored": scored, "anomalies": anomalies}
+
+    except Exception:
+        conn.rollback()
+        logger.exception(f"❌ Rescoring ids [{range_start}, {range_end}) stopped at {high_water_mark}")
+        raise
+    finally:
+        conn.close()
+
+
+def fill_flags_range(range_start: int, range_end: int, chunk_size: int) -> dict:
+    """Fill NULL anomaly flags of readings with range_start <= id < range_end"""
+    models = get_model_registry()
+    if models.anomaly_detector is None:
+        models.load_anomaly_models()
+
+    scored = anomalies = 0
+    last_id = range_start - 1
+    start_time = time.time()
+
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute(SELECT_UNFLAGGED_SQL, (last_id, range_end, chunk_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+
+                # Rows with a missing feature stay NULL (the stream skips them too)
+                ids, scores, flags = score_chunk([(r[0],) + r[2:] for r in rows], models)
+                if len(ids):
+                    times = [r[1] for r in rows]
+                    bounds = cur.mogrify("%s AND %s", (min(times), max(times))).decode()
+                    execute_values(
+                        cur, FILL_FLAGS_SQL.format(bounds=bounds),
+                        [(int(i), float(s), bool(f)) for i, s, f in zip(ids, scores, flags)],
+                        page_size=len(ids),
+                    )
+                conn.commit()
+
+                last_id = rows[-1][0]
+                scored += len(ids)
+                anomalies += int(flags.sum())
+
+        elapsed = time.time() - start_time
+        if scored:
+            logger.info(f"✅ ids [{range_start}, {range_end}): {scored} flags filled, {anomalies} anomalies "
+                        f"({scored / max(elapsed, 1e-9):.0f} rows/s)")
+        return {"range_start": range_start, "range_end": range_end, "scored": scored, "anomalies": anomalies}
+
+    except Exception:
+        conn.rollback()
+        logger.exception(f"❌ Filling flags for ids [{range_start}, {range_end}) stopped at {last_id}")
+        raise
+    finally:
+        conn.close()
+
+
+def id_ranges(from_id: int, to_id: int, range_size: int) -> list:
+    """
+    Ranges of range_size ids covering [from_id, to_id), aligned to multiples
+    of range_size so their progress rows match across runs (the last range
+    keeps its key while new readings arrive)
+    """
+    first = from_id - from_id % range_size
+    return [(start, start + range_size) for start in range(first, to_id, range_size)]
+
+
+def reading_id_bounds() -> Optional[tuple]:
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MIN(id), MAX(id) FROM sensor_readings")
+            low, high = cur.fetchone()
+            return None if low is None else (low, high + 1)
+    finally:
+        conn.close()
+
+
+def _rescore(task: tuple) -> dict:
+    return rescore_range(*task)
+
+
+def _fill_flags(task: tuple) -> dict:
+    return fill_flags_range(*task)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from-id', type=int, help='first sensor_readings.id (default: lowest)')
+    parser.add_argument('--to-id', type=int, help='end of the id slice, exclusive (default: highest + 1)')
+    parser.add_argument('--range-size', type=int, default=1_000_000)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--model-version', default='1.0')
+    parser.add_argument('--reset', action='store_true', help='ignore saved progress and rescan the ranges')
+    parser.add_argument('--fill-flags', action='store_true',
+                        help='fill NULL sensor_readings.anomaly_score / is_anomaly instead of writing ai_analysis rows')
+    args = parser.parse_args()
+
+    bounds = reading_id_bounds()
+    if bounds is None:
+        logger.info("ℹ️ sensor_readings is empty")
+        return
+
+    from_id = args.from_id if args.from_id is not None else bounds[0]
+    to_id = args.to_id if args.to_id is not None else bounds[1]
+    ranges = id_ranges(from_id, to_id, args.range_size)
+    if args.fill_flags:
+        run = _fill_flags
+        tasks = [(start, end, args.chunk_size) for start, end in ranges]
+        logger.info(f"🔎 Filling NULL anomaly flags for ids [{from_id}, {to_id}) in {len(tasks)} ranges "
+                    f"with {args.workers} worker(s)")
+    else:
+        run = _rescore
+        tasks = [(start, end, args.chunk_size, args.model_version, args.reset) for start, end in ranges]
+        logger.info(f"🔎 Rescoring ids [{from_id}, {to_id}) in {len(tasks)} ranges "
+                    f"with {args.workers} worker(s), model version {args.model_version}")
+
+    start_time = time.time()
+    if args.workers > 1:
+        with Pool(args.workers) as pool:
+            results = list(pool.imap_unordered(run, tasks))
+    else:
+        results = [run(task) for task in tasks]
+
+    scored = sum(r['scored'] for r in results)
+    anomalies = sum(r['anomalies'] for r in results)
+    elapsed = time.time() - start_time
+    logger.info(f"✅ Done: {scored} readings scored, {anomalies} anomalies in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
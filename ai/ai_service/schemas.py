@@ -4,7 +4,7 @@ Request/Response models
 """
 
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 
@@ -173,6 +173,7 @@ class HealthCheckResponse(BaseModel):
 class DailyAggregateInput(BaseModel):
     """Input for daily aggregation analysis"""
     date: str = Field(..., description="Date in YYYY-MM-DD format")
+    device_id: str = Field("default", description="Device whose readings are aggregated", max_length=64)
     
     @validator('date')
     def validate_date(cls, v):
@@ -186,8 +187,66 @@ class DailyAggregateInput(BaseModel):
 class DailyAnalysisResponse(BaseModel):
     """Response for daily aggregation analysis"""
     date: str
+    device_id: str = "default"
     aggregated_data: dict
     ai_analysis: AIAnalysisResponse
     saved_to_db: bool
     record_id: Optional[int] = None
+    crop_validations: Dict[str, CropValidation] = {}  # users' current crops, by crop
 
+
+
+class DailyInsightsInput(BaseModel):
+    """Input for the multi-user daily report (n8n schedule; empty body = today, every device)"""
+    date: Optional[str] = Field(None, description="Date in YYYY-MM-DD format (default: today, Vietnam time)")
+    device_id: Optional[str] = Field(
+        None,
+        description="Device whose readings are aggregated (default: every owned device plus the shared default device)",
+        max_length=64
+    )
+    
+    @validator('date')
+    def validate_date(cls, v):
+        if v is None:
+            return v
+        try:
+            datetime.strptime(v, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError('date must be in YYYY-MM-DD format')
+        return v
+
+
+class UserDailyInsight(BaseModel):
+    """One farmer's daily report, ready to send to Zalo"""
+    user_id: int
+    device_id: str = "default"
+    zalo_chat_id: str
+    full_name: Optional[str] = None
+    current_crop: Optional[str] = None
+    crop_validation: Optional[CropValidation] = None
+    message: str
+
+
+class DeviceDailyInsights(BaseModel):
+    """Daily reports for one device's linked users from one aggregate and one model pass"""
+    device_id: str
+    has_data: bool
+    record_id: Optional[int] = None
+    summary: Optional[dict] = None  # compact day summary (input for the LLM report)
+    users: List[UserDailyInsight] = []
+    error: Optional[str] = None  # analysis failed: no reports for this device
+
+
+class DailyInsightsResponse(BaseModel):
+    """
+    Daily reports for one or every device; users holds all devices' reports.
+    record_id/summary are set when a single device was reported.
+    """
+    date: str
+    device_id: Optional[str] = None
+    has_data: bool
+    record_id: Optional[int] = None
+    summary: Optional[dict] = None
+    users: List[UserDailyInsight] = []
+    devices: List[DeviceDailyInsights] = []
+    processing_time_ms: float
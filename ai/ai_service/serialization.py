@@ -0,0 +1,33 @@
+"""
+Serialization - orjson response class for the AI service
+Used as FastAPI's default_response_class so analysis results (including
+NumPy scalars/arrays from inference) are encoded by orjson
+"""
+
+import decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    # Types orjson does not handle natively
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
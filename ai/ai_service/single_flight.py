@@ -0,0 +1,40 @@
+"""
+Single Flight - Share one in-flight computation between identical requests
+Concurrent requests with the same key (same date for analyze-daily, same
+feature vector for analyze) await one task that runs the blocking work in
+the threadpool, instead of each repeating aggregate + inference + upsert +
+blockchain push
+
+The task is shielded: a caller that disconnects does not cancel the work
+for the others. Results are not cached once the task finishes.
+"""
+
+import asyncio
+from typing import Any, Callable, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self._tasks: dict = {}
+        self.started_total = 0
+        self.shared_total = 0
+
+    async def do(self, key: Hashable, func: Callable, *args) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(func, *args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self.started_total += 1
+        else:
+            self.shared_total += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._tasks),
+            "started_total": self.started_total,
+            "shared_total": self.shared_total,
+        }
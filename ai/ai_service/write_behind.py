@@ -0,0 +1,198 @@
+"""
+Write-Behind - Persist /api/ai/analyze results to ai_analysis off the request path
+The endpoint only appends the result to an in-memory buffer; a background
+thread writes the buffer with multi-row INSERTs when it holds
+WRITE_BEHIND_BATCH_SIZE results or every WRITE_BEHIND_FLUSH_SECONDS,
+and once more on shutdown (lifespan)
+
+Memory is bounded by WRITE_BEHIND_MAX_ITEMS: beyond it new results are
+dropped (counted). Above 80% of it the flusher is woken immediately instead
+of waiting for the interval (counted as backpressure). A failed flush puts
+its batch back in front of the buffer; the next attempt waits a full
+interval, whatever is submitted meanwhile.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from psycopg2.extras import execute_values
+
+from daily_aggregator import get_db_conn
+from schemas import AIAnalysisResponse
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'true').lower() == 'true'
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '200'))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv('WRITE_BEHIND_FLUSH_SECONDS', '2'))
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv('WRITE_BEHIND_MAX_ITEMS', '10000'))
+
+HIGH_WATERMARK = 0.8
+
+INSERT_ANALYSIS_SQL = """
+    INSERT INTO ai_analysis (
+        analysis_type, analysis_mode, analyzed_at_vn, user_crop,
+        crop_recommendation, crop_validation, soil_health, anomaly_detection,
+        confidence_avg, processing_time_ms
+    ) VALUES %s
+"""
+
+
+def _json(model) -> Optional[str]:
+    return dumps(model).decode() if model is not None else None
+
+
+def analysis_row(result: AIAnalysisResponse, analysis_type: str) -> tuple:
+    return (
+        analysis_type,
+        result.mode,
+        result.timestamp,
+        result.crop_validation.crop if result.crop_validation else None,
+        _json(result.crop_recommendation),
+        _json(result.crop_validation),
+        _json(result.soil_health),
+        _json(result.anomaly_detection),
+        result.crop_recommendation.confidence,
+        int(round(result.processing_time_ms)),
+    )
+
+
+class AnalysisWriteBehind:
+    def __init__(
+        self,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_seconds: float = WRITE_BEHIND_FLUSH_SECONDS,
+        max_items: int = WRITE_BEHIND_MAX_ITEMS,
+        enabled: bool = WRITE_BEHIND_ENABLED
+    ):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_items = max_items
+        self.enabled = enabled
+
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        self._retry_at: Optional[float] = None  # set after a failed flush
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.backpressure = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="ai-analysis-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, result: AIAnalysisResponse, analysis_type: str = 'on-demand') -> bool:
+        """Queue a result for ai_analysis; False when it was dropped (never blocks)"""
+        if not self.enabled:
+            return False
+        row = analysis_row(result, analysis_type)
+        with self._cond:
+            if len(self._buffer) >= self.max_items:
+                self.dropped += 1
+                return False
+            self._buffer.append(row)
+            self.submitted += 1
+            if len(self._buffer) >= self.max_items * HIGH_WATERMARK:
+                self.backpressure += 1
+                if self._retry_at is None:
+                    self._cond.notify()
+            elif len(self._buffer) >= self.batch_size and self._retry_at is None:
+                self._cond.notify()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._retry_at is not None:
+                    # After a failed flush, retry only once the deadline
+                    # passed (only close() ends the wait early)
+                    while not self._closing:
+                        remaining = self._retry_at - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                elif len(self._buffer) < self.batch_size and not self._closing:
+                    self._cond.wait(self.flush_seconds)
+                if self._closing:
+                    return
+            ok = self.flush()
+            with self._cond:
+                self._retry_at = None if ok else time.monotonic() + self.flush_seconds
+
+    def flush(self) -> bool:
+        """Write everything buffered (in batches); False when a batch failed"""
+        while True:
+            with self._cond:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            if not batch:
+                return True
+            if not self._write(batch):
+                return False
+
+    def _write(self, batch: list) -> bool:
+        start = time.perf_counter()
+        try:
+            conn = get_db_conn()
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, INSERT_ANALYSIS_SQL, batch, page_size=len(batch))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            with self._cond:
+                self.failed_flushes += 1
+                # Back in front, oldest first; whatever no longer fits is dropped
+                room = max(self.max_items - len(self._buffer), 0)
+                kept = batch[:room]
+                self._buffer.extendleft(reversed(kept))
+                self.dropped += len(batch) - len(kept)
+            logger.warning(f"⚠️ ai_analysis write-behind flush failed ({len(batch)} rows): {e}")
+            return False
+
+        with self._cond:
+            self.written += len(batch)
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop the flusher thread and write what is left (called from lifespan)"""
+        if self._thread is not None:
+            with self._cond:
+                self._closing = True
+                self._cond.notify()
+            self._thread.join(timeout)
+            self._thread = None
+        if not self.flush():
+            logger.warning(f"⚠️ Write-behind: {len(self._buffer)} analysis results not written on shutdown")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "buffered": len(self._buffer),
+                "max_items": self.max_items,
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "backpressure": self.backpressure,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+            }
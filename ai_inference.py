@@ -0,0 +1,67 @@
+"""
+AI Inference - In-process AI analysis for the ingest server
+With AI_INFERENCE_MODE=inprocess, analyze_date calls the AI service's
+embedded facade (ai/ai_service/embedded.py) directly instead of POSTing
+the daily aggregate to AI_SERVICE_URL; the models are loaded once per
+worker process (≈ the AI service's memory footprint, per worker)
+
+    AI_INFERENCE_MODE=http        POST to AI_SERVICE_URL (default)
+    AI_INFERENCE_MODE=inprocess   ai/ai_service models in this process
+
+Needs the AI service's requirements (scikit-learn, pandas, pydantic) in
+this environment.
+"""
+
+from pathlib import Path
+import importlib
+import os
+import sys
+import threading
+
+AI_INFERENCE_MODE = os.getenv('AI_INFERENCE_MODE', 'http').lower()
+
+AI_SERVICE_DIR = Path(os.getenv('AI_SERVICE_DIR', str(Path(__file__).parent / 'ai' / 'ai_service')))
+
+_embedded = None
+_anomaly_models = None
+_import_lock = threading.Lock()
+
+
+def in_process_enabled() -> bool:
+    return AI_INFERENCE_MODE == 'inprocess'
+
+
+def _import_ai_service(name: str):
+    # ai_service modules import each other by bare name
+    # (schemas, models_loader); appended so ours take precedence
+    if str(AI_SERVICE_DIR) not in sys.path:
+        sys.path.append(str(AI_SERVICE_DIR))
+    return importlib.import_module(name)
+
+
+def embedded():
+    """The AI service's embedded module, imported on first use"""
+    global _embedded
+    if _embedded is None:
+        with _import_lock:
+            if _embedded is None:
+                _embedded = _import_ai_service('embedded')
+    return _embedded
+
+
+def anomaly_models():
+    """Model registry with only the feature scaler and anomaly detector loaded"""
+    global _anomaly_models
+    if _anomaly_models is None:
+        with _import_lock:
+            if _anomaly_models is None:
+                models = _import_ai_service('models_loader').get_model_registry()
+                if models.anomaly_detector is None:
+                    models.load_anomaly_models()
+                _anomaly_models = models
+    return _anomaly_models
+
+
+def analyze(payload: dict) -> dict:
+    """Same result as POST AI_SERVICE_URL with payload (see embedded.analyze)"""
+    return embedded().analyze(payload)
@@ -0,0 +1,205 @@
+"""
+Anomaly Stream - Score raw readings with the anomaly detector shortly after ingest
+Both ingest servers (app_ingest.py, ingest_asgi.py) hand every inserted
+reading, including spool replays, to an in-memory micro-batch; a
+background thread scores a batch once it holds ANOMALY_BATCH_SIZE readings
+or its oldest reading has waited ANOMALY_BATCH_MS, with one vectorized
+scaler + IsolationForest.score_samples call, and writes anomaly_score /
+is_anomaly back to sensor_readings in one UPDATE (migration 018)
+
+The POST never waits for the model. A batch that fails to score or write is
+retried ANOMALY_RETRY_ATTEMPTS times with a growing pause. The buffer is
+bounded by ANOMALY_MAX_PENDING; readings beyond it (dropped) or in a batch
+that exhausted its retries (failed) keep NULL flags until
+`python rescore_anomalies.py --fill-flags` (ai/ai_service) scores them. Needs
+the AI service's model requirements (scikit-learn) in this environment, see
+ai_inference.py.
+"""
+
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+ANOMALY_STREAM_ENABLED = os.getenv("ANOMALY_STREAM_ENABLED", "false").lower() == "true"
+
+# Score when this many readings are pending, or when the oldest waited this long
+ANOMALY_BATCH_SIZE = int(os.getenv("ANOMALY_BATCH_SIZE", "256"))
+ANOMALY_BATCH_MS = float(os.getenv("ANOMALY_BATCH_MS", "500"))
+
+ANOMALY_MAX_PENDING = int(os.getenv("ANOMALY_MAX_PENDING", "20000"))
+
+# Attempts per batch; the pause before attempt n is n - 1 backoffs
+ANOMALY_RETRY_ATTEMPTS = int(os.getenv("ANOMALY_RETRY_ATTEMPTS", "3"))
+ANOMALY_RETRY_BACKOFF_MS = float(os.getenv("ANOMALY_RETRY_BACKOFF_MS", "1000"))
+
+# Model input order (ai/ai_service/inference.py preprocess_soil_data)
+FEATURE_COLUMNS = (
+    "soil_temperature_c", "soil_moisture_pct",
+    "conductivity_us_cm", "ph_value",
+    "nitrogen_mg_kg", "phosphorus_mg_kg", "potassium_mg_kg", "salt_mg_l",
+    "air_temperature_c", "air_humidity_pct", "is_raining",
+)
+
+# measured_at bounds let Postgres prune sensor_readings partitions
+FLAG_READINGS_SQL = """
+    UPDATE sensor_readings AS s
+    SET anomaly_score = v.score, is_anomaly = v.flag
+    FROM (VALUES %s) AS v(device_id, measured_at_vn, score, flag)
+    WHERE s.device_id = v.device_id
+      AND s.measured_at_vn = v.measured_at_vn::timestamp
+      AND s.measured_at_vn BETWEEN {bounds}
+"""
+
+
+def feature_row(reading: dict) -> list:
+    return [float(reading[c]) for c in FEATURE_COLUMNS]
+
+
+class AnomalyStream:
+    """
+    Micro-batching anomaly scorer
+
+    load_models() must return an object with feature_scaler and
+    anomaly_detector (ai_inference.anomaly_models); get_conn() a new
+    psycopg2 connection.
+    """
+
+    def __init__(self, load_models, get_conn):
+        self.load_models = load_models
+        self.get_conn = get_conn
+
+        self._pending: deque = deque()  # (enqueued_at, device_id, measured_at_vn, features)
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self.scored_total = 0
+        self.anomalies_total = 0
+        self.dropped_total = 0
+        self.failed_total = 0
+        self.retries_total = 0
+        self.batches_total = 0
+        self.last_batch_ms = 0.0
+        self.last_lag_ms = 0.0
+        self.last_error = None
+
+    def submit(self, readings: list) -> None:
+        """Queue inserted readings for scoring (never blocks)"""
+        now = time.monotonic()
+        with self._cond:
+            self._start_locked()
+            was_empty = not self._pending
+            for reading in readings:
+                if len(self._pending) >= ANOMALY_MAX_PENDING:
+                    self.dropped_total += 1
+                    continue
+                try:
+                    features = feature_row(reading)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                self._pending.append((now, reading["device_id"], reading["measured_at_vn"], features))
+            # An idle thread waits untimed: wake it to start the batch clock
+            if self._pending and (was_empty or len(self._pending) >= ANOMALY_BATCH_SIZE):
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "scored_total": self.scored_total,
+                "anomalies_total": self.anomalies_total,
+                "dropped_total": self.dropped_total,
+                "failed_total": self.failed_total,
+                "retries_total": self.retries_total,
+                "batches_total": self.batches_total,
+                "last_batch_ms": round(self.last_batch_ms, 2),
+                "last_lag_ms": round(self.last_lag_ms, 2),
+                "last_error": self.last_error,
+            }
+
+    def _start_locked(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="anomaly-stream", daemon=True)
+            self._thread.start()
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            while True:
+                if len(self._pending) >= ANOMALY_BATCH_SIZE:
+                    break
+                if self._pending:
+                    waited_ms = (time.monotonic() - self._pending[0][0]) * 1000
+                    if waited_ms >= ANOMALY_BATCH_MS:
+                        break
+                    self._cond.wait((ANOMALY_BATCH_MS - waited_ms) / 1000)
+                else:
+                    self._cond.wait()
+            return [self._pending.popleft() for _ in range(min(ANOMALY_BATCH_SIZE, len(self._pending)))]
+
+    def _run(self) -> None:
+        try:
+            self.load_models()  # before the first batch waits on it
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"⚠️ Anomaly models not loaded: {e}")
+        while True:
+            self._score_with_retry(self._next_batch())
+
+    def _score_with_retry(self, batch: list) -> None:
+        # New readings keep queueing (bounded) while this batch backs off
+        for attempt in range(1, ANOMALY_RETRY_ATTEMPTS + 1):
+            try:
+                self.score_batch(batch)
+                self.last_error = None
+                return
+            except Exception as e:
+                self.last_error = str(e)
+                if attempt < ANOMALY_RETRY_ATTEMPTS:
+                    with self._cond:
+                        self.retries_total += 1
+                    time.sleep(ANOMALY_RETRY_BACKOFF_MS * attempt / 1000)
+                    continue
+                with self._cond:
+                    self.failed_total += len(batch)
+                print(f"⚠️ Anomaly scoring failed for {len(batch)} readings after {attempt} attempts: {e} "
+                      f"(left NULL; rescore_anomalies.py --fill-flags scores them)")
+
+    def score_batch(self, batch: list) -> int:
+        """Score a batch in one model call and flag its rows; returns anomalies found"""
+        start = time.perf_counter()
+        models = self.load_models()
+
+        X = np.array([features for _, _, _, features in batch], dtype=float)
+        scores = models.anomaly_detector.score_samples(models.feature_scaler.transform(X))
+        # IsolationForest.predict: anomaly where score_samples - offset_ < 0
+        flags = scores < models.anomaly_detector.offset_
+
+        times = [measured_at_vn for _, _, measured_at_vn, _ in batch]
+        rows = [
+            (device_id, measured_at_vn, float(score), bool(flag))
+            for (_, device_id, measured_at_vn, _), score, flag in zip(batch, scores, flags)
+        ]
+        conn = self.get_conn()
+        try:
+            with conn.cursor() as cur:
+                bounds = cur.mogrify("%s::timestamp AND %s::timestamp", (min(times), max(times))).decode()
+                execute_values(cur, FLAG_READINGS_SQL.format(bounds=bounds), rows, page_size=len(rows))
+            conn.commit()
+        finally:
+            conn.close()
+
+        anomalies = int(flags.sum())
+        if anomalies:
+            by_device = Counter(device_id for (_, device_id, _, _), flag in zip(batch, flags) if flag)
+            print("🚨 Anomalous readings: " + ", ".join(f"{d}: {n}" for d, n in by_device.items()))
+
+        with self._cond:
+            self.scored_total += len(batch)
+            self.anomalies_total += anomalies
+            self.batches_total += 1
+            self.last_batch_ms = (time.perf_counter() - start) * 1000
+            self.last_lag_ms = (time.monotonic() - batch[0][0]) * 1000
+        return anomalies
@@ -1,61 +1,59 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import math
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime, timezone, timedelta
+import time
+from psycopg2.extras import RealDictCursor, execute_values
+from datetime import datetime
 from dotenv import load_dotenv
 
-# Load .env file
+# Load .env file (before importing modules that read env at import time)
 load_dotenv()
 
+import ai_inference
+from anomaly_stream import ANOMALY_STREAM_ENABLED, AnomalyStream
+from online_stats import ONLINE_STATS_ENABLED, OnlineAggregator
+from cache_utils import SingleFlight
+from fast_json import FastJSONProvider
+from ingest_spool import IngestSpool, SPOOL_DIR
+from ingest_common import (
+    READING_COLUMNS,
+    ReadingValidationError,
+    device_filter,
+    parse_reading,
+    reading_event,
+)
+from response_format import compressed, shape_rows
+from rate_limit import (
+    INGEST_MAX_IN_FLIGHT,
+    InFlightLimiter,
+    admission_control,
+    create_ingest_limiter,
+)
+from reading_codec import CONTENT_TYPE as FRAME_CONTENT_TYPE, FrameDecodeError, decode_frame
+from service_client import get_service, service_metrics
 
-def get_db_conn():
+# Content-Type của frame nhị phân (octet-stream cho firmware không đặt header riêng)
+FRAME_CONTENT_TYPES = (FRAME_CONTENT_TYPE, "application/octet-stream")
+
+
+def get_db_conn(**kwargs):
     dsn = os.getenv("DATABASE_URL")
     if dsn:
-        return psycopg2.connect(dsn)
+        return psycopg2.connect(dsn, **kwargs)
     return psycopg2.connect(
         host=os.getenv("PGHOST", "36.50.134.107"),
         port=int(os.getenv("PGPORT", "6000")),
         dbname=os.getenv("PGDATABASE", "db_iot_sensor"),
         user=os.getenv("PGUSER", "admin"),
         password=os.getenv("PGPASSWORD", "admin123"),
+        **kwargs,
     )
 
 
-def normalize_measured_at_vn(payload: dict) -> str | None:
-    # Ưu tiên created_at dạng 'YYYY-MM-DD HH:MM:SS'
-    created_at = payload.get("created_at")
-    if isinstance(created_at, str) and len(created_at) >= 19:
-        return created_at[:19]
-
-    ts = payload.get("timestamp")
-    if ts is None:
-        # fallback: now VN
-        vn = datetime.now(timezone.utc) + timedelta(hours=7)
-        return vn.strftime("%Y-%m-%d %H:%M:%S")
-
-    if isinstance(ts, (int, float)):
-        dt_utc = datetime.fromtimestamp(ts, tz=timezone.utc)
-        vn = dt_utc + timedelta(hours=7)
-        return vn.strftime("%Y-%m-%d %H:%M:%S")
-
-    if isinstance(ts, str):
-        # Thử parse RFC1123/GMT của ESP: 'Sun, 05 Oct 2025 01:34:01 GMT'
-        try:
-            dt = datetime.strptime(ts, "%a, %d %b %Y %H:%M:%S GMT").replace(tzinfo=timezone.utc)
-            vn = dt + timedelta(hours=7)
-            return vn.strftime("%Y-%m-%d %H:%M:%S")
-        except Exception:
-            pass
-        # Nếu ts đã là 'YYYY-MM-DD HH:MM:SS' thì giữ nguyên
-        if len(ts) >= 19 and ts[4] == '-' and ts[7] == '-' and ts[13] == ':' and ts[16] == ':':
-            return ts[:19]
-
-    return None
-
-
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Register auth blueprint
@@ -66,124 +64,288 @@ app.register_blueprint(auth_bp)
 from dashboard_routes import dashboard_bp
 app.register_blueprint(dashboard_bp)
 
+# Register realtime (SSE) blueprint
+from realtime_routes import realtime_bp, notify_new_reading
+app.register_blueprint(realtime_bp)
+
+
+# Ngân sách thời gian cho 1 lần ghi DB trong /api/data; vượt quá -> ghi vào spool
+INGEST_DB_BUDGET_MS = int(os.getenv("INGEST_DB_BUDGET_MS", "2000"))
+
+
+def connect_within_budget():
+    """
+    Connect for an ingest write; returns (conn, statement_timeout_ms) where
+    the timeout is what is left of INGEST_DB_BUDGET_MS after connecting, so
+    connect + insert together stay within one budget
+    """
+    start = time.monotonic()
+    conn = get_db_conn(connect_timeout=max(1, math.ceil(INGEST_DB_BUDGET_MS / 1000)))
+    remaining_ms = INGEST_DB_BUDGET_MS - int((time.monotonic() - start) * 1000)
+    if remaining_ms <= 0:
+        conn.close()
+        raise psycopg2.OperationalError("ingest DB budget exhausted while connecting")
+    return conn, remaining_ms
+
+
+def insert_reading(reading: dict):
+    """
+    Insert one reading within INGEST_DB_BUDGET_MS and notify realtime dashboards
+
+    Returns (id, onchain_status), or None for a duplicate reading.
+    Raises psycopg2.OperationalError when the DB is unreachable or too slow.
+    """
+    conn, timeout_ms = connect_within_budget()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+            cur.execute(
+                f"""
+                INSERT INTO sensor_readings ({', '.join(READING_COLUMNS)})
+                VALUES ({', '.join(['%s'] * len(READING_COLUMNS))})
+                ON CONFLICT (device_id, measured_at_vn) DO NOTHING
+                RETURNING id, onchain_status
+                """,
+                tuple(reading[c] for c in READING_COLUMNS),
+            )
+            inserted = cur.fetchone()
+
+            # Push to realtime dashboards (delivered on commit, skipped for duplicates)
+            if inserted:
+                notify_new_reading(cur, reading_event(reading, inserted[1]))
+        conn.commit()
+        if inserted:
+            record_inserted([reading])
+        return inserted
+    finally:
+        conn.close()
+
+
+def insert_reading_frame(readings: list) -> int:
+    """
+    Insert all readings of a binary frame in one statement within
+    INGEST_DB_BUDGET_MS and notify realtime dashboards for the new ones
+
+    Returns the number of rows inserted (duplicates are skipped).
+    """
+    conn, timeout_ms = connect_within_budget()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+            inserted = execute_values(
+                cur,
+                f"""
+                INSERT INTO sensor_readings ({', '.join(READING_COLUMNS)})
+                VALUES %s
+                ON CONFLICT (device_id, measured_at_vn) DO NOTHING
+                RETURNING to_char(measured_at_vn, 'YYYY-MM-DD HH24:MI:SS'), onchain_status
+                """,
+                [tuple(r[c] for c in READING_COLUMNS) for r in readings],
+                page_size=len(readings),
+                fetch=True,
+            )
+
+            by_time = {r["measured_at_vn"]: r for r in readings}
+            new_readings = []
+            for measured_at_vn, onchain_status in inserted:
+                reading = by_time.get(measured_at_vn)
+                if reading:
+                    notify_new_reading(cur, reading_event(reading, onchain_status))
+                    new_readings.append(reading)
+        conn.commit()
+        record_inserted(new_readings)
+        return len(inserted)
+    finally:
+        conn.close()
+
+
+def insert_readings_batch(readings: list) -> int:
+    """Insert many readings in one statement (spool replay); duplicates are skipped"""
+    conn = get_db_conn()
+    try:
+        with conn.cursor() as cur:
+            inserted = execute_values(
+                cur,
+                f"""
+                INSERT INTO sensor_readings ({', '.join(READING_COLUMNS)})
+                VALUES %s
+                ON CONFLICT (device_id, measured_at_vn) DO NOTHING
+                RETURNING device_id, to_char(measured_at_vn, 'YYYY-MM-DD HH24:MI:SS')
+                """,
+                [tuple(r[c] for c in READING_COLUMNS) for r in readings],
+                page_size=len(readings) or 1,
+                fetch=True,
+            )
+        conn.commit()
+        by_key = {(r["device_id"], r["measured_at_vn"]): r for r in readings}
+        record_inserted([by_key[key] for key in map(tuple, inserted) if key in by_key])
+        return len(inserted)
+    finally:
+        conn.close()
+
+
+# Chấm điểm bất thường cho từng bản ghi sau khi ghi (micro-batch, luồng nền)
+anomaly_stream = None
+if ANOMALY_STREAM_ENABLED:
+    anomaly_stream = AnomalyStream(ai_inference.anomaly_models, get_db_conn)
+
+# Thống kê theo ngày cập nhật khi ghi (Welford + quantile sketch), ghi DB định kỳ
+online_stats = None
+if ONLINE_STATS_ENABLED:
+    online_stats = OnlineAggregator(get_db_conn)
+
+
+def record_inserted(readings: list) -> None:
+    """Hand newly inserted readings to the post-insert stages (after commit)"""
+    if not readings:
+        return
+    if online_stats is not None:
+        online_stats.add(readings)
+    if anomaly_stream is not None:
+        anomaly_stream.submit(readings)
+
+
+# Spool đĩa cho /api/data khi Postgres chậm hoặc mất kết nối
+ingest_spool = None
+if os.getenv("INGEST_SPOOL_ENABLED", "true").lower() == "true":
+    ingest_spool = IngestSpool(SPOOL_DIR, insert_readings_batch)
+    # Drain segments left from a previous run without waiting for a new failure
+    ingest_spool.start()
+
+
+# Admission control: per-device token bucket + global in-flight cap
+ingest_limiter = create_ingest_limiter(
+    lambda: get_db_conn(connect_timeout=1, options="-c statement_timeout=1000")
+)
+ingest_in_flight = InFlightLimiter(INGEST_MAX_IN_FLIGHT)
+
+# Downstream services (pooled keep-alive connections + circuit breaker)
+ai_service = get_service("ai_service")
+node_bridge = get_service("node_bridge")
+
+# Concurrent analyze-date requests for the same (date, device) share one run
+analyze_flight = SingleFlight()
+
 
 @app.route("/api/data", methods=["POST"])
+@admission_control(ingest_limiter, ingest_in_flight)
 def receive_data():
     try:
+        # Frame nhị phân (reading_codec.py): nhiều bản ghi / request
+        if request.mimetype in FRAME_CONTENT_TYPES:
+            return receive_frame()
+
         data = request.get_json(silent=True) or {}
-        
-        # SOIL PARAMETERS (8 thông số)
-        # Lưu ý: IoT field "temperature" = Soil Temperature
-        #        IoT field "humidity" = Soil Moisture/Humidity
-        soil_temperature = data.get("temperature")
-        soil_moisture = data.get("humidity")
-        conductivity = data.get("conductivity")
-        ph = data.get("ph")
-        nitrogen = data.get("nitrogen")
-        phosphorus = data.get("phosphorus")
-        potassium = data.get("potassium")
-        salt = data.get("salt")
-        
-        # AIR/WEATHER PARAMETERS (3 thông số)
-        air_temperature = data.get("air_temperature")
-        air_humidity = data.get("air_humidity")
-        is_raining = data.get("is_raining")
-        
-        # Validate required fields (tất cả 11 thông số)
-        required_fields = {
-            "soil_temperature": soil_temperature,
-            "soil_moisture": soil_moisture,
-            "conductivity": conductivity,
-            "ph": ph,
-            "nitrogen": nitrogen,
-            "phosphorus": phosphorus,
-            "potassium": potassium,
-            "salt": salt,
-            "air_temperature": air_temperature,
-            "air_humidity": air_humidity,
-            "is_raining": is_raining
-        }
-        
-        missing = [k for k, v in required_fields.items() if v is None]
-        if missing:
-            return jsonify({
-                "status": "error", 
-                "message": f"Missing required fields: {', '.join(missing)}"
-            }), 400
-        
-        # Convert boolean (is_raining có thể là bool hoặc string "true"/"false")
-        if isinstance(is_raining, bool):
-            is_raining_bool = is_raining
-        elif isinstance(is_raining, str):
-            is_raining_bool = is_raining.lower() == "true"
-        else:
-            is_raining_bool = bool(is_raining)
 
-        measured_at_vn = normalize_measured_at_vn(data)
-        if not measured_at_vn:
-            return jsonify({"status": "error", "message": "Invalid timestamp/created_at"}), 400
+        try:
+            reading = parse_reading(data, request.headers)
+        except ReadingValidationError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
 
-        with get_db_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO sensor_readings (
-                        measured_at_vn,
-                        soil_temperature_c, soil_moisture_pct,
-                        conductivity_us_cm, ph_value,
-                        nitrogen_mg_kg, phosphorus_mg_kg, potassium_mg_kg, salt_mg_l,
-                        air_temperature_c, air_humidity_pct, is_raining
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (measured_at_vn) DO NOTHING
-                    """,
-                    (
-                        measured_at_vn,
-                        float(soil_temperature),
-                        float(soil_moisture),
-                        int(conductivity),
-                        float(ph),
-                        int(nitrogen),
-                        int(phosphorus),
-                        int(potassium),
-                        int(salt),
-                        float(air_temperature),
-                        float(air_humidity),
-                        is_raining_bool
-                    ),
-                )
-                conn.commit()
-
-        # Tùy chọn: callback Node bridge
-        bridge_url = os.getenv("NODE_BRIDGE_URL")  # vd: http://localhost:3000/bridgePending
-        bridge_result = None
-        if bridge_url:
-            try:
-                import urllib.request
-                import json
-                req = urllib.request.Request(
-                    bridge_url,
-                    data=json.dumps({"limit": 1}).encode("utf-8"),
-                    headers={"Content-Type": "application/json"},
-                    method="POST",
-                )
-                with urllib.request.urlopen(req, timeout=30) as resp:
-                    bridge_result = {"status": resp.status}
-            except Exception as e:
-                bridge_result = {"error": str(e)}
+        device_id = reading["device_id"]
+        measured_at_vn = reading["measured_at_vn"]
+
+        try:
+            insert_reading(reading)
+        except psycopg2.OperationalError as e:
+            # DB không kết nối được / quá ngân sách thời gian -> ghi vào spool, drainer sẽ ghi lại sau
+            if ingest_spool is None:
+                raise
+            ingest_spool.append(reading)
+            print(f"⚠️ DB write failed or slow, reading spooled: {e}")
+            return jsonify({
+                "status": "spooled",
+                "device_id": device_id,
+                "measured_at_vn": measured_at_vn,
+            }), 202
 
         return jsonify({
             "status": "success",
+            "device_id": device_id,
             "measured_at_vn": measured_at_vn,
-            "bridge": bridge_result,
+            "bridge": call_node_bridge(limit=1),
         }), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def receive_frame():
+    """POST /api/data with a binary frame: decode all records, insert in one batch"""
+    try:
+        readings = decode_frame(request.get_data(), request.headers.get("X-Device-Id"))
+    except FrameDecodeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    device_id = readings[0]["device_id"]
+    measured_at_vn = readings[-1]["measured_at_vn"]
+
+    try:
+        inserted = insert_reading_frame(readings)
+    except psycopg2.OperationalError as e:
+        if ingest_spool is None:
+            raise
+        ingest_spool.append_many(readings)
+        print(f"⚠️ DB write failed or slow, {len(readings)} readings spooled: {e}")
+        return jsonify({
+            "status": "spooled",
+            "device_id": device_id,
+            "count": len(readings),
+            "measured_at_vn": measured_at_vn,
+        }), 202
+
+    return jsonify({
+        "status": "success",
+        "device_id": device_id,
+        "count": len(readings),
+        "inserted": inserted,
+        "measured_at_vn": measured_at_vn,
+        "bridge": call_node_bridge(limit=inserted) if inserted else None,
+    }), 200
+
+
+def call_node_bridge(limit: int):
+    # Tùy chọn: callback Node bridge
+    bridge_url = os.getenv("NODE_BRIDGE_URL")  # vd: http://localhost:3000/bridgePending
+    if not bridge_url:
+        return None
+    try:
+        resp = node_bridge.post_json(bridge_url, {"limit": limit})
+        return {"status": resp.status_code}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.route("/api/spool", methods=["GET"])
+def api_spool():
+    if ingest_spool is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **ingest_spool.stats()}), 200
+
+
+@app.route("/api/anomaly-stream", methods=["GET"])
+def api_anomaly_stream():
+    if anomaly_stream is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **anomaly_stream.stats()}), 200
+
+
+@app.route("/api/online-stats", methods=["GET"])
+def api_online_stats():
+    if online_stats is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **online_stats.stats()}), 200
+
+
+@app.route("/api/services", methods=["GET"])
+def api_services():
+    # Latency and circuit breaker state of downstream service calls
+    return jsonify(service_metrics()), 200
+
+
 @app.route("/api/latest", methods=["GET"])
 def api_latest():
     try:
+        where_sql, where_params = device_filter(request.args.get("device_id"))
         with get_db_conn() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
@@ -200,11 +362,13 @@ def api_latest():
                            air_temperature_c as air_temperature,
                            air_humidity_pct as air_humidity,
                            is_raining,
-                           measured_at_vn, created_at_vn, onchain_status
+                           device_id, measured_at_vn, created_at_vn, onchain_status
                     FROM sensor_readings
-                    ORDER BY id DESC
+                    """ + where_sql + """
+                    ORDER BY measured_at_vn DESC
                     LIMIT 1
-                    """
+                    """,
+                    where_params,
                 )
                 row = cur.fetchone()
                 if not row:
@@ -218,9 +382,11 @@ def api_latest():
 
 
 @app.route("/api/history", methods=["GET"])
+@compressed
 def api_history():
     try:
         limit = min(int(request.args.get("limit", 100)), 1000)
+        where_sql, where_params = device_filter(request.args.get("device_id"))
         with get_db_conn() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
@@ -237,27 +403,203 @@ def api_history():
                            air_temperature_c as air_temperature,
                            air_humidity_pct as air_humidity,
                            is_raining,
+                           device_id,
                            measured_at_vn as timestamp,
                            onchain_status as status,
                            created_at_vn as created_at
                     FROM sensor_readings
-                    ORDER BY id DESC
+                    """ + where_sql + """
+                    ORDER BY measured_at_vn DESC
                     LIMIT %s
                     """,
-                    (limit,),
+                    where_params + (limit,),
                 )
                 rows = cur.fetchall()
-                return jsonify({"count": len(rows), "data": rows}), 200
+                return jsonify({"count": len(rows), "data": shape_rows(rows, "timestamp")}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def online_day_aggregate(date_str: str, device_id: str | None) -> dict | None:
+    """Day aggregate from sensor_daily_stats (online_stats.py); None -> scan raw readings"""
+    if online_stats is None:
+        return None
+    try:
+        day = online_stats.day(date_str, device_id)
+    except psycopg2.Error as e:
+        print(f"⚠️ Online stats unavailable, scanning readings: {e}")
+        return None
+    if day is None:
+        return None
+
+    moisture = day.stats["soil_moisture_pct"]
+    soil_temp = day.stats["soil_temperature_c"]
+    return {
+        "sample_count": day.count,
+        "time_range": {
+            "first": day.first,
+            "last": day.last
+        },
+        "averages": {
+            "soil_temperature": day.mean("soil_temperature_c"),
+            "soil_moisture": day.mean("soil_moisture_pct"),
+            "conductivity": day.median("conductivity_us_cm"),
+            "ph": day.mean("ph_value"),
+            "nitrogen": day.mean("nitrogen_mg_kg"),
+            "phosphorus": day.mean("phosphorus_mg_kg"),
+            "potassium": day.mean("potassium_mg_kg"),
+            "salt": day.median("salt_mg_l"),
+            "air_temperature": day.mean("air_temperature_c"),
+            "air_humidity": day.mean("air_humidity_pct"),
+            "is_raining": day.is_raining()
+        },
+        "ranges": {
+            "soil_temp_min": soil_temp.min,
+            "soil_temp_max": soil_temp.max,
+            "moisture_min": moisture.min,
+            "moisture_max": moisture.max,
+            "moisture_variance": moisture.stddev() or 0
+        }
+    }
+
+
+def scan_day_aggregate(date_str: str, device_id: str | None) -> dict | None:
+    """Day aggregate by scanning sensor_readings; None when the day has no data"""
+    # Query DB: HYBRID aggregation (AVG + MEDIAN + MAJORITY)
+    with get_db_conn() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            query = """
+            SELECT
+                COUNT(*) as sample_count,
+                MIN(measured_at_vn) as first_reading,
+                MAX(measured_at_vn) as last_reading,
+                
+                -- AVERAGE for most params
+                AVG(soil_temperature_c) as soil_temperature,
+                AVG(soil_moisture_pct) as soil_moisture,
+                AVG(ph_value) as ph,
+                AVG(nitrogen_mg_kg) as nitrogen,
+                AVG(phosphorus_mg_kg) as phosphorus,
+                AVG(potassium_mg_kg) as potassium,
+                AVG(air_temperature_c) as air_temperature,
+                AVG(air_humidity_pct) as air_humidity,
+                
+                -- MEDIAN for sensor-prone params
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY conductivity_us_cm) as conductivity,
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY salt_mg_l) as salt,
+                
+                -- MAJORITY VOTE for boolean
+                (SUM(CASE WHEN is_raining THEN 1 ELSE 0 END)::float / COUNT(*)) > 0.5 as is_raining,
+                
+                -- MIN/MAX for context
+                MIN(soil_temperature_c) as min_soil_temp,
+                MAX(soil_temperature_c) as max_soil_temp,
+                MIN(soil_moisture_pct) as min_moisture,
+                MAX(soil_moisture_pct) as max_moisture,
+                STDDEV(soil_moisture_pct) as moisture_variance
+                
+            FROM sensor_readings
+            WHERE measured_at_vn >= %s::date
+              AND measured_at_vn < %s::date + 1
+            """ + device_filter(device_id, "AND")[0]
+            
+            # measured_at_vn is already VN local time; a plain range keeps
+            # partition pruning and index use (migration 012)
+            cur.execute(query, (date_str, date_str) + device_filter(device_id)[1])
+            result = cur.fetchone()
+            
+            if not result or result['sample_count'] == 0:
+                return None
+            
+            # Prepare aggregated data
+            return {
+                "sample_count": result['sample_count'],
+                "time_range": {
+                    "first": str(result['first_reading']),
+                    "last": str(result['last_reading'])
+                },
+                "averages": {
+                    "soil_temperature": float(result['soil_temperature']),
+                    "soil_moisture": float(result['soil_moisture']),
+                    "conductivity": float(result['conductivity']),
+                    "ph": float(result['ph']),
+                    "nitrogen": float(result['nitrogen']),
+                    "phosphorus": float(result['phosphorus']),
+                    "potassium": float(result['potassium']),
+                    "salt": float(result['salt']),
+                    "air_temperature": float(result['air_temperature']),
+                    "air_humidity": float(result['air_humidity']),
+                    "is_raining": bool(result['is_raining'])
+                },
+                "ranges": {
+                    "soil_temp_min": float(result['min_soil_temp']),
+                    "soil_temp_max": float(result['max_soil_temp']),
+                    "moisture_min": float(result['min_moisture']),
+                    "moisture_max": float(result['max_moisture']),
+                    "moisture_variance": float(result['moisture_variance']) if result['moisture_variance'] else 0
+                }
+            }
+
+
+def analyze_date_result(date_str: str, device_id: str | None) -> tuple[dict, int]:
+    """Full-day aggregate + AI analysis for one date: (response body, status)"""
+    # Online daily stats when they cover the day, otherwise the raw scan
+    aggregated_data = online_day_aggregate(date_str, device_id) or scan_day_aggregate(date_str, device_id)
+    if aggregated_data is None:
+        return {
+            "status": "error",
+            "message": f"No sensor data found for date {date_str}"
+        }, 404
+
+    # Call AI Service
+    ai_service_url = os.getenv("AI_SERVICE_URL", "http://localhost:8000/api/ai/analyze")
+    
+    ai_payload = {
+        "soil_temperature": aggregated_data['averages']['soil_temperature'],
+        "soil_moisture": aggregated_data['averages']['soil_moisture'],
+        "conductivity": int(aggregated_data['averages']['conductivity']),
+        "ph": aggregated_data['averages']['ph'],
+        "nitrogen": int(aggregated_data['averages']['nitrogen']),
+        "phosphorus": int(aggregated_data['averages']['phosphorus']),
+        "potassium": int(aggregated_data['averages']['potassium']),
+        "salt": int(aggregated_data['averages']['salt']),
+        "air_temperature": aggregated_data['averages']['air_temperature'],
+        "air_humidity": aggregated_data['averages']['air_humidity'],
+        "is_raining": aggregated_data['averages']['is_raining'],
+        "mode": "discovery"
+    }
+    
+    ai_result = None
+    try:
+        if ai_inference.in_process_enabled():
+            # Models loaded in this process: no HTTP hop / JSON round trip
+            ai_result = ai_inference.analyze(ai_payload)
+        else:
+            # Pooled keep-alive connection; fails fast while the breaker is open
+            ai_result = ai_service.post_json(ai_service_url, ai_payload).json()
+            
+    except Exception as e:
+        # AI service error - still return data but mark AI as failed
+        ai_result = {
+            "error": str(e),
+            "status": "AI service unavailable"
+        }
+    
+    return {
+        "status": "success",
+        "date": date_str,
+        "device_id": device_id,
+        "aggregated_data": aggregated_data,
+        "ai_analysis": ai_result
+    }, 200
+
+
 @app.route("/api/analyze-date", methods=["POST"])
 def analyze_date():
     """
     Analyze soil data for a specific date
     
-    Request: {"date": "2025-10-27"}
+    Request: {"date": "2025-10-27", "device_id": "optional, default: all devices"}
     
     Response: {
         "date": "2025-10-27",
@@ -269,6 +611,7 @@ def analyze_date():
     try:
         data = request.get_json(silent=True) or {}
         date_str = data.get("date")
+        device_id = data.get("device_id")
         
         if not date_str:
             return jsonify({"status": "error", "message": "date is required (YYYY-MM-DD)"}), 400
@@ -279,128 +622,9 @@ def analyze_date():
         except ValueError:
             return jsonify({"status": "error", "message": "Invalid date format. Use YYYY-MM-DD"}), 400
         
-        # Query DB: HYBRID aggregation (AVG + MEDIAN + MAJORITY)
-        with get_db_conn() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = """
-                SELECT
-                    COUNT(*) as sample_count,
-                    MIN(measured_at_vn) as first_reading,
-                    MAX(measured_at_vn) as last_reading,
-                    
-                    -- AVERAGE for most params
-                    AVG(soil_temperature_c) as soil_temperature,
-                    AVG(soil_moisture_pct) as soil_moisture,
-                    AVG(ph_value) as ph,
-                    AVG(nitrogen_mg_kg) as nitrogen,
-                    AVG(phosphorus_mg_kg) as phosphorus,
-                    AVG(potassium_mg_kg) as potassium,
-                    AVG(air_temperature_c) as air_temperature,
-                    AVG(air_humidity_pct) as air_humidity,
-                    
-                    -- MEDIAN for sensor-prone params
-                    PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY conductivity_us_cm) as conductivity,
-                    PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY salt_mg_l) as salt,
-                    
-                    -- MAJORITY VOTE for boolean
-                    (SUM(CASE WHEN is_raining THEN 1 ELSE 0 END)::float / COUNT(*)) > 0.5 as is_raining,
-                    
-                    -- MIN/MAX for context
-                    MIN(soil_temperature_c) as min_soil_temp,
-                    MAX(soil_temperature_c) as max_soil_temp,
-                    MIN(soil_moisture_pct) as min_moisture,
-                    MAX(soil_moisture_pct) as max_moisture,
-                    STDDEV(soil_moisture_pct) as moisture_variance
-                    
-                FROM sensor_readings
-                WHERE DATE(measured_at_vn AT TIME ZONE 'Asia/Ho_Chi_Minh') = %s
-                """
-                
-                cur.execute(query, (date_str,))
-                result = cur.fetchone()
-                
-                if not result or result['sample_count'] == 0:
-                    return jsonify({
-                        "status": "error",
-                        "message": f"No sensor data found for date {date_str}"
-                    }), 404
-                
-                # Prepare aggregated data
-                aggregated_data = {
-                    "sample_count": result['sample_count'],
-                    "time_range": {
-                        "first": str(result['first_reading']),
-                        "last": str(result['last_reading'])
-                    },
-                    "averages": {
-                        "soil_temperature": float(result['soil_temperature']),
-                        "soil_moisture": float(result['soil_moisture']),
-                        "conductivity": float(result['conductivity']),
-                        "ph": float(result['ph']),
-                        "nitrogen": float(result['nitrogen']),
-                        "phosphorus": float(result['phosphorus']),
-                        "potassium": float(result['potassium']),
-                        "salt": float(result['salt']),
-                        "air_temperature": float(result['air_temperature']),
-                        "air_humidity": float(result['air_humidity']),
-                        "is_raining": bool(result['is_raining'])
-                    },
-                    "ranges": {
-                        "soil_temp_min": float(result['min_soil_temp']),
-                        "soil_temp_max": float(result['max_soil_temp']),
-                        "moisture_min": float(result['min_moisture']),
-                        "moisture_max": float(result['max_moisture']),
-                        "moisture_variance": float(result['moisture_variance']) if result['moisture_variance'] else 0
-                    }
-                }
-        
-        # Call AI Service
-        ai_service_url = os.getenv("AI_SERVICE_URL", "http://localhost:8000/api/ai/analyze")
-        
-        ai_payload = {
-            "soil_temperature": aggregated_data['averages']['soil_temperature'],
-            "soil_moisture": aggregated_data['averages']['soil_moisture'],
-            "conductivity": int(aggregated_data['averages']['conductivity']),
-            "ph": aggregated_data['averages']['ph'],
-            "nitrogen": int(aggregated_data['averages']['nitrogen']),
-            "phosphorus": int(aggregated_data['averages']['phosphorus']),
-            "potassium": int(aggregated_data['averages']['potassium']),
-            "salt": int(aggregated_data['averages']['salt']),
-            "air_temperature": aggregated_data['averages']['air_temperature'],
-            "air_humidity": aggregated_data['averages']['air_humidity'],
-            "is_raining": aggregated_data['averages']['is_raining'],
-            "mode": "discovery"
-        }
-        
-        ai_result = None
-        try:
-            import urllib.request
-            import json as json_lib
-            
-            req = urllib.request.Request(
-                ai_service_url,
-                data=json_lib.dumps(ai_payload).encode("utf-8"),
-                headers={"Content-Type": "application/json"},
-                method="POST"
-            )
-            
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                ai_result = json_lib.loads(resp.read().decode("utf-8"))
-                
-        except Exception as e:
-            # AI service error - still return data but mark AI as failed
-            ai_result = {
-                "error": str(e),
-                "status": "AI service unavailable"
-            }
-        
-        return jsonify({
-            "status": "success",
-            "date": date_str,
-            "aggregated_data": aggregated_data,
-            "ai_analysis": ai_result
-        }), 200
-        
+        # Concurrent requests for the same date/device share one aggregate + AI call
+        body, status = analyze_flight.do((date_str, device_id), analyze_date_result, date_str, device_id)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
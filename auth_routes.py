@@ -10,12 +10,50 @@ import os
 from datetime import datetime
 from dotenv import load_dotenv
 import hashlib
-import bcrypt
+import re
 
 load_dotenv('.env')
 
+from auth_security import (
+    AUTH_REQUIRE_SESSION,
+    SESSION_TTL_SECONDS,
+    HashingBusyError,
+    hash_pin,
+    issue_session_token,
+    login_throttle,
+    needs_rehash,
+    verify_pin,
+    verify_session_token,
+)
+from cache_utils import TTLCache
+from login_activity import LoginActivityWriter
+from rate_limit import client_ip
+
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
+
+@auth_bp.errorhandler(HashingBusyError)
+def handle_hashing_busy(e):
+    """bcrypt pool saturated: fail fast, the client retries shortly"""
+    resp = jsonify({
+        'success': False,
+        'error': str(e)
+    })
+    resp.status_code = 503
+    resp.headers['Retry-After'] = '2'
+    return resp
+
+
+def too_many_attempts(retry_after: int):
+    resp = jsonify({
+        'success': False,
+        'error': f'Quá nhiều lần thử. Vui lòng thử lại sau {retry_after} giây',
+        'retry_after': retry_after
+    })
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(retry_after)
+    return resp
+
 # Database connection helper
 def get_db_connection():
     return psycopg2.connect(
@@ -26,6 +64,99 @@ def get_db_connection():
         password=os.getenv('PGPASSWORD')
     )
 
+# Seconds a profile row is served from memory (invalidated on update/login flush)
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv('PROFILE_CACHE_TTL', '60'))
+
+# Seconds between batched writes of last-login timestamps / passkey counters
+LOGIN_FLUSH_INTERVAL_SECONDS = float(os.getenv('LOGIN_FLUSH_INTERVAL', '10'))
+
+_profile_cache = TTLCache(PROFILE_CACHE_TTL_SECONDS, max_entries=1024)
+
+
+def invalidate_profiles(user_ids) -> None:
+    for user_id in user_ids:
+        _profile_cache.delete(user_id)
+
+
+login_activity = LoginActivityWriter(
+    get_db_connection,
+    LOGIN_FLUSH_INTERVAL_SECONDS,
+    on_flush=invalidate_profiles
+)
+login_activity.register_atexit()
+
+
+def session_response(user_id: int) -> dict:
+    """Session fields added to login/registration responses"""
+    return {
+        'token': issue_session_token(user_id),
+        'token_expires_in': SESSION_TTL_SECONDS
+    }
+
+
+def check_session(user_id: int):
+    """
+    Verify the Bearer session token against user_id
+
+    Returns an error response, or None when the request may proceed. Requests
+    without a token pass unless AUTH_REQUIRE_SESSION is enabled.
+    """
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        if AUTH_REQUIRE_SESSION:
+            return jsonify({
+                'success': False,
+                'error': 'Vui lòng đăng nhập'
+            }), 401
+        return None
+
+    session_user_id = verify_session_token(auth_header[len('Bearer '):].strip())
+    if session_user_id is None:
+        return jsonify({
+            'success': False,
+            'error': 'Phiên đăng nhập không hợp lệ hoặc đã hết hạn'
+        }), 401
+    if session_user_id != user_id:
+        return jsonify({
+            'success': False,
+            'error': 'Không có quyền truy cập tài khoản này'
+        }), 403
+    return None
+
+
+# Login lookup by identifier type: each branch matches one unique expression
+# index from migration 015 (an OR across both columns can use neither)
+LOGIN_USER_COLUMNS = """
+    id, full_name, phone, email,
+    wallet_address,
+    farm_name, farm_location_lat, farm_location_lon, farm_area_hectares, current_crop,
+    pin_hash,
+    is_active
+"""
+LOGIN_BY_EMAIL_SQL = f"SELECT {LOGIN_USER_COLUMNS} FROM users WHERE lower(email) = lower(%s)"
+LOGIN_BY_PHONE_SQL = f"SELECT {LOGIN_USER_COLUMNS} FROM users WHERE canonical_phone(phone) = canonical_phone(%s)"
+
+
+def login_lookup_sql(identifier: str) -> str:
+    """Emails always contain '@', phones never do"""
+    return LOGIN_BY_EMAIL_SQL if '@' in identifier else LOGIN_BY_PHONE_SQL
+
+
+def canonical_phone(phone: str) -> str | None:
+    """Same normalization as the SQL canonical_phone() (migration 015)"""
+    digits = re.sub(r'[^0-9]', '', phone)
+    if digits.startswith('84') and len(digits) == 11:
+        return '0' + digits[2:]
+    return digits or None
+
+
+def login_account_key(identifier: str) -> str:
+    """Throttle key for a login identifier: every spelling the lookup matches shares it"""
+    if '@' in identifier:
+        return f"email:{identifier.lower()}"
+    return f"phone:{canonical_phone(identifier) or identifier.lower()}"
+
+
 # Generate deterministic wallet address from passkey credential
 def generate_wallet_address(credential_id: str) -> str:
     """
@@ -85,7 +216,10 @@ def register_passkey():
         cur = conn.cursor()
         
         # Check if phone already exists
-        cur.execute("SELECT id FROM users WHERE phone = %s", (data['phone'],))
+        cur.execute(
+            "SELECT id FROM users WHERE canonical_phone(phone) = canonical_phone(%s)",
+            (data['phone'],)
+        )
         existing = cur.fetchone()
         if existing:
             cur.close()
@@ -157,7 +291,8 @@ def register_passkey():
             'success': True,
             'user_id': user_id,
             'wallet_address': wallet_addr,
-            'message': f'Đăng ký thành công! Ví của bạn: {wallet_addr}'
+            'message': f'Đăng ký thành công! Ví của bạn: {wallet_addr}',
+            **session_response(user_id)
         }), 201
         
     except Exception as e:
@@ -236,21 +371,12 @@ def login_passkey():
                 'error': 'Tài khoản đã bị vô hiệu hóa'
             }), 403
         
-        # Update last login and counter
-        new_counter = user_row[10] + 1
-        cur.execute("""
-            UPDATE users
-            SET last_login_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh',
-                passkey_last_used_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh',
-                passkey_counter = %s,
-                updated_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh'
-            WHERE id = %s
-        """, (new_counter, user_row[0]))
-        
-        conn.commit()
         cur.close()
         conn.close()
         
+        # Last login + passkey counter are written in batches (login_activity.py)
+        login_activity.record_login(user_row[0], passkey=True)
+        
         # Build user object
         user = {
             'id': user_row[0],
@@ -270,7 +396,8 @@ def login_passkey():
         return jsonify({
             'success': True,
             'user': user,
-            'message': f'Chào mừng {user["full_name"]}!'
+            'message': f'Chào mừng {user["full_name"]}!',
+            **session_response(user['id'])
         }), 200
         
     except Exception as e:
@@ -283,7 +410,18 @@ def login_passkey():
 
 @auth_bp.route('/profile/<int:user_id>', methods=['GET'])
 def get_profile(user_id):
-    """Get user profile by ID"""
+    """Get user profile by ID (Authorization: Bearer <session token>)"""
+    denied = check_session(user_id)
+    if denied:
+        return denied
+    
+    cached = _profile_cache.get(user_id)
+    if cached is not None:
+        return jsonify({
+            'success': True,
+            'user': cached
+        }), 200
+    
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -323,6 +461,7 @@ def get_profile(user_id):
             'created_at': row[11].isoformat() if row[11] else None,
             'last_login_at': row[12].isoformat() if row[12] else None,
         }
+        _profile_cache.set(user_id, user)
         
         return jsonify({
             'success': True,
@@ -339,7 +478,11 @@ def get_profile(user_id):
 
 @auth_bp.route('/profile/<int:user_id>', methods=['PUT'])
 def update_profile(user_id):
-    """Update user profile"""
+    """Update user profile (Authorization: Bearer <session token>)"""
+    denied = check_session(user_id)
+    if denied:
+        return denied
+    
     try:
         data = request.json
         
@@ -384,6 +527,7 @@ def update_profile(user_id):
         conn.commit()
         cur.close()
         conn.close()
+        _profile_cache.delete(user_id)
         
         print(f"✅ User profile updated: ID {user_id}")
         
@@ -450,14 +594,11 @@ def register_pin():
         # Generate wallet address from email if not provided
         wallet_address = data.get('wallet_address') or generate_wallet_address(data['email'])
         
-        # Hash PIN
-        pin_hash = bcrypt.hashpw(pin.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
         conn = get_db_connection()
         cur = conn.cursor()
         
         # Check if email already exists
-        cur.execute("SELECT id FROM users WHERE email = %s", (data['email'],))
+        cur.execute("SELECT id FROM users WHERE lower(email) = lower(%s)", (data['email'],))
         existing = cur.fetchone()
         if existing:
             cur.close()
@@ -467,6 +608,14 @@ def register_pin():
                 'error': 'Email đã được đăng ký'
             }), 400
         
+        # Hash PIN (bounded bcrypt pool; raises HashingBusyError -> 503)
+        try:
+            pin_hash = hash_pin(pin)
+        except HashingBusyError:
+            cur.close()
+            conn.close()
+            raise
+        
         # Insert new user with PIN
         insert_query = """
             INSERT INTO users (
@@ -508,9 +657,12 @@ def register_pin():
             'success': True,
             'user_id': user_id,
             'wallet_address': wallet_addr,
-            'message': f'Đăng ký thành công! Ví của bạn: {wallet_addr}'
+            'message': f'Đăng ký thành công! Ví của bạn: {wallet_addr}',
+            **session_response(user_id)
         }), 201
         
+    except HashingBusyError:
+        raise  # -> handle_hashing_busy (503)
     except Exception as e:
         print(f"❌ PIN Registration error: {e}")
         return jsonify({
@@ -553,26 +705,26 @@ def login_pin():
                 'error': 'Thiếu email/số điện thoại hoặc mã PIN'
             }), 400
         
+        # Throttle before any DB or bcrypt work
+        identifier = email_or_phone.strip()
+        login_key = login_account_key(identifier)
+        ip = client_ip()
+        retry_after = login_throttle.retry_after((login_key,), ip)
+        if retry_after:
+            return too_many_attempts(retry_after)
+        
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Find user by email OR phone
-        cur.execute("""
-            SELECT 
-                id, full_name, phone, email,
-                wallet_address,
-                farm_name, farm_location_lat, farm_location_lon, farm_area_hectares, current_crop,
-                pin_hash,
-                is_active
-            FROM users
-            WHERE email = %s OR phone = %s
-        """, (email_or_phone, email_or_phone))
+        # Find user by email or phone (one unique-index probe)
+        cur.execute(login_lookup_sql(identifier), (identifier,))
         
         user_row = cur.fetchone()
         
         if not user_row:
             cur.close()
             conn.close()
+            login_throttle.record_failure((), ip)
             return jsonify({
                 'success': False,
                 'error': 'Không tìm thấy tài khoản với email/số điện thoại này'
@@ -588,10 +740,27 @@ def login_pin():
                 'error': 'Tài khoản này không sử dụng xác thực PIN'
             }), 400
         
-        # Verify PIN
-        if not bcrypt.checkpw(pin.encode('utf-8'), pin_hash.encode('utf-8')):
+        # The same account is reachable by its email and by its phone:
+        # failures also count against the user id, checked before bcrypt
+        accounts = (login_key, f"user:{user_row[0]}")
+        retry_after = login_throttle.retry_after(accounts, ip)
+        if retry_after:
+            cur.close()
+            conn.close()
+            return too_many_attempts(retry_after)
+        
+        # Verify PIN (bounded bcrypt pool)
+        try:
+            pin_ok = verify_pin(pin, pin_hash)
+        except HashingBusyError:
+            cur.close()
+            conn.close()
+            raise
+        
+        if not pin_ok:
             cur.close()
             conn.close()
+            login_throttle.record_failure(accounts, ip)
             return jsonify({
                 'success': False,
                 'error': 'Mã PIN không đúng'
@@ -606,18 +775,31 @@ def login_pin():
                 'error': 'Tài khoản đã bị vô hiệu hóa'
             }), 403
         
-        # Update last login
-        cur.execute("""
-            UPDATE users
-            SET last_login_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh',
-                updated_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh'
-            WHERE id = %s
-        """, (user_row[0],))
+        login_throttle.record_success(accounts)
+        
+        # Cost factor changed (BCRYPT_ROUNDS): rehash with the PIN we just verified
+        new_pin_hash = None
+        if needs_rehash(pin_hash):
+            try:
+                new_pin_hash = hash_pin(pin)
+            except HashingBusyError:
+                pass  # Try again on a later login
+        
+        if new_pin_hash:
+            cur.execute("""
+                UPDATE users
+                SET pin_hash = %s,
+                    updated_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh'
+                WHERE id = %s
+            """, (new_pin_hash, user_row[0]))
+            conn.commit()
         
-        conn.commit()
         cur.close()
         conn.close()
         
+        # Last login is written in batches (login_activity.py)
+        login_activity.record_login(user_row[0])
+        
         # Build user object
         user = {
             'id': user_row[0],
@@ -637,9 +819,12 @@ def login_pin():
         return jsonify({
             'success': True,
             'user': user,
-            'message': f'Chào mừng {user["full_name"]}!'
+            'message': f'Chào mừng {user["full_name"]}!',
+            **session_response(user['id'])
         }), 200
         
+    except HashingBusyError:
+        raise  # -> handle_hashing_busy (503)
     except Exception as e:
         print(f"❌ PIN Login error: {e}")
         return jsonify({
@@ -0,0 +1,156 @@
+"""
+Auth Security - Bounded bcrypt pool, login throttling and session tokens
+Keeps PIN hashing off the request threads' critical path: at most
+BCRYPT_WORKERS hashes run at once and at most BCRYPT_MAX_QUEUE wait, so a
+login burst or brute-force attempt gets a fast 503 instead of starving
+ingest and dashboard requests served by the same workers
+"""
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import os
+import secrets
+import threading
+import time
+
+import bcrypt
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from cache_utils import TTLCache
+
+# Cost factor for new hashes; existing hashes with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+
+# Concurrent bcrypt operations per process (bcrypt releases the GIL)
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', '2'))
+
+# Operations allowed to wait for a worker before new ones are refused
+BCRYPT_MAX_QUEUE = int(os.getenv('BCRYPT_MAX_QUEUE', '16'))
+
+# Max seconds a request waits for its bcrypt result
+BCRYPT_TIMEOUT_SECONDS = float(os.getenv('BCRYPT_TIMEOUT_SECONDS', '10'))
+
+# Failed PIN attempts allowed per window, per account and per client IP
+LOGIN_WINDOW_SECONDS = int(os.getenv('LOGIN_WINDOW_SECONDS', '900'))
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.getenv('LOGIN_MAX_FAILURES_PER_ACCOUNT', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', '20'))
+
+
+class HashingBusyError(Exception):
+    """The bcrypt pool and its queue are full (HTTP 503)"""
+
+
+class BcryptPool:
+    """ThreadPoolExecutor with a cap on queued + running bcrypt operations"""
+
+    def __init__(self, workers: int, max_queue: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self.rejected_total = 0
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected_total += 1
+            raise HashingBusyError('Hệ thống đang bận, vui lòng thử lại sau')
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=BCRYPT_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            raise HashingBusyError('Hệ thống đang bận, vui lòng thử lại sau')
+
+
+_pool = BcryptPool(BCRYPT_WORKERS, BCRYPT_MAX_QUEUE)
+
+
+def hash_pin(pin: str) -> str:
+    return _pool.run(
+        lambda: bcrypt.hashpw(pin.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+    )
+
+
+def verify_pin(pin: str, pin_hash: str) -> bool:
+    return _pool.run(lambda: bcrypt.checkpw(pin.encode('utf-8'), pin_hash.encode('utf-8')))
+
+
+def needs_rehash(pin_hash: str) -> bool:
+    """True when the hash was made with a cost factor other than BCRYPT_ROUNDS"""
+    try:
+        return int(pin_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+class LoginThrottle:
+    """
+    Fixed-window failure counters per account and per client IP
+
+    Checked before any bcrypt work, so a locked-out attacker costs a dict
+    lookup instead of a hash.
+    """
+
+    def __init__(self, window_seconds: int, max_per_account: int, max_per_ip: int):
+        self.window_seconds = window_seconds
+        self.limits = {'account': max_per_account, 'ip': max_per_ip}
+        self._failures = TTLCache(window_seconds, max_entries=50000)
+
+    def retry_after(self, accounts: tuple, ip: str) -> int:
+        """Seconds until login may be attempted again (0 = allowed)"""
+        now = time.time()
+        wait = 0
+        for scope, key in [('account', a) for a in accounts] + [('ip', ip)]:
+            count, window_end = self._failures.get((scope, key), (0, now))
+            if count >= self.limits[scope]:
+                wait = max(wait, int(window_end - now) + 1)
+        return wait
+
+    def record_failure(self, accounts: tuple, ip: str) -> None:
+        """Count a failure against every account key given and the IP"""
+        now = time.time()
+        for scope, key in [('account', a) for a in accounts] + [('ip', ip)]:
+            count, window_end = self._failures.get((scope, key), (0, now + self.window_seconds))
+            self._failures.set((scope, key), (count + 1, window_end), ttl_seconds=max(1, window_end - now))
+
+    def record_success(self, accounts: tuple) -> None:
+        for account in accounts:
+            self._failures.delete(('account', account))
+
+
+login_throttle = LoginThrottle(
+    LOGIN_WINDOW_SECONDS,
+    LOGIN_MAX_FAILURES_PER_ACCOUNT,
+    LOGIN_MAX_FAILURES_PER_IP,
+)
+
+
+# ====== Signed session tokens ======
+
+# Secret shared by all workers; without it tokens only verify in this process
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+if not SESSION_SECRET:
+    SESSION_SECRET = secrets.token_hex(32)
+    print("⚠️ SESSION_SECRET not set: session tokens are only valid until restart, in this process")
+
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Reject profile requests without a session token (off until the frontend sends one everywhere)
+AUTH_REQUIRE_SESSION = os.getenv('AUTH_REQUIRE_SESSION', 'false').lower() == 'true'
+
+_session_serializer = URLSafeTimedSerializer(SESSION_SECRET, salt='pione-session')
+
+
+def issue_session_token(user_id: int) -> str:
+    """Stateless token proving a login for user_id (HMAC-signed, timestamped)"""
+    return _session_serializer.dumps({'uid': user_id})
+
+
+def verify_session_token(token: str) -> int | None:
+    """user_id from a valid, unexpired token, else None"""
+    try:
+        data = _session_serializer.loads(token, max_age=SESSION_TTL_SECONDS)
+    except (BadSignature, SignatureExpired):
+        return None
+    return data.get('uid') if isinstance(data, dict) else None
@@ -0,0 +1,101 @@
+"""
+Inference Benchmark - analyze_date's AI call over HTTP vs in process
+Sends the same daily-aggregate payloads to AI_SERVICE_URL (pooled
+keep-alive client) and to the embedded facade (ai_inference.py), checks
+that both return the same analysis, and reports per-call latency
+
+    python bench_inference.py --requests 200
+    python bench_inference.py --requests 200 --skip-http   # no AI service running
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import ai_inference
+from service_client import get_service
+
+# Fields that legitimately differ between two runs of the same analysis
+VOLATILE_FIELDS = ('timestamp', 'processing_time_ms')
+
+
+def sample_payloads(n: int, seed: int = 7) -> list:
+    # Daily averages in the ranges the ESP8266 sensors report
+    rng = random.Random(seed)
+    return [
+        {
+            "soil_temperature": round(rng.uniform(20, 32), 2),
+            "soil_moisture": round(rng.uniform(25, 80), 2),
+            "conductivity": rng.randint(300, 2000),
+            "ph": round(rng.uniform(4.5, 8.0), 2),
+            "nitrogen": rng.randint(10, 120),
+            "phosphorus": rng.randint(10, 80),
+            "potassium": rng.randint(80, 300),
+            "salt": rng.randint(200, 1500),
+            "air_temperature": round(rng.uniform(22, 36), 2),
+            "air_humidity": round(rng.uniform(40, 95), 2),
+            "is_raining": rng.random() < 0.3,
+            "mode": "discovery",
+        }
+        for _ in range(n)
+    ]
+
+
+def comparable(result: dict) -> dict:
+    return {k: v for k, v in result.items() if k not in VOLATILE_FIELDS}
+
+
+def timed(call, payloads: list):
+    results, latencies = [], []
+    for payload in payloads:
+        start = time.perf_counter()
+        results.append(call(payload))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def report(label: str, latencies: list) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"{label:<12} mean {statistics.mean(ordered):7.2f} ms   "
+          f"p50 {statistics.median(ordered):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=os.getenv("AI_SERVICE_URL", "http://localhost:8000/api/ai/analyze"))
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--skip-http', action='store_true')
+    args = parser.parse_args()
+
+    payloads = sample_payloads(args.requests)
+
+    start = time.perf_counter()
+    ai_inference.embedded().warm_up()
+    print(f"Model load (once per process): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    local_results, local_latencies = timed(ai_inference.analyze, payloads)
+    report("in-process", local_latencies)
+
+    if args.skip_http:
+        return
+
+    ai_service = get_service("ai_service")
+    http_results, http_latencies = timed(lambda p: ai_service.post_json(args.url, p).json(), payloads)
+    report("http", http_latencies)
+
+    mismatches = sum(
+        comparable(local) != comparable(remote)
+        for local, remote in zip(local_results, http_results)
+    )
+    print(f"Identical results: {len(payloads) - mismatches}/{len(payloads)}")
+
+
+if __name__ == '__main__':
+    main()
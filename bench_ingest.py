@@ -0,0 +1,174 @@
+"""
+Ingest Benchmark - Side-by-side /api/data throughput for the Flask and ASGI servers
+
+Start both servers against the same (test) database, then:
+    python app_ingest.py                                  # :5000
+    uvicorn ingest_asgi:app --port 5001 --workers 1       # :5001
+    python bench_ingest.py --concurrency 500 --requests 20000
+
+Every virtual device holds one keep-alive connection and posts readings
+with its own device_id and increasing timestamps, so no insert is dropped
+by ON CONFLICT. Uses only the standard library (asyncio streams).
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+# Mốc thời gian giả lập (epoch giây) để mỗi lần chạy không trùng dữ liệu cũ
+BASE_TS = int(time.time())
+
+
+def make_payload(device_no: int, seq: int, run_tag: str) -> bytes:
+    return json.dumps({
+        "device_id": f"bench-{run_tag}-{device_no}",
+        "timestamp": BASE_TS + seq,
+        "temperature": 27.5,
+        "humidity": 41.2,
+        "conductivity": 820,
+        "ph": 6.4,
+        "nitrogen": 45,
+        "phosphorus": 30,
+        "potassium": 120,
+        "salt": 210,
+        "air_temperature": 30.1,
+        "air_humidity": 72.0,
+        "is_raining": False,
+    }).encode("utf-8")
+
+
+async def read_response(reader) -> int:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+
+    length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value.strip())
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def device_worker(url, device_no, run_tag, counter, total, latencies, statuses):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    path = parts.path or "/api/data"
+
+    reader, writer = await asyncio.open_connection(host, port)
+    seq = 0
+    try:
+        while counter[0] < total:
+            counter[0] += 1
+            seq += 1
+            body = make_payload(device_no, seq, run_tag)
+            request = (
+                f"POST {path} HTTP/1.1\r\n"
+                f"Host: {host}:{port}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: keep-alive\r\n\r\n"
+            ).encode("latin-1") + body
+
+            started = time.perf_counter()
+            try:
+                writer.write(request)
+                await writer.drain()
+                status = await read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                statuses["conn_error"] = statuses.get("conn_error", 0) + 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run_benchmark(name: str, url: str, concurrency: int, total: int) -> dict:
+    run_tag = f"{name}{int(time.time())}"
+    counter = [0]
+    latencies = []
+    statuses = {}
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(device_worker(url, i, run_tag, counter, total, latencies, statuses) for i in range(concurrency)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+
+    failed_workers = sum(1 for r in results if isinstance(r, Exception))
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "server": name,
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "statuses": statuses,
+        "failed_workers": failed_workers,
+    }
+
+
+def print_report(results: list) -> None:
+    print()
+    print(f"{'server':<8} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    print("-" * 80)
+    for r in results:
+        print(
+            f"{r['server']:<8} {r['requests']:>9} {r['rps']:>9.1f} "
+            f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}  "
+            f"{r['statuses']} (failed connections: {r['failed_workers']})"
+        )
+    if len(results) == 2 and results[0]["rps"]:
+        print(f"\nASGI / Flask throughput: {results[1]['rps'] / results[0]['rps']:.2f}x")
+
+
+async def main(args) -> None:
+    results = []
+    for name, url in (("flask", args.flask_url), ("asgi", args.asgi_url)):
+        if not url:
+            continue
+        print(f"⏱  {name}: {args.requests} requests, {args.concurrency} keep-alive devices -> {url}")
+        results.append(await run_benchmark(name, url, args.concurrency, args.requests))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flask vs ASGI /api/data throughput")
+    parser.add_argument("--flask-url", default="http://127.0.0.1:5000/api/data", help="'' to skip")
+    parser.add_argument("--asgi-url", default="http://127.0.0.1:5001/api/data", help="'' to skip")
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent keep-alive devices")
+    parser.add_argument("--requests", type=int, default=5000, help="Total POSTs per server")
+    asyncio.run(main(parser.parse_args()))
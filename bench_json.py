@@ -0,0 +1,103 @@
+"""
+JSON Benchmark - Serialization cost of a 1000-row /api/history response
+Compares Flask's default (stdlib json) provider with fast_json.FastJSONProvider
+on rows shaped like RealDictCursor output (REAL -> float, TIMESTAMP -> datetime)
+and on dashboard-style rows that were pre-converted with float()/strftime
+
+    python bench_json.py --rows 1000 --repeat 200
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from fast_json import FastJSONProvider
+
+
+def history_rows(n: int) -> list:
+    start = datetime(2025, 11, 1)
+    return [
+        {
+            "id": 100000 + i,
+            "soil_temperature": 27.4,
+            "soil_moisture": 41.2,
+            "conductivity": 820,
+            "ph": 6.45,
+            "nitrogen": 45,
+            "phosphorus": 30,
+            "potassium": 120,
+            "salt": 210,
+            "air_temperature": 30.1,
+            "air_humidity": 72.0,
+            "is_raining": False,
+            "device_id": "default",
+            "timestamp": start + timedelta(seconds=10 * i),
+            "status": "pending",
+            "created_at": start + timedelta(seconds=10 * i, milliseconds=120),
+        }
+        for i in range(n)
+    ]
+
+
+def dashboard_rows(n: int) -> list:
+    # realtime-iot / soil-trend style rows: already float()/strftime converted
+    start = datetime(2025, 11, 1)
+    return [
+        {
+            "time": (start + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M'),
+            "temp": round(27.4 + i % 7 * 0.1, 1),
+            "moisture": round(41.2 + i % 5 * 0.1, 1),
+            "ph": 6.4,
+            "nitrogen": 45.0,
+            "phosphorus": 30.0,
+            "potassium": 120.0,
+        }
+        for i in range(n)
+    ]
+
+
+def time_dumps(provider, obj, repeat: int) -> float:
+    provider.dumps(obj)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        provider.dumps(obj)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main(rows: int, repeat: int) -> None:
+    app = Flask(__name__)
+    providers = {
+        "stdlib (Flask default)": DefaultJSONProvider(app),
+        "orjson (FastJSONProvider)": FastJSONProvider(app),
+    }
+    # DefaultJSONProvider has no NumPy support: compare with tolist() for it
+    features = np.random.default_rng(0).random((rows, 11))
+    payloads = {
+        f"/api/history ({rows} rows)": ({"count": rows, "data": history_rows(rows)}, None),
+        f"dashboard trend ({rows} rows)": ({"success": True, "data": dashboard_rows(rows)}, None),
+        f"NumPy matrix ({rows}x11)": ({"data": features}, {"data": features.tolist()}),
+    }
+
+    print(f"{'payload':<28} {'provider':<27} {'ms/response':>12} {'KB':>8}")
+    print("-" * 80)
+    for label, (obj, stdlib_obj) in payloads.items():
+        baseline = None
+        for name, provider in providers.items():
+            payload = stdlib_obj if stdlib_obj is not None and isinstance(provider, DefaultJSONProvider) else obj
+            ms = time_dumps(provider, payload, repeat)
+            size_kb = len(provider.dumps(payload).encode("utf-8")) / 1024
+            speedup = f"  ({baseline / ms:.1f}x)" if baseline else ""
+            baseline = baseline or ms
+            print(f"{label:<28} {name:<27} {ms:>12.3f} {size_kb:>8.1f}{speedup}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flask JSON provider serialization benchmark")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
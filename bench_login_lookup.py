@@ -0,0 +1,129 @@
+"""
+Login Lookup Check - Query plans of the login lookups on 1M synthetic users
+Inserts synthetic users inside a transaction, runs EXPLAIN ANALYZE on the
+exact SQL used by auth_routes.py (email, phone and passkey lookups) plus the
+old `email = %s OR phone = %s` form for comparison, then rolls back
+
+Exits with status 1 when a login lookup does not use its unique index
+(e.g. migration 015 is missing or the SQL drifted from the index expression)
+
+    python bench_login_lookup.py --users 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+from auth_routes import LOGIN_USER_COLUMNS, login_lookup_sql
+
+PASSKEY_LOOKUP_SQL = f"SELECT {LOGIN_USER_COLUMNS} FROM users WHERE passkey_credential_id = %s"
+OLD_LOOKUP_SQL = f"SELECT {LOGIN_USER_COLUMNS} FROM users WHERE email = %s OR phone = %s"
+
+
+def synthetic_phone(i: int) -> str:
+    # '00' prefix: valid for check_phone_format, never a real subscriber number
+    return f"00{i:09d}"
+
+
+def insert_users(cur, n: int) -> None:
+    cur.execute("""
+        INSERT INTO users (full_name, phone, email, passkey_credential_id, pin_hash, is_active)
+        SELECT
+            'Bench User ' || i,
+            '00' || lpad(i::text, 9, '0'),
+            'Bench.User' || i || '@bench.invalid',
+            CASE WHEN i % 2 = 0 THEN 'bench-credential-' || i END,
+            '$2b$12$benchbenchbenchbenchbenchbenchbenchbenchbenchbenchbe',
+            TRUE
+        FROM generate_series(1, %s) AS i
+    """, (n,))
+    cur.execute("ANALYZE users")
+
+
+def explain(cur, sql: str, params: tuple) -> dict:
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    result = cur.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def describe(plan: dict) -> str:
+    parts = []
+    for node in plan_nodes(plan):
+        name = node['Node Type']
+        if node.get('Index Name'):
+            name += f" on {node['Index Name']}"
+        parts.append(name)
+    return ' -> '.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv('PGHOST'),
+        port=os.getenv('PGPORT'),
+        database=os.getenv('PGDATABASE'),
+        user=os.getenv('PGUSER'),
+        password=os.getenv('PGPASSWORD')
+    )
+    probe = args.users // 2
+    email = f"bench.user{probe}@bench.invalid"  # different case from the stored value
+    phone = synthetic_phone(probe)
+
+    checks = [
+        ('email', login_lookup_sql(email), (email,), 'uq_users_email_lower'),
+        ('phone', login_lookup_sql(phone), (phone,), 'uq_users_phone_canonical'),
+        ('passkey', PASSKEY_LOOKUP_SQL, (f"bench-credential-{probe}",), 'users_passkey_credential_id_key'),
+    ]
+
+    failures = 0
+    try:
+        with conn.cursor() as cur:
+            print(f"Inserting {args.users:,} synthetic users (rolled back afterwards)...")
+            insert_users(cur, args.users)
+
+            print(f"{'lookup':<10} {'ms':>9}  plan")
+            for name, sql, params, index_name in checks:
+                result = explain(cur, sql, params)
+                plan = result['Plan']
+                uses_index = any(
+                    node['Node Type'] in ('Index Scan', 'Index Only Scan')
+                    and node.get('Index Name') == index_name
+                    for node in plan_nodes(plan)
+                )
+                found = plan.get('Actual Rows', 0) == 1
+                ok = uses_index and found
+                failures += not ok
+                print(f"{name:<10} {result['Execution Time']:>9.3f}  {describe(plan)}"
+                      f"{'' if ok else f'  ❌ expected {index_name}, 1 row'}")
+
+            result = explain(cur, OLD_LOOKUP_SQL, (phone, phone))
+            print(f"{'old OR':<10} {result['Execution Time']:>9.3f}  {describe(result['Plan'])}")
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if failures:
+        print(f"❌ {failures} login lookup(s) not using their index")
+        sys.exit(1)
+    print("✅ All login lookups use their unique index")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Cache Utilities - In-process TTL cache, single-flight and conditional GET helpers
+Shared by the Flask blueprints so identical requests from many clients
+collapse into one DB query per data version
+"""
+
+from flask import request, make_response
+from functools import wraps
+import hashlib
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Small thread-safe key/value cache with per-entry expiry
+
+    Entries past their TTL are treated as missing; when the cache is full the
+    entry closest to expiry is evicted.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl_seconds: float = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution
+
+    The first caller for a key runs func; callers arriving while it runs
+    wait and get the same result (or the same exception). Nothing is kept
+    once the call finishes, so later requests compute fresh data.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared_total = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared_total += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def conditional_cached(version_func, cache: TTLCache):
+    """
+    Decorator for GET views whose output only changes with a data version
+
+    version_func() returns (version, last_modified). The response body is
+    cached per (path, query string, version), tagged with a strong ETag and
+    Last-Modified, and turned into 304 Not Modified when the client already
+    has it. Only 200 responses are cached; concurrent misses for the same
+    key share one run of the view (single-flight).
+    """
+    flight = SingleFlight()
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version, last_modified = version_func()
+            except Exception as e:
+                # Version lookup failed: serve uncached rather than fail the request
+                print(f"⚠️ Cache version lookup failed: {e}")
+                return view(*args, **kwargs)
+
+            cache_key = (request.path, tuple(sorted(request.args.items(multi=True))), version)
+            etag = hashlib.sha1(repr(cache_key).encode('utf-8')).hexdigest()
+
+            def render():
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code == 200:
+                    cache.set(cache_key, (resp.get_data(), resp.mimetype))
+                # Plain data: every waiting request builds its own response
+                return resp.get_data(), resp.status_code, list(resp.headers.items())
+
+            cached = cache.get(cache_key)
+            if cached is not None:
+                body, mimetype = cached
+                resp = make_response(body, 200)
+                resp.mimetype = mimetype
+            else:
+                body, status, headers = flight.do(cache_key, render)
+                resp = make_response(body, status, headers)
+                if resp.status_code != 200:
+                    return resp
+
+            resp.set_etag(etag)
+            if last_modified is not None:
+                resp.last_modified = last_modified
+            resp.cache_control.public = True
+            resp.cache_control.max_age = 0
+            resp.cache_control.must_revalidate = True
+            return resp.make_conditional(request)
+
+        return wrapper
+    return decorator
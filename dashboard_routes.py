@@ -9,10 +9,23 @@ import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from cache_utils import TTLCache, conditional_cached
+from ingest_common import device_filter
+from response_format import compressed, shape_rows
+
 load_dotenv('.env')
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
 
+# Seconds a computed response is kept for an unchanged data version
+CACHE_TTL_SECONDS = float(os.getenv('DASHBOARD_CACHE_TTL', '300'))
+
+# Seconds the data version is reused before asking the DB again
+VERSION_TTL_SECONDS = float(os.getenv('DASHBOARD_VERSION_TTL', '5'))
+
+_response_cache = TTLCache(CACHE_TTL_SECONDS)
+_version_cache = TTLCache(VERSION_TTL_SECONDS, max_entries=1)
+
 # Database connection helper
 def get_db_connection():
     return psycopg2.connect(
@@ -24,7 +37,45 @@ def get_db_connection():
     )
 
 
+def get_data_version():
+    """
+    Returns (latest sensor_readings.id, latest daily_insights.updated_at)
+
+    MAX(id) is a primary-key index probe and daily_insights holds one row per
+    day, so this is far cheaper than the aggregates it guards.
+    """
+    version = _version_cache.get('data_version')
+    if version is None:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT
+                (SELECT MAX(id) FROM sensor_readings),
+                (SELECT MAX(updated_at) FROM daily_insights)
+        """)
+        version = cur.fetchone()
+        cur.close()
+        conn.close()
+        _version_cache.set('data_version', version)
+    return version
+
+
+def overview_version():
+    """Overview depends on both tables and on the sliding 30-day window"""
+    latest_reading_id, insights_updated_at = get_data_version()
+    today = datetime.utcnow().date().isoformat()
+    return (today, latest_reading_id, insights_updated_at), insights_updated_at
+
+
+def insights_version():
+    """AI history and soil trend only read daily_insights"""
+    _, insights_updated_at = get_data_version()
+    today = datetime.utcnow().date().isoformat()
+    return (today, insights_updated_at), insights_updated_at
+
+
 @dashboard_bp.route('/overview', methods=['GET'])
+@conditional_cached(overview_version, _response_cache)
 def get_overview():
     """
     GET /api/dashboard/overview
@@ -52,38 +103,44 @@ def get_overview():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Query 1: Daily insights stats
+        # Single round trip: insight stats + reading count from the per-device
+        # daily rollup (migration 019), so the count is O(days) instead of O(rows)
         cur.execute("""
+            WITH insights AS (
+                SELECT 
+                    AVG(soil_health_score) as avg_health,
+                    COUNT(id) as total_insights,
+                    COUNT(CASE WHEN blockchain_status = 'confirmed' THEN 1 END) as verified_count,
+                    COUNT(CASE WHEN has_anomaly = TRUE THEN 1 END) as anomaly_count
+                FROM daily_insights
+                WHERE date_vn >= CURRENT_DATE - INTERVAL '30 days'
+            ),
+            iot AS (
+                SELECT COALESCE(SUM(reading_count), 0) as total_iot
+                FROM sensor_daily_stats
+                WHERE date_vn >= CURRENT_DATE - INTERVAL '30 days'
+            )
             SELECT 
-                AVG(soil_health_score) as avg_health,
-                COUNT(id) as total_insights,
-                COUNT(CASE WHEN blockchain_status = 'confirmed' THEN 1 END) as verified_count,
-                COUNT(CASE WHEN has_anomaly = TRUE THEN 1 END) as anomaly_count
-            FROM daily_insights
-            WHERE date_vn >= CURRENT_DATE - INTERVAL '30 days'
+                insights.avg_health,
+                insights.total_insights,
+                insights.verified_count,
+                insights.anomaly_count,
+                iot.total_iot
+            FROM insights, iot
         """)
         
-        insights_row = cur.fetchone()
-        
-        # Query 2: Total IoT records
-        cur.execute("""
-            SELECT COUNT(*) as total_iot
-            FROM sensor_readings
-            WHERE measured_at_vn >= NOW() - INTERVAL '30 days'
-        """)
-        
-        iot_row = cur.fetchone()
+        row = cur.fetchone()
         
         cur.close()
         conn.close()
         
         # Build response
         stats = {
-            "avg_soil_health": round(float(insights_row[0] or 0), 1),
-            "total_iot_records": int(iot_row[0] or 0),
-            "verified_daily_insights": int(insights_row[2] or 0),
-            "total_daily_insights": int(insights_row[1] or 0),
-            "anomalies_detected": int(insights_row[3] or 0),
+            "avg_soil_health": round(float(row[0] or 0), 1),
+            "total_iot_records": int(row[4] or 0),
+            "verified_daily_insights": int(row[2] or 0),
+            "total_daily_insights": int(row[1] or 0),
+            "anomalies_detected": int(row[3] or 0),
             "last_updated": datetime.utcnow().isoformat() + 'Z'
         }
         
@@ -102,14 +159,16 @@ def get_overview():
 
 
 @dashboard_bp.route('/realtime-iot', methods=['GET'])
+@compressed
 def get_realtime_iot():
     """
-    GET /api/dashboard/realtime-iot?hours=24
+    GET /api/dashboard/realtime-iot?hours=24&device_id=node-01
     
     Returns latest IoT sensor reading + 24h trend
     
     Query params:
     - hours: Number of hours to look back (default: 24)
+    - device_id: Only this device (default: all devices)
     
     Returns:
     {
@@ -135,6 +194,7 @@ def get_realtime_iot():
     """
     try:
         hours = int(request.args.get('hours', 24))
+        device_id = request.args.get('device_id')
         
         conn = get_db_connection()
         cur = conn.cursor()
@@ -154,11 +214,13 @@ def get_realtime_iot():
                 air_humidity_pct,
                 is_raining,
                 onchain_status,
-                conductivity_us_cm
+                conductivity_us_cm,
+                device_id
             FROM sensor_readings
+            """ + device_filter(device_id)[0] + """
             ORDER BY measured_at_vn DESC
             LIMIT 1
-        """)
+        """, device_filter(device_id)[1])
         
         latest_row = cur.fetchone()
         
@@ -184,7 +246,8 @@ def get_realtime_iot():
             "air_humidity_pct": float(latest_row[9]) if latest_row[9] is not None else 0,
             "is_raining": bool(latest_row[10]),
             "onchain_status": latest_row[11],
-            "conductivity_us_cm": float(latest_row[12]) if latest_row[12] is not None else 0
+            "conductivity_us_cm": float(latest_row[12]) if latest_row[12] is not None else 0,
+            "device_id": latest_row[13]
         }
         
         # Query 2: Hourly trend for last N hours
@@ -199,9 +262,10 @@ def get_realtime_iot():
                 AVG(potassium_mg_kg) as avg_k
             FROM sensor_readings
             WHERE measured_at_vn >= NOW() - INTERVAL '%s hours'
+            """ + device_filter(device_id, 'AND')[0] + """
             GROUP BY hour
             ORDER BY hour ASC
-        """, (hours,))
+        """, (hours,) + device_filter(device_id)[1])
         
         trend_rows = cur.fetchall()
         
@@ -209,7 +273,7 @@ def get_realtime_iot():
         trend_24h = []
         for row in trend_rows:
             trend_24h.append({
-                "time": row[0].strftime('%Y-%m-%d %H:%M') if row[0] else None,
+                "time": row[0],
                 "temp": round(float(row[1] or 0), 1),
                 "moisture": round(float(row[2] or 0), 1),
                 "ph": round(float(row[3] or 0), 1),
@@ -224,8 +288,9 @@ def get_realtime_iot():
         return jsonify({
             "success": True,
             "latest": latest,
-            "trend_24h": trend_24h,
-            "hours": hours
+            "trend_24h": shape_rows(trend_24h, "time", {"time": '%Y-%m-%d %H:%M'}),
+            "hours": hours,
+            "device_id": device_id
         }), 200
         
     except Exception as e:
@@ -237,14 +302,17 @@ def get_realtime_iot():
 
 
 @dashboard_bp.route('/ai-history', methods=['GET'])
+@compressed
+@conditional_cached(insights_version, _response_cache)
 def get_ai_history():
     """
-    GET /api/dashboard/ai-history?days=30
+    GET /api/dashboard/ai-history?days=30&device_id=node-01
     
     Returns daily AI insights for last N days
     
     Query params:
     - days: Number of days to look back (default: 30)
+    - device_id: Only this device (default: all devices)
     
     Returns:
     {
@@ -269,6 +337,7 @@ def get_ai_history():
     """
     try:
         days = int(request.args.get('days', 30))
+        device_id = request.args.get('device_id')
         
         conn = get_db_connection()
         cur = conn.cursor()
@@ -288,11 +357,13 @@ def get_ai_history():
                 blockchain_pushed_at,
                 recommendations_json,
                 total_readings,
-                created_at
+                created_at,
+                device_id
             FROM daily_insights
             WHERE date_vn >= CURRENT_DATE - INTERVAL '%s days'
+            """ + device_filter(device_id, 'AND')[0] + """
             ORDER BY date_vn DESC
-        """, (days,))
+        """, (days,) + device_filter(device_id)[1])
         
         rows = cur.fetchall()
         
@@ -301,7 +372,7 @@ def get_ai_history():
         for row in rows:
             insights.append({
                 "id": row[0],
-                "date": row[1].strftime('%Y-%m-%d') if row[1] else None,
+                "date": row[1],
                 "recommended_crop": row[2],
                 "confidence": int(row[3] or 0),
                 "soil_health_score": int(row[4] or 0),
@@ -309,10 +380,11 @@ def get_ai_history():
                 "is_anomaly_detected": bool(row[6]),
                 "blockchain_status": row[7],
                 "blockchain_tx_hash": row[8],
-                "blockchain_pushed_at": row[9].strftime('%Y-%m-%d %H:%M:%S') if row[9] else None,
+                "blockchain_pushed_at": row[9],
                 "recommendations": row[10],  # JSON string
                 "sample_count": int(row[11] or 0),
-                "created_at": row[12].strftime('%Y-%m-%d %H:%M:%S') if row[12] else None
+                "created_at": row[12],
+                "device_id": row[13]
             })
         
         cur.close()
@@ -320,7 +392,11 @@ def get_ai_history():
         
         return jsonify({
             "success": True,
-            "insights": insights,
+            "insights": shape_rows(insights, "date", {
+                "date": '%Y-%m-%d',
+                "blockchain_pushed_at": '%Y-%m-%d %H:%M:%S',
+                "created_at": '%Y-%m-%d %H:%M:%S'
+            }),
             "total": len(insights),
             "days": days
         }), 200
@@ -334,14 +410,17 @@ def get_ai_history():
 
 
 @dashboard_bp.route('/soil-trend', methods=['GET'])
+@compressed
+@conditional_cached(insights_version, _response_cache)
 def get_soil_trend():
     """
-    GET /api/dashboard/soil-trend?days=30
+    GET /api/dashboard/soil-trend?days=30&device_id=node-01
     
     Returns soil health score trend for charting
     
     Query params:
     - days: Number of days to look back (default: 30)
+    - device_id: Only this device (default: all devices)
     
     Returns:
     {
@@ -355,6 +434,7 @@ def get_soil_trend():
     """
     try:
         days = int(request.args.get('days', 30))
+        device_id = request.args.get('device_id')
         
         conn = get_db_connection()
         cur = conn.cursor()
@@ -364,11 +444,13 @@ def get_soil_trend():
             SELECT 
                 date_vn,
                 soil_health_score,
-                soil_health_rating
+                soil_health_rating,
+                device_id
             FROM daily_insights
             WHERE date_vn >= CURRENT_DATE - INTERVAL '%s days'
+            """ + device_filter(device_id, 'AND')[0] + """
             ORDER BY date_vn ASC
-        """, (days,))
+        """, (days,) + device_filter(device_id)[1])
         
         rows = cur.fetchall()
         
@@ -376,9 +458,10 @@ def get_soil_trend():
         trend = []
         for row in rows:
             trend.append({
-                "date": row[0].strftime('%Y-%m-%d') if row[0] else None,
+                "date": row[0],
                 "score": int(row[1] or 0),
-                "rating": row[2]
+                "rating": row[2],
+                "device_id": row[3]
             })
         
         cur.close()
@@ -386,7 +469,7 @@ def get_soil_trend():
         
         return jsonify({
             "success": True,
-            "trend": trend,
+            "trend": shape_rows(trend, "date", {"date": '%Y-%m-%d'}),
             "days": days
         }), 200
         
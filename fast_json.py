@@ -0,0 +1,76 @@
+"""
+Fast JSON - orjson-backed serialization for the Flask app
+Replaces Flask's stdlib JSON provider so jsonify() and request.get_json()
+go through orjson, with NumPy arrays/scalars serialized natively
+
+Wire format stays the same as Flask's default provider:
+datetime/date -> HTTP date string, Decimal -> string.
+"""
+
+import decimal
+from datetime import date, datetime, timezone
+
+import orjson
+from flask.json.provider import JSONProvider
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+OPTIONS = (
+    orjson.OPT_SERIALIZE_NUMPY
+    | orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+
+def http_date(value: date) -> str:
+    """Same output as werkzeug.http.http_date, without its email.utils round trip"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+    else:
+        value = datetime(value.year, value.month, value.day)
+    return (
+        f"{_WEEKDAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} "
+        f"{value.year:04d} {value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT"
+    )
+
+
+def _default(obj):
+    # Types orjson hands back (same conversions as flask.json.provider._default)
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj) -> bytes:
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+
+def dumps(obj) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(s):
+    return orjson.loads(s)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider using orjson (app.json = FastJSONProvider(app))"""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Encode straight to bytes, skipping the str round trip
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
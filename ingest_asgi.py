@@ -0,0 +1,522 @@
+"""
+Ingest ASGI - Async ingest server for large device fleets
+Same /api/data, /api/latest, /api/history contract as app_ingest.py, served
+by uvicorn on one event loop with an asyncpg connection pool, so thousands
+of keep-alive device connections cost a coroutine each instead of a thread
+
+Run:
+    uvicorn ingest_asgi:app --host 0.0.0.0 --port 5001 --workers 2
+
+Dashboard, auth and realtime (SSE) routes stay on the Flask app; readings
+inserted here still emit pg_notify, so SSE subscribers see them, and are
+scored by the anomaly stream when ANOMALY_STREAM_ENABLED (its flag UPDATEs
+use a short-lived psycopg2 connection from the stream's thread).
+"""
+
+import asyncio
+import json
+import math
+import os
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from datetime import date, datetime
+
+import asyncpg
+import psycopg2
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+load_dotenv()
+
+import ai_inference
+from anomaly_stream import ANOMALY_STREAM_ENABLED, AnomalyStream
+from fast_json import http_date
+from ingest_common import READING_COLUMNS, ReadingValidationError, parse_reading, reading_event
+from ingest_spool import IngestSpool, SPOOL_DIR
+from reading_codec import CONTENT_TYPE as FRAME_CONTENT_TYPE, FrameDecodeError, decode_frame
+from rate_limit import (
+    INGEST_MAX_IN_FLIGHT,
+    INGEST_RATE_BURST,
+    INGEST_RATE_PER_SEC,
+    InFlightLimiter,
+    TokenBucketLimiter,
+    forwarded_client_ip,
+)
+from realtime_routes import NOTIFY_CHANNEL
+from service_client import get_service, service_metrics
+
+# Pool size per worker process (connections are shared by all in-flight requests)
+POOL_MIN_SIZE = int(os.getenv("INGEST_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("INGEST_POOL_MAX_SIZE", "20"))
+
+# Upper bound for any single query on a pooled connection (reads, spool replay)
+POOL_COMMAND_TIMEOUT = float(os.getenv("INGEST_POOL_COMMAND_TIMEOUT", "10"))
+
+# Same DB time budget as app_ingest.py; exceeding it spools the reading
+INGEST_DB_BUDGET_MS = int(os.getenv("INGEST_DB_BUDGET_MS", "2000"))
+
+# Errors meaning "DB slow or unreachable" -> spool instead of 500
+DB_UNAVAILABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.QueryCanceledError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.TooManyConnectionsError,
+)
+
+# measured_at_vn is bound as text and cast in SQL, so Postgres parses it
+# exactly as it does for the psycopg2 path in app_ingest.py
+_PLACEHOLDERS = [
+    f"(${i}::text)::timestamp" if column == "measured_at_vn" else f"${i}"
+    for i, column in enumerate(READING_COLUMNS, start=1)
+]
+
+INSERT_READING_SQL = f"""
+    INSERT INTO sensor_readings ({', '.join(READING_COLUMNS)})
+    VALUES ({', '.join(_PLACEHOLDERS)})
+    ON CONFLICT (device_id, measured_at_vn) DO NOTHING
+    RETURNING id, onchain_status
+"""
+
+# Multi-row insert in one statement: one array parameter per column,
+# expanded server-side by unnest (the asyncpg counterpart of execute_values)
+ARRAY_TYPES = {
+    "device_id": "text", "measured_at_vn": "text",
+    "soil_temperature_c": "float8", "soil_moisture_pct": "float8",
+    "conductivity_us_cm": "int4", "ph_value": "float8",
+    "nitrogen_mg_kg": "int4", "phosphorus_mg_kg": "int4",
+    "potassium_mg_kg": "int4", "salt_mg_l": "int4",
+    "air_temperature_c": "float8", "air_humidity_pct": "float8",
+    "is_raining": "bool",
+}
+_ARRAY_CASTS = {"text": str, "float8": float, "int4": int, "bool": bool}
+
+INSERT_READINGS_SQL = f"""
+    INSERT INTO sensor_readings ({', '.join(READING_COLUMNS)})
+    SELECT {', '.join('(r.measured_at_vn)::timestamp' if c == 'measured_at_vn' else f'r.{c}' for c in READING_COLUMNS)}
+    FROM unnest({', '.join(f'${i}::{ARRAY_TYPES[c]}[]' for i, c in enumerate(READING_COLUMNS, start=1))})
+        AS r({', '.join(READING_COLUMNS)})
+    ON CONFLICT (device_id, measured_at_vn) DO NOTHING
+    RETURNING device_id, to_char(measured_at_vn, 'YYYY-MM-DD HH24:MI:SS') AS measured_at_vn, onchain_status
+"""
+
+READING_SELECT = """
+    SELECT id,
+           soil_temperature_c as soil_temperature,
+           soil_moisture_pct as soil_moisture,
+           conductivity_us_cm as conductivity,
+           ph_value as ph,
+           nitrogen_mg_kg as nitrogen,
+           phosphorus_mg_kg as phosphorus,
+           potassium_mg_kg as potassium,
+           salt_mg_l as salt,
+           air_temperature_c as air_temperature,
+           air_humidity_pct as air_humidity,
+           is_raining,
+           device_id,
+"""
+
+
+def get_dsn() -> str:
+    dsn = os.getenv("DATABASE_URL")
+    if dsn:
+        return dsn
+    return "postgresql://{user}:{password}@{host}:{port}/{db}".format(
+        user=os.getenv("PGUSER", "admin"),
+        password=os.getenv("PGPASSWORD", "admin123"),
+        host=os.getenv("PGHOST", "36.50.134.107"),
+        port=os.getenv("PGPORT", "6000"),
+        db=os.getenv("PGDATABASE", "db_iot_sensor"),
+    )
+
+
+def to_json_value(value):
+    # Giữ nguyên định dạng JSON của Flask jsonify (datetime -> HTTP date, Decimal -> str)
+    if isinstance(value, datetime):
+        return http_date(value)
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def record_to_dict(record) -> dict:
+    return {k: to_json_value(v) for k, v in record.items()}
+
+
+def reading_values(reading: dict) -> tuple:
+    return tuple(reading[c] for c in READING_COLUMNS)
+
+
+def reading_arrays(readings: list) -> list:
+    """One typed list per column (INSERT_READINGS_SQL parameters)"""
+    return [
+        [_ARRAY_CASTS[ARRAY_TYPES[c]](r[c]) for r in readings]
+        for c in READING_COLUMNS
+    ]
+
+
+async def insert_readings_returning(conn, readings: list, notify: bool) -> list:
+    """
+    Insert readings in one statement; returns the newly inserted ones
+    (duplicates skipped by ON CONFLICT), optionally notifying realtime
+    dashboards of them in one more round trip
+    """
+    inserted = await conn.fetch(INSERT_READINGS_SQL, *reading_arrays(readings))
+    by_key = {(r["device_id"], r["measured_at_vn"]): r for r in readings}
+    new_readings = []
+    events = []
+    for row in inserted:
+        reading = by_key.get((row["device_id"], row["measured_at_vn"]))
+        if reading:
+            new_readings.append(reading)
+            events.append(json.dumps(reading_event(reading, row["onchain_status"]), default=str))
+    if notify and events:
+        # Delivered on commit, same as notify_new_reading in the Flask app
+        await conn.execute("SELECT pg_notify($1, e) FROM unnest($2::text[]) AS e", NOTIFY_CHANNEL, events)
+    return new_readings
+
+
+pool = None
+ingest_spool = None
+
+# Same ingest-time anomaly scoring as app_ingest.py (background thread)
+anomaly_stream = None
+if ANOMALY_STREAM_ENABLED:
+    anomaly_stream = AnomalyStream(ai_inference.anomaly_models, lambda: psycopg2.connect(get_dsn()))
+
+
+def record_inserted(readings: list) -> None:
+    """Hand newly inserted readings to the anomaly stream (after commit)"""
+    if readings and anomaly_stream is not None:
+        anomaly_stream.submit(readings)
+
+
+async def insert_readings_many(readings: list) -> int:
+    """Batch insert for spool replay; returns rows inserted (duplicates skipped)"""
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            inserted = await insert_readings_returning(conn, readings, notify=False)
+    record_inserted(inserted)
+    return len(inserted)
+
+
+def make_spool_inserter(loop):
+    # The spool drainer is a plain thread: run the batch on the server's loop
+    def insert_batch(readings: list) -> int:
+        future = asyncio.run_coroutine_threadsafe(insert_readings_many(readings), loop)
+        return future.result()
+    return insert_batch
+
+
+async def create_pool(min_size: int):
+    return await asyncpg.create_pool(
+        get_dsn(),
+        min_size=min_size,
+        max_size=POOL_MAX_SIZE,
+        timeout=max(1, INGEST_DB_BUDGET_MS / 1000),
+        command_timeout=POOL_COMMAND_TIMEOUT,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global pool, ingest_spool
+
+    try:
+        pool = await create_pool(POOL_MIN_SIZE)
+        print(f"✅ asyncpg pool ready ({POOL_MIN_SIZE}-{POOL_MAX_SIZE} connections)")
+    except DB_UNAVAILABLE_ERRORS as e:
+        # Start anyway: readings go to the spool, connections open on first use
+        pool = await create_pool(0)
+        print(f"⚠️ Postgres unavailable at startup ({e}); pool connects on demand")
+
+    if os.getenv("INGEST_SPOOL_ENABLED", "true").lower() == "true":
+        ingest_spool = IngestSpool(SPOOL_DIR, make_spool_inserter(asyncio.get_running_loop()))
+        ingest_spool.start()
+
+    yield
+
+    await pool.close()
+
+
+app = FastAPI(title="Pione Ingest (ASGI)", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+async def insert_reading(reading: dict):
+    """Insert within INGEST_DB_BUDGET_MS; returns (id, onchain_status) or None for duplicates"""
+    budget_s = INGEST_DB_BUDGET_MS / 1000
+    async with pool.acquire(timeout=budget_s) as conn:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL statement_timeout = {INGEST_DB_BUDGET_MS}")
+            inserted = await conn.fetchrow(INSERT_READING_SQL, *reading_values(reading))
+            if inserted:
+                # Delivered on commit, same as notify_new_reading in the Flask app
+                await conn.execute(
+                    "SELECT pg_notify($1, $2)",
+                    NOTIFY_CHANNEL,
+                    json.dumps(reading_event(reading, inserted["onchain_status"]), default=str),
+                )
+    if inserted:
+        record_inserted([reading])
+    return inserted
+
+
+async def insert_reading_frame(readings: list) -> int:
+    """Insert a decoded binary frame in one statement; returns rows inserted"""
+    budget_s = INGEST_DB_BUDGET_MS / 1000
+    async with pool.acquire(timeout=budget_s) as conn:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL statement_timeout = {INGEST_DB_BUDGET_MS}")
+            inserted = await insert_readings_returning(conn, readings, notify=True)
+    record_inserted(inserted)
+    return len(inserted)
+
+
+# Node bridge callback over a pooled keep-alive connection (circuit breaker)
+node_bridge = get_service("node_bridge")
+
+
+def call_bridge(bridge_url: str, limit: int = 1) -> dict:
+    resp = node_bridge.post_json(bridge_url, {"limit": limit})
+    return {"status": resp.status_code}
+
+
+# Admission control (in-memory buckets; same limits as the Flask server)
+ingest_limiter = TokenBucketLimiter(INGEST_RATE_PER_SEC, INGEST_RATE_BURST)
+ingest_in_flight = InFlightLimiter(INGEST_MAX_IN_FLIGHT)
+
+
+def client_key(request: Request, payload) -> str:
+    # Same keying as rate_limit.client_key: device id, else client IP
+    device_id = request.headers.get("x-device-id")
+    if not device_id and isinstance(payload, dict):
+        device_id = payload.get("device_id")
+    if device_id:
+        return f"device:{str(device_id).strip()[:64]}"
+    ip = forwarded_client_ip(
+        request.client.host if request.client else None,
+        request.headers.get("x-forwarded-for", ""),
+    )
+    return f"ip:{ip}"
+
+
+@app.post("/api/data")
+async def receive_data(request: Request):
+    payload = None
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            payload = await request.json()  # cached by Starlette for handle_data
+        except ValueError:
+            pass
+
+    wait = ingest_limiter.acquire(client_key(request, payload))
+    if wait > 0:
+        retry_after = max(1, math.ceil(wait))
+        return JSONResponse(
+            {"status": "error", "message": "Rate limit exceeded", "retry_after": retry_after},
+            status_code=429,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    if not ingest_in_flight.try_acquire():
+        return JSONResponse(
+            {"status": "error", "message": "Server busy, retry later"},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await handle_data(request)
+    finally:
+        ingest_in_flight.release()
+
+
+async def handle_data(request: Request):
+    try:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        if content_type in (FRAME_CONTENT_TYPE, "application/octet-stream"):
+            return await receive_frame(request)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+
+        try:
+            reading = parse_reading(data, request.headers)
+        except ReadingValidationError as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+        device_id = reading["device_id"]
+        measured_at_vn = reading["measured_at_vn"]
+
+        try:
+            await insert_reading(reading)
+        except DB_UNAVAILABLE_ERRORS as e:
+            if ingest_spool is None:
+                raise
+            # append() blocks until fsync -> keep it off the event loop
+            await run_in_threadpool(ingest_spool.append, reading)
+            print(f"⚠️ DB write failed or slow, reading spooled: {e}")
+            return JSONResponse({
+                "status": "spooled",
+                "device_id": device_id,
+                "measured_at_vn": measured_at_vn,
+            }, status_code=202)
+
+        # Tùy chọn: callback Node bridge
+        bridge_url = os.getenv("NODE_BRIDGE_URL")
+        bridge_result = None
+        if bridge_url:
+            try:
+                bridge_result = await run_in_threadpool(call_bridge, bridge_url)
+            except Exception as e:
+                bridge_result = {"error": str(e)}
+
+        return JSONResponse({
+            "status": "success",
+            "device_id": device_id,
+            "measured_at_vn": measured_at_vn,
+            "bridge": bridge_result,
+        })
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+async def receive_frame(request: Request):
+    """POST /api/data with a binary frame (reading_codec.py)"""
+    try:
+        readings = decode_frame(await request.body(), request.headers.get("x-device-id"))
+    except FrameDecodeError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+    device_id = readings[0]["device_id"]
+    measured_at_vn = readings[-1]["measured_at_vn"]
+
+    try:
+        inserted = await insert_reading_frame(readings)
+    except DB_UNAVAILABLE_ERRORS as e:
+        if ingest_spool is None:
+            raise
+        await run_in_threadpool(ingest_spool.append_many, readings)
+        print(f"⚠️ DB write failed or slow, {len(readings)} readings spooled: {e}")
+        return JSONResponse({
+            "status": "spooled",
+            "device_id": device_id,
+            "count": len(readings),
+            "measured_at_vn": measured_at_vn,
+        }, status_code=202)
+
+    bridge_url = os.getenv("NODE_BRIDGE_URL")
+    bridge_result = None
+    if bridge_url and inserted:
+        try:
+            bridge_result = await run_in_threadpool(call_bridge, bridge_url, inserted)
+        except Exception as e:
+            bridge_result = {"error": str(e)}
+
+    return JSONResponse({
+        "status": "success",
+        "device_id": device_id,
+        "count": len(readings),
+        "inserted": inserted,
+        "measured_at_vn": measured_at_vn,
+        "bridge": bridge_result,
+    })
+
+
+@app.get("/api/latest")
+async def api_latest(device_id: str | None = None):
+    try:
+        where_sql = "WHERE device_id = $1" if device_id else ""
+        params = (device_id,) if device_id else ()
+        async with pool.acquire() as conn:
+            record = await conn.fetchrow(
+                READING_SELECT + """
+                       measured_at_vn, created_at_vn, onchain_status
+                FROM sensor_readings
+                """ + where_sql + """
+                ORDER BY measured_at_vn DESC
+                LIMIT 1
+                """,
+                *params,
+            )
+        if not record:
+            return JSONResponse({"message": "no data"})
+        row = record_to_dict(record)
+        row["status"] = row.get("onchain_status") or "pending"
+        row["created_at"] = row.get("created_at_vn")
+        row["timestamp"] = row.get("measured_at_vn")
+        return JSONResponse(row)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/api/history")
+async def api_history(limit: int = 100, device_id: str | None = None):
+    try:
+        limit = min(limit, 1000)
+        where_sql = "WHERE device_id = $2" if device_id else ""
+        params = (limit, device_id) if device_id else (limit,)
+        async with pool.acquire() as conn:
+            records = await conn.fetch(
+                READING_SELECT + """
+                       measured_at_vn as timestamp,
+                       onchain_status as status,
+                       created_at_vn as created_at
+                FROM sensor_readings
+                """ + where_sql + """
+                ORDER BY measured_at_vn DESC
+                LIMIT $1
+                """,
+                *params,
+            )
+        rows = [record_to_dict(r) for r in records]
+        return JSONResponse({"count": len(rows), "data": rows})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/api/spool")
+async def api_spool():
+    if ingest_spool is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **ingest_spool.stats()})
+
+
+@app.get("/api/anomaly-stream")
+async def api_anomaly_stream():
+    if anomaly_stream is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **anomaly_stream.stats()})
+
+
+@app.get("/api/services")
+async def api_services():
+    return JSONResponse(service_metrics())
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "ingest_asgi:app",
+        host="0.0.0.0",
+        port=int(os.getenv("INGEST_ASGI_PORT", "5001")),
+        workers=int(os.getenv("INGEST_ASGI_WORKERS", "1")),
+        log_level="info",
+    )
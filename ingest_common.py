@@ -0,0 +1,150 @@
+"""
+Ingest Common - Payload parsing shared by the Flask (app_ingest.py) and
+ASGI (ingest_asgi.py) ingest servers, so both accept exactly the same
+/api/data contract
+"""
+
+import os
+from datetime import datetime, timezone, timedelta
+
+
+# Thiết bị cũ (esp8266_LTMMT.ino) không gửi device_id -> gán vào thiết bị mặc định
+DEFAULT_DEVICE_ID = os.getenv("DEFAULT_DEVICE_ID", "default")
+
+
+def resolve_device_id(payload: dict, headers) -> str:
+    # Ưu tiên device_id trong payload, sau đó header X-Device-Id
+    device_id = payload.get("device_id") or headers.get("X-Device-Id") or DEFAULT_DEVICE_ID
+    return str(device_id).strip()[:64] or DEFAULT_DEVICE_ID
+
+
+def device_filter(device_id: str | None, keyword: str = "WHERE") -> tuple[str, tuple]:
+    """SQL fragment restricting a query to one device (empty = all devices)"""
+    if not device_id:
+        return "", ()
+    return f"{keyword} device_id = %s", (device_id,)
+
+
+def normalize_measured_at_vn(payload: dict) -> str | None:
+    # Ưu tiên created_at dạng 'YYYY-MM-DD HH:MM:SS'
+    created_at = payload.get("created_at")
+    if isinstance(created_at, str) and len(created_at) >= 19:
+        return created_at[:19]
+
+    ts = payload.get("timestamp")
+    if ts is None:
+        # fallback: now VN
+        vn = datetime.now(timezone.utc) + timedelta(hours=7)
+        return vn.strftime("%Y-%m-%d %H:%M:%S")
+
+    if isinstance(ts, (int, float)):
+        dt_utc = datetime.fromtimestamp(ts, tz=timezone.utc)
+        vn = dt_utc + timedelta(hours=7)
+        return vn.strftime("%Y-%m-%d %H:%M:%S")
+
+    if isinstance(ts, str):
+        # Thử parse RFC1123/GMT của ESP: 'Sun, 05 Oct 2025 01:34:01 GMT'
+        try:
+            dt = datetime.strptime(ts, "%a, %d %b %Y %H:%M:%S GMT").replace(tzinfo=timezone.utc)
+            vn = dt + timedelta(hours=7)
+            return vn.strftime("%Y-%m-%d %H:%M:%S")
+        except Exception:
+            pass
+        # Nếu ts đã là 'YYYY-MM-DD HH:MM:SS' thì giữ nguyên
+        if len(ts) >= 19 and ts[4] == '-' and ts[7] == '-' and ts[13] == ':' and ts[16] == ':':
+            return ts[:19]
+
+    return None
+
+
+# Thứ tự cột khi ghi sensor_readings (dùng chung cho insert đơn lẻ và batch từ spool)
+READING_COLUMNS = (
+    "device_id", "measured_at_vn",
+    "soil_temperature_c", "soil_moisture_pct",
+    "conductivity_us_cm", "ph_value",
+    "nitrogen_mg_kg", "phosphorus_mg_kg", "potassium_mg_kg", "salt_mg_l",
+    "air_temperature_c", "air_humidity_pct", "is_raining",
+)
+
+
+# Trường bắt buộc trong payload ESP8266 (tên trong payload -> tên hiển thị khi thiếu)
+REQUIRED_FIELDS = {
+    "temperature": "soil_temperature",
+    "humidity": "soil_moisture",
+    "conductivity": "conductivity",
+    "ph": "ph",
+    "nitrogen": "nitrogen",
+    "phosphorus": "phosphorus",
+    "potassium": "potassium",
+    "salt": "salt",
+    "air_temperature": "air_temperature",
+    "air_humidity": "air_humidity",
+    "is_raining": "is_raining",
+}
+
+
+class ReadingValidationError(ValueError):
+    """Payload rejected with HTTP 400"""
+
+
+def parse_bool(value) -> bool:
+    # is_raining có thể là bool hoặc string "true"/"false"
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+
+def parse_reading(data: dict, headers) -> dict:
+    """
+    Validate an /api/data payload and build a sensor_readings row
+
+    Lưu ý: IoT field "temperature" = Soil Temperature,
+           IoT field "humidity" = Soil Moisture/Humidity
+
+    Raises ReadingValidationError for missing fields or a bad timestamp.
+    """
+    missing = [name for field, name in REQUIRED_FIELDS.items() if data.get(field) is None]
+    if missing:
+        raise ReadingValidationError(f"Missing required fields: {', '.join(missing)}")
+
+    measured_at_vn = normalize_measured_at_vn(data)
+    if not measured_at_vn:
+        raise ReadingValidationError("Invalid timestamp/created_at")
+
+    return {
+        "device_id": resolve_device_id(data, headers),
+        "measured_at_vn": measured_at_vn,
+        "soil_temperature_c": float(data["temperature"]),
+        "soil_moisture_pct": float(data["humidity"]),
+        "conductivity_us_cm": int(data["conductivity"]),
+        "ph_value": float(data["ph"]),
+        "nitrogen_mg_kg": int(data["nitrogen"]),
+        "phosphorus_mg_kg": int(data["phosphorus"]),
+        "potassium_mg_kg": int(data["potassium"]),
+        "salt_mg_l": int(data["salt"]),
+        "air_temperature_c": float(data["air_temperature"]),
+        "air_humidity_pct": float(data["air_humidity"]),
+        "is_raining": parse_bool(data["is_raining"]),
+    }
+
+
+def reading_event(reading: dict, onchain_status: str) -> dict:
+    """Realtime (SSE) payload for a freshly inserted reading"""
+    return {
+        "device_id": reading["device_id"],
+        "measured_at": reading["measured_at_vn"],
+        "soil_temperature_c": reading["soil_temperature_c"],
+        "soil_moisture_pct": reading["soil_moisture_pct"],
+        "ph_value": reading["ph_value"],
+        "nitrogen_mg_kg": float(reading["nitrogen_mg_kg"]),
+        "phosphorus_mg_kg": float(reading["phosphorus_mg_kg"]),
+        "potassium_mg_kg": float(reading["potassium_mg_kg"]),
+        "salt_mg_l": float(reading["salt_mg_l"]),
+        "air_temperature_c": reading["air_temperature_c"],
+        "air_humidity_pct": reading["air_humidity_pct"],
+        "is_raining": reading["is_raining"],
+        "onchain_status": onchain_status,
+        "conductivity_us_cm": float(reading["conductivity_us_cm"])
+    }
@@ -0,0 +1,247 @@
+"""
+Ingest Spool - Durable local buffer for /api/data when Postgres is slow or down
+Readings are appended to JSON-lines segment files with group-committed fsync
+and replayed into sensor_readings by a background drainer in large batches
+
+Segment lifecycle:
+    segment-<ns>-<pid>.open          active, being appended by one worker
+    segment-<ns>-<pid>.jsonl         sealed, ready to drain
+    segment-<ns>-<pid>.jsonl.draining-<pid>   claimed by a drainer
+
+Replays are idempotent (ON CONFLICT DO NOTHING in the insert callback), so a
+segment that is drained twice after a crash does not duplicate readings.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+
+# Directory holding spool segments (one per worker process at a time)
+SPOOL_DIR = os.getenv(
+    "INGEST_SPOOL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool")
+)
+
+# Group commit window: appends wait at most this long for a shared fsync
+FSYNC_INTERVAL_MS = float(os.getenv("INGEST_SPOOL_FSYNC_MS", "20"))
+
+# Seal the active segment once it reaches this size
+SEGMENT_MAX_BYTES = int(os.getenv("INGEST_SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+
+# Seconds between drain attempts
+DRAIN_INTERVAL_SECONDS = float(os.getenv("INGEST_SPOOL_DRAIN_INTERVAL", "5"))
+
+# Rows per INSERT batch when replaying
+DRAIN_BATCH_SIZE = int(os.getenv("INGEST_SPOOL_BATCH_SIZE", "500"))
+
+# Segments left .open/.draining by a dead worker are reclaimed after this
+STALE_CLAIM_SECONDS = 600
+
+# Max seconds an append waits for its fsync before reporting failure
+FSYNC_WAIT_TIMEOUT_SECONDS = 5
+
+
+class IngestSpool:
+    """
+    Append-only disk spool with a background fsync flusher and drainer
+
+    insert_batch(rows) must write a list of reading dicts to the database in
+    one transaction and raise on failure; the segment is then kept and
+    retried on the next drain pass.
+    """
+
+    def __init__(self, directory: str, insert_batch):
+        self.directory = directory
+        self.insert_batch = insert_batch
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._file = None
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._flusher = None
+        self._drainer = None
+
+        self.spooled_total = 0
+        self.drained_total = 0
+        self.last_drain_error = None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def append(self, reading: dict) -> None:
+        """Append one reading and return once it has been fsynced to disk"""
+        self.append_many([reading])
+
+    def append_many(self, readings: list) -> None:
+        """Append several readings sharing one fsync (e.g. a binary frame)"""
+        data = "".join(json.dumps(r, default=str) + "\n" for r in readings).encode("utf-8")
+
+        with self._cond:
+            self._start_threads_locked()
+            if self._file is None:
+                self._open_segment_locked()
+
+            self._file.write(data)
+            self._segment_bytes += len(data)
+            self._written_seq += 1
+            seq = self._written_seq
+            self.spooled_total += len(readings)
+            self._cond.notify_all()
+
+            deadline = time.monotonic() + FSYNC_WAIT_TIMEOUT_SECONDS
+            while self._synced_seq < seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise IOError("Spool fsync timed out")
+                self._cond.wait(remaining)
+
+            if self._segment_bytes >= SEGMENT_MAX_BYTES:
+                self._seal_segment_locked()
+
+    def pending_segments(self) -> int:
+        return len(glob.glob(os.path.join(self.directory, "segment-*")))
+
+    def stats(self) -> dict:
+        return {
+            "spooled_total": self.spooled_total,
+            "drained_total": self.drained_total,
+            "pending_segments": self.pending_segments(),
+            "last_drain_error": self.last_drain_error
+        }
+
+    def _open_segment_locked(self) -> None:
+        name = f"segment-{time.time_ns()}-{os.getpid()}.open"
+        self._segment_path = os.path.join(self.directory, name)
+        self._file = open(self._segment_path, "ab")
+        self._segment_bytes = 0
+
+    def _sync_locked(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._synced_seq = self._written_seq
+        self._cond.notify_all()
+
+    def _seal_segment_locked(self) -> None:
+        if self._file is None:
+            return
+        self._sync_locked()
+        self._file.close()
+        os.rename(self._segment_path, self._segment_path[:-len(".open")] + ".jsonl")
+        self._file = None
+        self._segment_path = None
+        self._segment_bytes = 0
+
+    def _flush_forever(self) -> None:
+        while True:
+            with self._cond:
+                while self._synced_seq == self._written_seq:
+                    self._cond.wait()
+
+            # Let concurrent appends join this fsync
+            time.sleep(FSYNC_INTERVAL_MS / 1000)
+
+            with self._cond:
+                try:
+                    self._sync_locked()
+                except Exception as e:
+                    print(f"❌ Spool fsync error: {e}")
+
+    # ------------------------------------------------------------------
+    # Draining
+    # ------------------------------------------------------------------
+
+    def _start_threads_locked(self) -> None:
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_forever, name="spool-flusher", daemon=True)
+            self._flusher.start()
+        if self._drainer is None or not self._drainer.is_alive():
+            self._drainer = threading.Thread(target=self._drain_forever, name="spool-drainer", daemon=True)
+            self._drainer.start()
+
+    def start(self) -> None:
+        """Start background threads (also done lazily on first append)"""
+        with self._cond:
+            self._start_threads_locked()
+
+    def _drain_forever(self) -> None:
+        while True:
+            time.sleep(DRAIN_INTERVAL_SECONDS)
+            try:
+                self.drain_once()
+                self.last_drain_error = None
+            except Exception as e:
+                self.last_drain_error = str(e)
+                print(f"⚠️ Spool drain deferred: {e}")
+
+    def drain_once(self) -> int:
+        """Replay every claimable segment; returns number of rows replayed"""
+        # Seal our own active segment so it becomes drainable
+        with self._cond:
+            if self._segment_bytes > 0:
+                self._seal_segment_locked()
+
+        replayed = 0
+        for path in self._claimable_segments():
+            claimed = self._claim(path)
+            if claimed is None:
+                continue
+
+            rows = self._read_segment(claimed)
+            for start in range(0, len(rows), DRAIN_BATCH_SIZE):
+                self.insert_batch(rows[start:start + DRAIN_BATCH_SIZE])
+
+            os.remove(claimed)
+            replayed += len(rows)
+            self.drained_total += len(rows)
+            print(f"✅ Spool drained {len(rows)} readings from {os.path.basename(path)}")
+
+        return replayed
+
+    def _claimable_segments(self) -> list:
+        pid = os.getpid()
+        now = time.time()
+        with self._cond:
+            active = self._segment_path
+
+        candidates = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "segment-*"))):
+            if path == active:
+                continue
+            if path.endswith(".jsonl") or path.endswith(f".draining-{pid}"):
+                candidates.append(path)
+            elif now - os.path.getmtime(path) > STALE_CLAIM_SECONDS:
+                # .open or .draining left behind by a worker that died
+                candidates.append(path)
+        return candidates
+
+    def _claim(self, path: str):
+        suffix = f".draining-{os.getpid()}"
+        if path.endswith(suffix):
+            return path
+        base = path.split(".draining-")[0]
+        claimed = base + suffix
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            # Another worker claimed it first
+            return None
+        return claimed
+
+    def _read_segment(self, path: str) -> list:
+        rows = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # Torn final line from a crash mid-write: never acknowledged
+                    continue
+        return rows
@@ -0,0 +1,125 @@
+"""
+Login Activity - Coalesced writes of login timestamps and passkey counters
+Logins record into memory; a background thread writes every pending user
+in one UPDATE ... FROM (VALUES ...) per LOGIN_FLUSH_INTERVAL_SECONDS, so
+login traffic no longer costs one users-row write per request
+
+Timestamps are taken at login time (Vietnam wall clock) and written later,
+so last_login_at_vn stays exact; it only becomes visible up to one flush
+interval late. Pending entries are flushed at process exit.
+"""
+
+import atexit
+import threading
+from datetime import datetime, timezone, timedelta
+
+from psycopg2.extras import execute_values
+
+# Giờ Việt Nam (UTC+7), giống NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh'
+VN_TZ = timezone(timedelta(hours=7))
+
+
+def now_vn() -> datetime:
+    return datetime.now(VN_TZ).replace(tzinfo=None)
+
+
+class LoginActivityWriter:
+    """
+    Buffers per-user login activity and flushes it in batches
+
+    on_flush(user_ids) is called after each successful flush (used to
+    invalidate cached profiles).
+    """
+
+    def __init__(self, get_connection, interval_seconds: float, on_flush=None):
+        self.get_connection = get_connection
+        self.interval_seconds = interval_seconds
+        self.on_flush = on_flush
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self.flushed_total = 0
+        self.last_flush_error = None
+
+    def record_login(self, user_id: int, passkey: bool = False) -> None:
+        at = now_vn()
+        with self._lock:
+            entry = self._pending.setdefault(user_id, {
+                'last_login': at,
+                'passkey_last_used': None,
+                'passkey_uses': 0,
+            })
+            entry['last_login'] = at
+            if passkey:
+                entry['passkey_last_used'] = at
+                entry['passkey_uses'] += 1
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._flush_forever, name='login-activity', daemon=True)
+                self._thread.start()
+
+    def flush(self) -> int:
+        """Write all pending activity in one statement; returns users written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        rows = [
+            (user_id, e['last_login'], e['passkey_last_used'], e['passkey_uses'])
+            for user_id, e in pending.items()
+        ]
+        try:
+            conn = self.get_connection()
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        UPDATE users AS u
+                        SET last_login_at_vn = GREATEST(u.last_login_at_vn, v.last_login),
+                            passkey_last_used_at_vn = COALESCE(v.passkey_last_used, u.passkey_last_used_at_vn),
+                            passkey_counter = COALESCE(u.passkey_counter, 0) + v.passkey_uses,
+                            updated_at_vn = NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh'
+                        FROM (VALUES %s) AS v (id, last_login, passkey_last_used, passkey_uses)
+                        WHERE u.id = v.id
+                    """, rows, template="(%s, %s::timestamp, %s::timestamp, %s)", page_size=len(rows))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception:
+            # Put activity back (newer logins recorded meanwhile win)
+            with self._lock:
+                for user_id, e in pending.items():
+                    current = self._pending.get(user_id)
+                    if current is None:
+                        self._pending[user_id] = e
+                    else:
+                        current['passkey_uses'] += e['passkey_uses']
+                        current['passkey_last_used'] = current['passkey_last_used'] or e['passkey_last_used']
+            raise
+
+        self.flushed_total += len(rows)
+        if self.on_flush:
+            self.on_flush(list(pending))
+        return len(rows)
+
+    def _flush_forever(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self.last_flush_error = None
+            except Exception as e:
+                self.last_flush_error = str(e)
+                print(f"⚠️ Login activity flush deferred: {e}")
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"❌ Login activity lost on shutdown: {e}")
+
+    def register_atexit(self) -> None:
+        atexit.register(self.close)
@@ -0,0 +1,52 @@
+-- Migration 011: Add per-day reading counters for sensor_readings
+-- Date: 2025-11-12
+-- Purpose: Let the dashboard overview read total IoT records from O(days)
+--          rollup rows instead of COUNT(*) over 30 days of raw readings
+
+CREATE TABLE IF NOT EXISTS sensor_readings_daily (
+    date_vn DATE PRIMARY KEY,
+    reading_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Backfill from existing readings
+INSERT INTO sensor_readings_daily (date_vn, reading_count)
+SELECT measured_at_vn::DATE, COUNT(*)
+FROM sensor_readings
+GROUP BY measured_at_vn::DATE
+ON CONFLICT (date_vn) DO UPDATE SET
+    reading_count = EXCLUDED.reading_count,
+    updated_at = NOW();
+
+-- Statement-level trigger: one upsert per day touched by an INSERT,
+-- so batched inserts cost one counter update instead of one per row
+CREATE OR REPLACE FUNCTION sensor_readings_daily_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_readings_daily (date_vn, reading_count)
+    SELECT measured_at_vn::DATE, COUNT(*)
+    FROM new_rows
+    GROUP BY measured_at_vn::DATE
+    ON CONFLICT (date_vn) DO UPDATE SET
+        reading_count = sensor_readings_daily.reading_count + EXCLUDED.reading_count,
+        updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_sensor_readings_daily_count ON sensor_readings;
+CREATE TRIGGER trigger_sensor_readings_daily_count
+    AFTER INSERT ON sensor_readings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sensor_readings_daily_count();
+
+-- Comments
+COMMENT ON TABLE sensor_readings_daily IS 'Per-day sensor reading counters maintained on insert (dashboard overview)';
+COMMENT ON COLUMN sensor_readings_daily.reading_count IS 'Number of rows inserted into sensor_readings for this date';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 011 completed: Added sensor_readings_daily counters';
+END $$;
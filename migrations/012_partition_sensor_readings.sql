@@ -0,0 +1,220 @@
+-- Migration 012: Monthly range partitioning for sensor_readings
+-- Date: 2025-11-12
+-- Purpose: Partition raw readings by month on measured_at_vn so range queries
+--          and VACUUM only touch the months they need, and old months can be
+--          archived or dropped once their daily rollups are final
+--
+-- Notes:
+--   * PRIMARY KEY becomes (id, measured_at_vn): a partitioned table's unique
+--     constraints must include the partition key. id stays globally unique
+--     because it still comes from sensor_readings_id_seq.
+--   * ai_analysis.sensor_reading_id loses its FOREIGN KEY for the same reason.
+--   * UNIQUE (measured_at_vn) is kept, so ON CONFLICT (measured_at_vn) in the
+--     ingest code keeps working unchanged.
+--   * Run partition_maintenance.py daily to create future partitions and
+--     apply the retention policy.
+
+BEGIN;
+
+-- ============================================================
+-- 1. Move the current table aside
+-- ============================================================
+
+ALTER TABLE sensor_readings RENAME TO sensor_readings_legacy;
+DROP TRIGGER IF EXISTS trigger_sensor_readings_daily_count ON sensor_readings_legacy;
+
+-- Keep the id sequence alive when the legacy table is dropped
+ALTER SEQUENCE sensor_readings_id_seq OWNED BY NONE;
+
+-- A foreign key cannot reference id alone on a partitioned table
+ALTER TABLE ai_analysis DROP CONSTRAINT IF EXISTS ai_analysis_sensor_reading_id_fkey;
+
+-- ============================================================
+-- 2. Partitioned parent + default partition
+-- ============================================================
+
+CREATE TABLE sensor_readings (
+    LIKE sensor_readings_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING COMMENTS
+) PARTITION BY RANGE (measured_at_vn);
+
+-- Catches readings outside any monthly partition so ingest never fails
+CREATE TABLE sensor_readings_default PARTITION OF sensor_readings DEFAULT;
+
+-- ============================================================
+-- 3. Partition management functions
+-- ============================================================
+
+-- Create the monthly partition containing month_start (idempotent).
+-- Rows that already landed in the default partition for that month are
+-- moved into the new partition before it is attached.
+CREATE OR REPLACE FUNCTION create_sensor_readings_partition(month_start DATE)
+RETURNS TEXT AS $$
+DECLARE
+    range_start DATE := date_trunc('month', month_start)::DATE;
+    range_end DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::DATE;
+    new_partition TEXT := 'sensor_readings_' || to_char(range_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(new_partition) IS NOT NULL THEN
+        RETURN new_partition;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE sensor_readings INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        new_partition
+    );
+
+    EXECUTE format(
+        'WITH moved AS (
+             DELETE FROM sensor_readings_default
+             WHERE measured_at_vn >= %L AND measured_at_vn < %L
+             RETURNING *
+         )
+         INSERT INTO %I SELECT * FROM moved',
+        range_start, range_end, new_partition
+    );
+
+    EXECUTE format(
+        'ALTER TABLE sensor_readings ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        new_partition, range_start, range_end
+    );
+
+    RAISE NOTICE 'Created partition % [%, %)', new_partition, range_start, range_end;
+    RETURN new_partition;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Make sure partitions exist for the current month and months_ahead after it
+CREATE OR REPLACE FUNCTION ensure_sensor_readings_partitions(months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+    current_month DATE := date_trunc('month', NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh')::DATE;
+    i INTEGER;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        PERFORM create_sensor_readings_partition((current_month + make_interval(months => i))::DATE);
+    END LOOP;
+    RETURN months_ahead + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retention: detach monthly partitions that ended more than retain_months ago.
+-- A month is only released when every day that has readings also has its
+-- daily_insights row (the rollup is final); otherwise it is kept and reported.
+-- archive = TRUE moves the partition to the sensor_archive schema, FALSE drops it.
+CREATE SCHEMA IF NOT EXISTS sensor_archive;
+
+CREATE OR REPLACE FUNCTION drop_expired_sensor_partitions(retain_months INTEGER, archive BOOLEAN DEFAULT TRUE)
+RETURNS TABLE (expired_partition TEXT, action TEXT) AS $$
+DECLARE
+    cutoff DATE := (date_trunc('month', NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh') - make_interval(months => retain_months))::DATE;
+    part RECORD;
+    range_start DATE;
+    range_end DATE;
+    unfinalized_days INTEGER;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sensor_readings'::regclass
+          AND c.relname ~ '^sensor_readings_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    LOOP
+        range_start := to_date(right(part.relname, 7), 'YYYY_MM');
+        range_end := (range_start + INTERVAL '1 month')::DATE;
+        CONTINUE WHEN range_end > cutoff;
+
+        SELECT COUNT(*) INTO unfinalized_days
+        FROM sensor_readings_daily d
+        WHERE d.date_vn >= range_start
+          AND d.date_vn < range_end
+          AND NOT EXISTS (SELECT 1 FROM daily_insights di WHERE di.date_vn = d.date_vn);
+
+        expired_partition := part.relname;
+
+        IF unfinalized_days > 0 THEN
+            action := format('kept (%s days without daily insight)', unfinalized_days);
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+
+        EXECUTE format('ALTER TABLE sensor_readings DETACH PARTITION %I', part.relname);
+
+        IF archive THEN
+            EXECUTE format('ALTER TABLE %I SET SCHEMA sensor_archive', part.relname);
+            action := 'archived';
+        ELSE
+            EXECUTE format('DROP TABLE %I', part.relname);
+            action := 'dropped';
+        END IF;
+
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- 4. Create partitions for existing data + upcoming months, copy rows
+-- ============================================================
+
+DO $$
+DECLARE
+    legacy_month DATE;
+BEGIN
+    FOR legacy_month IN
+        SELECT DISTINCT date_trunc('month', measured_at_vn)::DATE FROM sensor_readings_legacy
+    LOOP
+        PERFORM create_sensor_readings_partition(legacy_month);
+    END LOOP;
+
+    PERFORM ensure_sensor_readings_partitions(3);
+END $$;
+
+INSERT INTO sensor_readings SELECT * FROM sensor_readings_legacy;
+
+DROP TABLE sensor_readings_legacy;
+
+ALTER SEQUENCE sensor_readings_id_seq OWNED BY sensor_readings.id;
+
+-- ============================================================
+-- 5. Constraints, indexes and triggers on the partitioned table
+-- ============================================================
+
+ALTER TABLE sensor_readings ADD CONSTRAINT sensor_readings_pkey PRIMARY KEY (id, measured_at_vn);
+ALTER TABLE sensor_readings ADD CONSTRAINT sensor_readings_measured_at_vn_key UNIQUE (measured_at_vn);
+
+CREATE INDEX idx_sensor_readings_measured_at_vn_desc ON sensor_readings (measured_at_vn DESC);
+
+CREATE INDEX idx_sensor_readings_onchain_status
+  ON sensor_readings (onchain_status)
+  WHERE onchain_status = 'pending';
+
+CREATE INDEX idx_sensor_readings_measured_at_status
+  ON sensor_readings (measured_at_vn, onchain_status);
+
+-- Per-day counters from migration 011
+CREATE TRIGGER trigger_sensor_readings_daily_count
+    AFTER INSERT ON sensor_readings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sensor_readings_daily_count();
+
+-- Comments
+COMMENT ON TABLE sensor_readings IS 'Raw IoT readings, range-partitioned by month on measured_at_vn';
+COMMENT ON FUNCTION ensure_sensor_readings_partitions(INTEGER) IS 'Create monthly partitions for the current month and N months ahead';
+COMMENT ON FUNCTION drop_expired_sensor_partitions(INTEGER, BOOLEAN) IS 'Archive/drop monthly partitions older than N months once their daily insights exist';
+
+COMMIT;
+
+-- Verify
+SELECT c.relname AS partition, pg_get_expr(c.relpartbound, c.oid) AS bounds
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'sensor_readings'::regclass
+ORDER BY c.relname;
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 012 completed: sensor_readings partitioned by month';
+END $$;
@@ -0,0 +1,129 @@
+-- Migration 013: Multi-device ingestion
+-- Date: 2025-11-13
+-- Purpose: Add a device dimension so several field nodes can report in the
+--          same second without ON CONFLICT dropping each other's readings
+--
+-- Existing rows and payloads without device_id belong to device 'default',
+-- so the single ESP8266 (esp8266_LTMMT.ino) keeps working unchanged.
+
+-- ============================================================
+-- 1. Device registry (device -> farm owner)
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS devices (
+    device_id VARCHAR(64) PRIMARY KEY,
+    user_id BIGINT REFERENCES users(id) ON DELETE SET NULL,
+    name VARCHAR(255),
+    farm_name VARCHAR(255),
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at_vn TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh')
+);
+
+CREATE INDEX IF NOT EXISTS idx_devices_user_id ON devices(user_id);
+
+INSERT INTO devices (device_id, name)
+VALUES ('default', 'ESP8266 LTMMT (single-device setup)')
+ON CONFLICT (device_id) DO NOTHING;
+
+-- ============================================================
+-- 2. sensor_readings: device_id + per-device uniqueness
+-- ============================================================
+
+ALTER TABLE sensor_readings
+  ADD COLUMN IF NOT EXISTS device_id VARCHAR(64) NOT NULL DEFAULT 'default';
+
+ALTER TABLE sensor_readings DROP CONSTRAINT IF EXISTS sensor_readings_measured_at_vn_key;
+
+-- Unique (device_id, measured_at_vn) doubles as the per-device time index:
+-- latest/history/trend for one device are a (backward) range scan on it
+ALTER TABLE sensor_readings
+  ADD CONSTRAINT sensor_readings_device_measured_at_key UNIQUE (device_id, measured_at_vn);
+
+CREATE INDEX IF NOT EXISTS idx_sensor_readings_device_pending
+  ON sensor_readings (device_id, measured_at_vn)
+  WHERE onchain_status = 'pending';
+
+COMMENT ON COLUMN sensor_readings.device_id IS 'Reporting field node (devices.device_id); default for legacy single-device payloads';
+
+-- ============================================================
+-- 3. daily_insights: one insight per device per day
+-- ============================================================
+
+ALTER TABLE daily_insights
+  ADD COLUMN IF NOT EXISTS device_id VARCHAR(64) NOT NULL DEFAULT 'default';
+
+ALTER TABLE daily_insights DROP CONSTRAINT IF EXISTS daily_insights_date_vn_key;
+
+ALTER TABLE daily_insights
+  ADD CONSTRAINT daily_insights_device_date_key UNIQUE (device_id, date_vn);
+
+COMMENT ON COLUMN daily_insights.device_id IS 'Device whose readings were aggregated for this insight';
+
+-- ============================================================
+-- 4. Retention: a day is final only once its device has an insight
+-- ============================================================
+
+-- Redefines migration 012's function: daily_insights is now per device, so
+-- each (device_id, day) with readings in the partition needs its own row.
+-- sensor_readings_daily counts days across devices, hence the partition scan
+-- (one pass over a month that is about to be released anyway).
+CREATE OR REPLACE FUNCTION drop_expired_sensor_partitions(retain_months INTEGER, archive BOOLEAN DEFAULT TRUE)
+RETURNS TABLE (expired_partition TEXT, action TEXT) AS $$
+DECLARE
+    cutoff DATE := (date_trunc('month', NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh') - make_interval(months => retain_months))::DATE;
+    part RECORD;
+    range_start DATE;
+    range_end DATE;
+    unfinalized_days INTEGER;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sensor_readings'::regclass
+          AND c.relname ~ '^sensor_readings_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    LOOP
+        range_start := to_date(right(part.relname, 7), 'YYYY_MM');
+        range_end := (range_start + INTERVAL '1 month')::DATE;
+        CONTINUE WHEN range_end > cutoff;
+
+        EXECUTE format(
+            'SELECT COUNT(*)
+             FROM (SELECT DISTINCT device_id, measured_at_vn::DATE AS date_vn FROM %I) d
+             WHERE NOT EXISTS (
+                 SELECT 1 FROM daily_insights di
+                 WHERE di.device_id = d.device_id AND di.date_vn = d.date_vn
+             )', part.relname)
+        INTO unfinalized_days;
+
+        expired_partition := part.relname;
+
+        IF unfinalized_days > 0 THEN
+            action := format('kept (%s device-days without daily insight)', unfinalized_days);
+            RETURN NEXT;
+            CONTINUE;
+        END IF;
+
+        EXECUTE format('ALTER TABLE sensor_readings DETACH PARTITION %I', part.relname);
+
+        IF archive THEN
+            EXECUTE format('ALTER TABLE %I SET SCHEMA sensor_archive', part.relname);
+            action := 'archived';
+        ELSE
+            EXECUTE format('DROP TABLE %I', part.relname);
+            action := 'dropped';
+        END IF;
+
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION drop_expired_sensor_partitions(INTEGER, BOOLEAN) IS 'Archive/drop monthly partitions older than N months once every device-day has its daily insight';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 013 completed: Added device_id to sensor_readings and daily_insights';
+END $$;
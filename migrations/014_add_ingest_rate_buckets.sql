@@ -0,0 +1,72 @@
+-- Migration 014: Shared token buckets for /api/data rate limiting
+-- Date: 2025-11-14
+-- Purpose: Let several ingest workers/nodes enforce one per-device budget
+--          (RATE_LIMIT_BACKEND=postgres in rate_limit.py)
+--
+-- UNLOGGED: bucket state is disposable, so skip WAL on every request.
+-- After a crash the table is empty, which only means every bucket is full.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS ingest_rate_buckets (
+    bucket_key VARCHAR(128) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    refilled_at TIMESTAMPTZ NOT NULL
+);
+
+-- Take one token from bucket_key (rate tokens/second, at most burst).
+-- Returns 0 when allowed, otherwise the seconds until a token is available.
+-- The row lock serializes concurrent takers of the same key only.
+CREATE OR REPLACE FUNCTION take_ingest_token(
+    p_key TEXT,
+    p_rate DOUBLE PRECISION,
+    p_burst DOUBLE PRECISION
+)
+RETURNS DOUBLE PRECISION AS $$
+DECLARE
+    now_ts TIMESTAMPTZ := clock_timestamp();
+    available DOUBLE PRECISION;
+BEGIN
+    INSERT INTO ingest_rate_buckets (bucket_key, tokens, refilled_at)
+    VALUES (p_key, p_burst, now_ts)
+    ON CONFLICT (bucket_key) DO NOTHING;
+
+    SELECT LEAST(p_burst, tokens + EXTRACT(EPOCH FROM now_ts - refilled_at) * p_rate)
+    INTO available
+    FROM ingest_rate_buckets
+    WHERE bucket_key = p_key
+    FOR UPDATE;
+
+    IF available >= 1 THEN
+        UPDATE ingest_rate_buckets
+        SET tokens = available - 1, refilled_at = now_ts
+        WHERE bucket_key = p_key;
+        RETURN 0;
+    END IF;
+
+    UPDATE ingest_rate_buckets
+    SET tokens = available, refilled_at = now_ts
+    WHERE bucket_key = p_key;
+    RETURN (1 - available) / p_rate;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Buckets idle long enough to be full again carry no state
+CREATE OR REPLACE FUNCTION prune_ingest_rate_buckets(idle INTERVAL DEFAULT INTERVAL '1 hour')
+RETURNS INTEGER AS $$
+DECLARE
+    removed INTEGER;
+BEGIN
+    DELETE FROM ingest_rate_buckets WHERE refilled_at < clock_timestamp() - idle;
+    GET DIAGNOSTICS removed = ROW_COUNT;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Comments
+COMMENT ON TABLE ingest_rate_buckets IS 'Per-device/IP token buckets shared by ingest workers (rate_limit.py)';
+COMMENT ON FUNCTION take_ingest_token(TEXT, DOUBLE PRECISION, DOUBLE PRECISION) IS 'Take one token; returns 0 if allowed, else seconds to wait';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 014 completed: Added ingest_rate_buckets';
+END $$;
@@ -0,0 +1,70 @@
+-- Migration 015: Normalized unique indexes for login identity lookups
+-- Date: 2025-11-15
+-- Purpose: Let login_pin find a user with one unique-index probe
+--          (email or phone, dispatched on the identifier type in auth_routes.py)
+--          instead of `email = %s OR phone = %s`, which can use neither index
+--
+-- Emails compare case-insensitively and phones in canonical form
+-- (digits only, +84 prefix -> 0), so "A@x.vn" / "a@x.vn" and
+-- "+84912345678" / "0912345678" are the same account.
+-- Plans are checked against 1M synthetic users by bench_login_lookup.py.
+
+-- Canonical phone: digits only, Vietnamese country code rewritten to 0
+-- IMMUTABLE so it can back an expression index; auth_routes.py calls it on
+-- the lookup parameter so the predicate matches the index expression exactly
+CREATE OR REPLACE FUNCTION canonical_phone(p_phone TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN digits LIKE '84%' AND length(digits) = 11 THEN '0' || substr(digits, 3)
+        ELSE NULLIF(digits, '')
+    END
+    FROM (SELECT regexp_replace(p_phone, '[^0-9]', '', 'g') AS digits) AS d;
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+
+-- Refuse to continue if existing rows already collide once normalized
+DO $$
+DECLARE
+    dup_emails INTEGER;
+    dup_phones INTEGER;
+BEGIN
+    SELECT COUNT(*) INTO dup_emails FROM (
+        SELECT lower(email) FROM users
+        WHERE email IS NOT NULL
+        GROUP BY lower(email) HAVING COUNT(*) > 1
+    ) AS d;
+
+    SELECT COUNT(*) INTO dup_phones FROM (
+        SELECT canonical_phone(phone) FROM users
+        WHERE phone IS NOT NULL
+        GROUP BY canonical_phone(phone) HAVING COUNT(*) > 1
+    ) AS d;
+
+    IF dup_emails > 0 OR dup_phones > 0 THEN
+        RAISE EXCEPTION 'Migration 015: % duplicate email(s) and % duplicate phone(s) after normalization; merge these accounts first',
+            dup_emails, dup_phones;
+    END IF;
+END $$;
+
+-- Not partial: NULLs never conflict in a unique index anyway, and without a
+-- WHERE clause the planner needs no IS NOT NULL proof to use them
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_email_lower
+    ON users (lower(email));
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_users_phone_canonical
+    ON users (canonical_phone(phone));
+
+-- Plain copies of the UNIQUE constraint indexes on phone and
+-- passkey_credential_id (migration 008): same lookups, double the writes
+DROP INDEX IF EXISTS idx_users_phone;
+DROP INDEX IF EXISTS idx_users_passkey_credential;
+
+-- Comments
+COMMENT ON FUNCTION canonical_phone(TEXT) IS 'Phone in canonical form (digits only, +84 -> 0) for uq_users_phone_canonical';
+COMMENT ON INDEX uq_users_email_lower IS 'Case-insensitive email uniqueness and login lookup';
+COMMENT ON INDEX uq_users_phone_canonical IS 'Canonical phone uniqueness and login lookup';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 015 completed: Added normalized email/phone unique indexes';
+END $$;
@@ -0,0 +1,37 @@
+-- Migration 016: Per-user crop validation in the daily pipeline
+-- Date: 2025-11-16
+-- Purpose: Store how well each farmer's current_crop suits the day's soil,
+--          computed by analyze-daily with one validator run per distinct crop
+--
+-- One row per user per device per day; re-running a day overwrites it.
+
+CREATE TABLE IF NOT EXISTS user_crop_validations (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    device_id VARCHAR(64) NOT NULL DEFAULT 'default',
+    date_vn DATE NOT NULL,
+    daily_insight_id INTEGER REFERENCES daily_insights(id) ON DELETE SET NULL,
+
+    -- Model 3 result for users.current_crop (normalized validator name)
+    crop VARCHAR(50) NOT NULL,
+    suitability_score NUMERIC(5,2) NOT NULL,
+    verdict VARCHAR(20) NOT NULL,
+
+    created_at_vn TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'Asia/Ho_Chi_Minh'),
+
+    CONSTRAINT user_crop_validations_user_device_date_key UNIQUE (user_id, device_id, date_vn)
+);
+
+-- Daily report lookups (all users of a device for a date)
+CREATE INDEX IF NOT EXISTS idx_user_crop_validations_device_date
+    ON user_crop_validations (device_id, date_vn);
+
+-- Comments
+COMMENT ON TABLE user_crop_validations IS 'Daily suitability of each user''s current_crop (analyze-daily, one validator run per crop)';
+COMMENT ON COLUMN user_crop_validations.crop IS 'Validator name the user''s current_crop was matched to';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 016 completed: Added user_crop_validations';
+END $$;
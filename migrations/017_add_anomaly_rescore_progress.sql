@@ -0,0 +1,42 @@
+-- Migration 017: Bulk anomaly rescoring of historical sensor_readings
+-- Date: 2025-11-17
+-- Purpose: Let ai/ai_service/rescore_anomalies.py write one ai_analysis row
+--          per raw reading (analysis_type 'anomaly-rescore') and resume
+--
+-- Each worker owns an id range [range_start, range_end) and commits its
+-- high-water mark in the same transaction as the rows it inserted, so a
+-- restarted worker continues after the last committed chunk.
+
+-- sensor_readings.id is BIGSERIAL
+ALTER TABLE ai_analysis ALTER COLUMN sensor_reading_id TYPE BIGINT;
+
+-- At most one rescore row per reading and model version (overlapping ranges
+-- or a re-run with --reset insert nothing twice)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_ai_analysis_rescore_reading
+    ON ai_analysis (sensor_reading_id, model_version)
+    WHERE analysis_type = 'anomaly-rescore';
+
+CREATE TABLE IF NOT EXISTS anomaly_rescore_progress (
+    model_version VARCHAR(20) NOT NULL,
+    range_start BIGINT NOT NULL,
+    range_end BIGINT NOT NULL,
+
+    -- Last sensor_readings.id scored in this range
+    high_water_mark BIGINT NOT NULL,
+    rows_scored BIGINT NOT NULL DEFAULT 0,
+    anomalies BIGINT NOT NULL DEFAULT 0,
+
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+
+    PRIMARY KEY (model_version, range_start, range_end)
+);
+
+-- Comments
+COMMENT ON TABLE anomaly_rescore_progress IS 'Resume point of each rescore_anomalies.py worker (one row per id range)';
+COMMENT ON COLUMN anomaly_rescore_progress.high_water_mark IS 'Readings with id <= high_water_mark in the range are done';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 017 completed: Added anomaly_rescore_progress';
+END $$;
@@ -0,0 +1,22 @@
+-- Migration 018: Per-reading anomaly flags written at ingest time
+-- Date: 2025-11-18
+-- Purpose: anomaly_stream.py scores inserted readings in micro-batches and
+--          stores the IsolationForest result on the reading itself
+--
+-- NULL = not scored yet (stream disabled, dropped under load, or failed).
+-- No index on the new columns: indexing them would make every scoring
+-- UPDATE a non-HOT update; anomalies are looked up by device and time range.
+
+ALTER TABLE sensor_readings
+    ADD COLUMN IF NOT EXISTS anomaly_score REAL,
+    ADD COLUMN IF NOT EXISTS is_anomaly BOOLEAN;
+
+-- Comments
+COMMENT ON COLUMN sensor_readings.anomaly_score IS 'IsolationForest score_samples of the reading (lower = more anomalous)';
+COMMENT ON COLUMN sensor_readings.is_anomaly IS 'Anomaly flag from the ingest-time stream (NULL = not scored)';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 018 completed: Added sensor_readings.anomaly_score / is_anomaly';
+END $$;
@@ -0,0 +1,75 @@
+-- Migration 019: Online daily statistics per device
+-- Date: 2025-11-19
+-- Purpose: Store the mergeable daily aggregates maintained by online_stats.py
+--          (Welford mean/variance, min/max, quantile sketches, rain votes)
+--          so daily aggregation reads one row instead of the day's raw readings
+--
+-- reading_count is counted on every insert into sensor_readings, whatever
+-- the ingest path; stats/stats_count are written by the ingest workers.
+-- Stats are trusted only while stats_count keeps up with reading_count.
+--
+-- reading_count summed over devices also replaces migration 011's
+-- sensor_readings_daily (dashboard overview), so every insert statement
+-- maintains a single set of counters.
+
+CREATE TABLE IF NOT EXISTS sensor_daily_stats (
+    device_id VARCHAR(64) NOT NULL,
+    date_vn DATE NOT NULL,
+
+    reading_count BIGINT NOT NULL DEFAULT 0,
+
+    stats JSONB,
+    stats_count BIGINT NOT NULL DEFAULT 0,
+    stats_updated_at TIMESTAMPTZ,
+
+    PRIMARY KEY (device_id, date_vn)
+);
+
+-- Day lookups across devices (overview totals, online_stats.day)
+CREATE INDEX IF NOT EXISTS idx_sensor_daily_stats_date ON sensor_daily_stats (date_vn);
+
+-- Backfill raw counts: days that already have readings have no stats and
+-- keep using the raw-scan aggregation
+INSERT INTO sensor_daily_stats (device_id, date_vn, reading_count)
+SELECT device_id, measured_at_vn::DATE, COUNT(*)
+FROM sensor_readings
+GROUP BY device_id, measured_at_vn::DATE
+ON CONFLICT (device_id, date_vn) DO UPDATE SET
+    reading_count = EXCLUDED.reading_count;
+
+-- Statement-level trigger: one upsert per device-day touched by an INSERT
+CREATE OR REPLACE FUNCTION sensor_daily_stats_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_daily_stats (device_id, date_vn, reading_count)
+    SELECT device_id, measured_at_vn::DATE, COUNT(*)
+    FROM new_rows
+    GROUP BY device_id, measured_at_vn::DATE
+    ON CONFLICT (device_id, date_vn) DO UPDATE SET
+        reading_count = sensor_daily_stats.reading_count + EXCLUDED.reading_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_sensor_daily_stats_count ON sensor_readings;
+CREATE TRIGGER trigger_sensor_daily_stats_count
+    AFTER INSERT ON sensor_readings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sensor_daily_stats_count();
+
+-- Migration 011's per-day counters are superseded by reading_count above
+DROP TRIGGER IF EXISTS trigger_sensor_readings_daily_count ON sensor_readings;
+DROP FUNCTION IF EXISTS sensor_readings_daily_count();
+DROP TABLE IF EXISTS sensor_readings_daily;
+
+-- Comments
+COMMENT ON TABLE sensor_daily_stats IS 'Per-device daily aggregates maintained on ingest (online_stats.py)';
+COMMENT ON COLUMN sensor_daily_stats.reading_count IS 'Rows inserted into sensor_readings for this device and date (trigger)';
+COMMENT ON COLUMN sensor_daily_stats.stats_count IS 'Readings merged into stats by the ingest workers';
+
+-- Success message
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Migration 019 completed: Added sensor_daily_stats (replaces sensor_readings_daily)';
+END $$;
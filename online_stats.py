@@ -0,0 +1,394 @@
+"""
+Online Stats - Daily aggregates maintained on ingest instead of re-scanning raw rows
+Every inserted reading updates, per (device_id, day) and per parameter:
+running count/mean/variance (Welford), min/max and a quantile sketch, plus
+rain votes. Workers keep the readings since their last flush as a delta and
+merge it into sensor_daily_stats every ONLINE_STATS_FLUSH_SECONDS (migration
+019), so the stored row is the merge of all workers' deltas.
+
+All pieces are mergeable:
+- RunningStat: parallel Welford (Chan et al.) combination
+- QuantileSketch: log-spaced buckets (DDSketch-style), merged by adding
+  bucket counts; quantiles within ±ONLINE_STATS_SKETCH_ACCURACY (relative)
+
+sensor_daily_stats.reading_count is counted by a trigger on every insert
+(any ingest path); the stored stats are used only when they cover all but
+ONLINE_STATS_MAX_MISSING of it, otherwise callers fall back to scanning
+sensor_readings (days from before migration 019, readings ingested by a
+server without online stats).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+ONLINE_STATS_ENABLED = os.getenv("ONLINE_STATS_ENABLED", "true").lower() == "true"
+ONLINE_STATS_FLUSH_SECONDS = float(os.getenv("ONLINE_STATS_FLUSH_SECONDS", "10"))
+ONLINE_STATS_SKETCH_ACCURACY = float(os.getenv("ONLINE_STATS_SKETCH_ACCURACY", "0.01"))
+
+# Stored stats are used while at most this share of the day's inserted
+# readings is missing from them (other workers' unflushed deltas)
+ONLINE_STATS_MAX_MISSING = float(os.getenv("ONLINE_STATS_MAX_MISSING", "0.01"))
+
+# Numeric parameters tracked (sensor_readings columns)
+STAT_COLUMNS = (
+    "soil_temperature_c", "soil_moisture_pct",
+    "conductivity_us_cm", "ph_value",
+    "nitrogen_mg_kg", "phosphorus_mg_kg", "potassium_mg_kg", "salt_mg_l",
+    "air_temperature_c", "air_humidity_pct",
+)
+
+
+class RunningStat:
+    """Count, mean, sum of squared deviations (Welford), min and max"""
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=None, max=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+
+    def merge(self, other: "RunningStat") -> None:
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def stddev(self) -> float | None:
+        # Sample standard deviation, like Postgres STDDEV
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunningStat":
+        return cls(data["count"], data["mean"], data["m2"], data["min"], data["max"])
+
+
+class QuantileSketch:
+    """
+    Log-bucket quantile sketch: value x > 0 goes to bucket ceil(log_gamma(x)),
+    gamma = (1 + a) / (1 - a), so any quantile is returned within a relative
+    error a of a value of that rank. Negative values mirror positive ones.
+    """
+
+    def __init__(self, accuracy: float = ONLINE_STATS_SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: dict = {}
+        self.negative: dict = {}
+        self.zero = 0
+        self.count = 0
+
+    def _bucket(self, x: float) -> int:
+        return math.ceil(math.log(x) / self._log_gamma)
+
+    def _value(self, bucket: int) -> float:
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        if x > 0:
+            k = self._bucket(x)
+            self.positive[k] = self.positive.get(k, 0) + 1
+        elif x < 0:
+            k = self._bucket(-x)
+            self.negative[k] = self.negative.get(k, 0) + 1
+        else:
+            self.zero += 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for k, n in other.positive.items():
+            self.positive[k] = self.positive.get(k, 0) + n
+        for k, n in other.negative.items():
+            self.negative[k] = self.negative.get(k, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # Ascending order: most negative, ..., zero, ..., largest
+        for k in sorted(self.negative, reverse=True):
+            seen += self.negative[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.positive):
+            seen += self.positive[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.positive))
+
+    def to_dict(self) -> dict:
+        return {
+            "accuracy": self.accuracy,
+            "zero": self.zero,
+            "positive": {str(k): n for k, n in self.positive.items()},
+            "negative": {str(k): n for k, n in self.negative.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data["accuracy"])
+        sketch.zero = data["zero"]
+        sketch.positive = {int(k): n for k, n in data["positive"].items()}
+        sketch.negative = {int(k): n for k, n in data["negative"].items()}
+        sketch.count = sketch.zero + sum(sketch.positive.values()) + sum(sketch.negative.values())
+        return sketch
+
+
+class DayStats:
+    """Online aggregate of one device-day (or a merge of several)"""
+
+    def __init__(self):
+        self.count = 0
+        self.rain = 0
+        self.first = None
+        self.last = None
+        self.stats = {c: RunningStat() for c in STAT_COLUMNS}
+        self.sketches = {c: QuantileSketch() for c in STAT_COLUMNS}
+
+    def add(self, reading: dict) -> None:
+        self.count += 1
+        self.rain += 1 if reading.get("is_raining") else 0
+        measured_at_vn = str(reading["measured_at_vn"])
+        self.first = measured_at_vn if self.first is None else min(self.first, measured_at_vn)
+        self.last = measured_at_vn if self.last is None else max(self.last, measured_at_vn)
+        for c in STAT_COLUMNS:
+            value = reading.get(c)
+            if value is not None:
+                self.stats[c].add(float(value))
+                self.sketches[c].add(float(value))
+
+    def merge(self, other: "DayStats") -> "DayStats":
+        self.count += other.count
+        self.rain += other.rain
+        self.first = min(filter(None, (self.first, other.first)), default=None)
+        self.last = max(filter(None, (self.last, other.last)), default=None)
+        for c in STAT_COLUMNS:
+            self.stats[c].merge(other.stats[c])
+            self.sketches[c].merge(other.sketches[c])
+        return self
+
+    def mean(self, column: str) -> float | None:
+        stat = self.stats[column]
+        return stat.mean if stat.count else None
+
+    def median(self, column: str) -> float | None:
+        return self.sketches[column].quantile(0.5)
+
+    def is_raining(self) -> bool:
+        # Majority vote, as in the SQL aggregates
+        return self.count > 0 and self.rain / self.count > 0.5
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "rain": self.rain,
+            "first": self.first,
+            "last": self.last,
+            "stats": {c: s.to_dict() for c, s in self.stats.items()},
+            "sketches": {c: s.to_dict() for c, s in self.sketches.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DayStats":
+        day = cls()
+        day.count = data["count"]
+        day.rain = data["rain"]
+        day.first = data["first"]
+        day.last = data["last"]
+        for c in STAT_COLUMNS:
+            if c in data["stats"]:
+                day.stats[c] = RunningStat.from_dict(data["stats"][c])
+                day.sketches[c] = QuantileSketch.from_dict(data["sketches"][c])
+        return day
+
+
+class OnlineAggregator:
+    """
+    Per-worker deltas of DayStats, merged into sensor_daily_stats periodically
+
+    get_conn() must return a new psycopg2 connection.
+    """
+
+    def __init__(self, get_conn, flush_seconds: float = ONLINE_STATS_FLUSH_SECONDS):
+        self.get_conn = get_conn
+        self.flush_seconds = flush_seconds
+
+        self._deltas: dict = {}  # (device_id, date_vn) -> DayStats
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.added_total = 0
+        self.flushed_total = 0
+        self.last_flush_error = None
+
+    def add(self, readings: list) -> None:
+        """Account newly inserted readings (call after the insert committed)"""
+        with self._lock:
+            self._start_locked()
+            for reading in readings:
+                key = (reading["device_id"], str(reading["measured_at_vn"])[:10])
+                day = self._deltas.get(key)
+                if day is None:
+                    day = self._deltas[key] = DayStats()
+                day.add(reading)
+            self.added_total += len(readings)
+
+    def _start_locked(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._flush_forever, name="online-stats", daemon=True)
+            self._thread.start()
+
+    def _flush_forever(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+                self.last_flush_error = None
+            except Exception as e:
+                self.last_flush_error = str(e)
+                print(f"⚠️ Online stats flush deferred: {e}")
+
+    def flush(self) -> int:
+        """Merge every pending delta into sensor_daily_stats; returns readings flushed"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+
+        flushed = 0
+        try:
+            while deltas:
+                key, delta = next(iter(deltas.items()))
+                self._merge_into_db(key, delta)
+                del deltas[key]
+                flushed += delta.count
+        finally:
+            # Not flushed yet -> back into the pending deltas
+            if deltas:
+                with self._lock:
+                    for key, delta in deltas.items():
+                        pending = self._deltas.get(key)
+                        self._deltas[key] = delta if pending is None else delta.merge(pending)
+            self.flushed_total += flushed
+        return flushed
+
+    def _merge_into_db(self, key: tuple, delta: DayStats) -> None:
+        device_id, date_vn = key
+        conn = self.get_conn()
+        try:
+            with conn.cursor() as cur:
+                # The insert trigger normally created the row already
+                cur.execute("""
+                    INSERT INTO sensor_daily_stats (device_id, date_vn)
+                    VALUES (%s, %s)
+                    ON CONFLICT (device_id, date_vn) DO NOTHING
+                """, key)
+                cur.execute("""
+                    SELECT stats FROM sensor_daily_stats
+                    WHERE device_id = %s AND date_vn = %s
+                    FOR UPDATE
+                """, key)
+                stored = cur.fetchone()[0]
+                if isinstance(stored, str):
+                    stored = json.loads(stored)
+
+                merged = DayStats.from_dict(stored).merge(delta) if stored else delta
+                cur.execute("""
+                    UPDATE sensor_daily_stats
+                    SET stats = %s, stats_count = %s, stats_updated_at = NOW()
+                    WHERE device_id = %s AND date_vn = %s
+                """, (json.dumps(merged.to_dict()), merged.count, device_id, date_vn))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def day(self, date_vn: str, device_id: str | None = None) -> DayStats | None:
+        """
+        Aggregate of a day (one device, or all devices merged) from the stored
+        stats plus this worker's unflushed delta. Other workers' deltas show up
+        after their next flush.
+
+        None when the day has no readings or the stats miss more than
+        ONLINE_STATS_MAX_MISSING of its inserted readings.
+        """
+        conn = self.get_conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT device_id, stats, stats_count, reading_count
+                    FROM sensor_daily_stats
+                    WHERE date_vn = %s
+                    """ + ("AND device_id = %s" if device_id else ""),
+                    (date_vn, device_id) if device_id else (date_vn,)
+                )
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+
+        with self._lock:
+            local = {
+                key[0]: DayStats().merge(delta)
+                for key, delta in self._deltas.items()
+                if key[1] == date_vn and (device_id is None or key[0] == device_id)
+            }
+
+        total = DayStats()
+        inserted = 0
+        for row_device_id, stored, stats_count, reading_count in rows:
+            inserted += reading_count
+            if stored:
+                total.merge(DayStats.from_dict(json.loads(stored) if isinstance(stored, str) else stored))
+            pending = local.pop(row_device_id, None)
+            if pending:
+                total.merge(pending)
+        for pending in local.values():
+            total.merge(pending)
+
+        if not total.count or inserted - total.count > ONLINE_STATS_MAX_MISSING * inserted:
+            return None
+        return total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_days": len(self._deltas),
+                "pending_readings": sum(d.count for d in self._deltas.values()),
+                "added_total": self.added_total,
+                "flushed_total": self.flushed_total,
+                "last_flush_error": self.last_flush_error,
+            }
@@ -0,0 +1,84 @@
+"""
+Partition Maintenance - sensor_readings monthly partitions (migration 012)
+Creates upcoming monthly partitions and applies the raw-data retention policy
+
+Run once a day, e.g. from cron:
+    15 0 * * * cd /opt/pione && python partition_maintenance.py
+
+Options (or env vars):
+    --months-ahead   SENSOR_PARTITION_MONTHS_AHEAD  (default: 3)
+    --retain-months  SENSOR_RETENTION_MONTHS        (default: 0 = keep forever)
+    --drop           SENSOR_RETENTION_DROP=true     (drop instead of archive)
+"""
+
+import argparse
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+
+def get_db_connection():
+    dsn = os.getenv("DATABASE_URL")
+    if dsn:
+        return psycopg2.connect(dsn)
+    return psycopg2.connect(
+        host=os.getenv('PGHOST'),
+        port=os.getenv('PGPORT'),
+        database=os.getenv('PGDATABASE'),
+        user=os.getenv('PGUSER'),
+        password=os.getenv('PGPASSWORD')
+    )
+
+
+def run_maintenance(months_ahead: int, retain_months: int, archive: bool) -> None:
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT ensure_sensor_readings_partitions(%s)", (months_ahead,))
+            ensured = cur.fetchone()[0]
+            print(f"✅ Ensured {ensured} monthly partitions (current + {months_ahead} ahead)")
+
+            if retain_months > 0:
+                cur.execute(
+                    "SELECT expired_partition, action FROM drop_expired_sensor_partitions(%s, %s)",
+                    (retain_months, archive)
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    print(f"ℹ️ No partitions older than {retain_months} months")
+                for partition, action in rows:
+                    print(f"   • {partition}: {action}")
+            else:
+                print("ℹ️ Retention disabled (retain months = 0)")
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Partition maintenance error: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="sensor_readings partition maintenance")
+    parser.add_argument(
+        "--months-ahead", type=int,
+        default=int(os.getenv("SENSOR_PARTITION_MONTHS_AHEAD", "3")),
+        help="Months of future partitions to pre-create"
+    )
+    parser.add_argument(
+        "--retain-months", type=int,
+        default=int(os.getenv("SENSOR_RETENTION_MONTHS", "0")),
+        help="Keep raw partitions for this many full months (0 = keep forever)"
+    )
+    parser.add_argument(
+        "--drop", action="store_true",
+        default=os.getenv("SENSOR_RETENTION_DROP", "false").lower() == "true",
+        help="Drop expired partitions instead of moving them to sensor_archive"
+    )
+    args = parser.parse_args()
+
+    run_maintenance(args.months_ahead, args.retain_months, archive=not args.drop)
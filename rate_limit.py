@@ -0,0 +1,241 @@
+"""
+Rate Limit - Admission control for /api/data
+Per-device token buckets (429 + Retry-After) and a global in-flight cap
+(503 + Retry-After), so one device looping on POST or a saturated DB is
+rejected fast instead of tying up every worker and DB connection
+
+Backends (RATE_LIMIT_BACKEND):
+    memory    buckets live in this process (default)
+    postgres  buckets shared by all workers via take_ingest_token()
+              (migration 014) over reused connections; after a failed DB
+              call the local buckets are used for RATE_LIMIT_FALLBACK_SECONDS
+"""
+
+from flask import request, jsonify, make_response
+from functools import wraps
+import ipaddress
+import math
+import os
+import threading
+import time
+
+# Token rate per device/IP and bucket size (ESP8266 posts every 10 s; the
+# burst leaves room for a device flushing readings it buffered offline)
+INGEST_RATE_PER_SEC = float(os.getenv('INGEST_RATE_PER_SEC', '1'))
+INGEST_RATE_BURST = float(os.getenv('INGEST_RATE_BURST', '30'))
+
+# Concurrent /api/data requests per process before answering 503
+INGEST_MAX_IN_FLIGHT = int(os.getenv('INGEST_MAX_IN_FLIGHT', '32'))
+
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+
+# After a failed take_ingest_token call, skip the DB for this long
+RATE_LIMIT_FALLBACK_SECONDS = float(os.getenv('RATE_LIMIT_FALLBACK_SECONDS', '30'))
+
+# Buckets tracked in memory before idle (full) buckets are pruned
+MAX_TRACKED_KEYS = 10000
+
+# Proxies whose X-Forwarded-For is believed (IPs or CIDRs, comma-separated);
+# the tunnel connects from localhost. Other peers are keyed on their own address.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False)
+    for p in os.getenv('TRUSTED_PROXIES', '127.0.0.1,::1').split(',')
+    if p.strip()
+]
+
+
+class TokenBucketLimiter:
+    """Thread-safe token buckets keyed by device/IP"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_TRACKED_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Take one token; returns 0 when allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+
+            if len(self._buckets) > self.max_keys:
+                self._prune_locked(now)
+            return wait
+
+    def _prune_locked(self, now: float) -> None:
+        # A bucket idle for burst/rate seconds is full again: same as absent
+        idle = self.burst / self.rate
+        for key in [k for k, (_, t) in self._buckets.items() if now - t >= idle]:
+            del self._buckets[key]
+
+
+class PostgresTokenBucketLimiter(TokenBucketLimiter):
+    """
+    Buckets shared through take_ingest_token(); local buckets as fallback
+
+    Connections are kept open and reused (at most max_idle kept idle). A
+    failed call closes its connection and switches to the local buckets for
+    fallback_seconds, so an unreachable DB costs one attempt per cool-down
+    instead of one per request.
+    """
+
+    def __init__(self, rate: float, burst: float, get_connection,
+                 fallback_seconds: float = RATE_LIMIT_FALLBACK_SECONDS,
+                 max_idle: int = INGEST_MAX_IN_FLIGHT):
+        super().__init__(rate, burst)
+        self.get_connection = get_connection
+        self.fallback_seconds = fallback_seconds
+        self.max_idle = max_idle
+        self._idle = []
+        self._conn_lock = threading.Lock()
+        self._fallback_until = 0.0
+
+    def acquire(self, key: str) -> float:
+        if time.monotonic() < self._fallback_until:
+            return super().acquire(key)
+
+        with self._conn_lock:
+            conn = self._idle.pop() if self._idle else None
+        try:
+            if conn is None:
+                conn = self.get_connection()
+            with conn.cursor() as cur:
+                cur.execute("SELECT take_ingest_token(%s, %s, %s)", (key, self.rate, self.burst))
+                wait = cur.fetchone()[0]
+            conn.commit()
+        except Exception as e:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._fallback_until = time.monotonic() + self.fallback_seconds
+            print(f"⚠️ Shared rate limit unavailable, using local buckets for {self.fallback_seconds:.0f}s: {e}")
+            return super().acquire(key)
+
+        with self._conn_lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+        return float(wait)
+
+
+class InFlightLimiter:
+    """Non-blocking cap on concurrent requests"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self.rejected_total = 0
+
+    def try_acquire(self) -> bool:
+        if self._semaphore.acquire(blocking=False):
+            return True
+        self.rejected_total += 1
+        return False
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+def is_trusted_proxy(addr: str | None) -> bool:
+    try:
+        ip = ipaddress.ip_address(addr)
+    except (TypeError, ValueError):
+        return False
+    return any(ip in net for net in TRUSTED_PROXIES)
+
+
+def forwarded_client_ip(remote_addr: str | None, forwarded: str) -> str:
+    """
+    Client address: X-Forwarded-For is only honored when the peer is a
+    trusted proxy, and then read from the right, skipping trusted hops
+    (entries further left are client-supplied and can be anything)
+    """
+    addr = remote_addr
+    if is_trusted_proxy(addr):
+        for hop in reversed([h.strip() for h in forwarded.split(',') if h.strip()]):
+            addr = hop
+            if not is_trusted_proxy(hop):
+                break
+    return addr or 'unknown'
+
+
+def client_ip() -> str:
+    return forwarded_client_ip(request.remote_addr, request.headers.get('X-Forwarded-For', ''))
+
+
+def client_key(payload: dict | None = None) -> str:
+    """
+    Bucket key: explicit device id (X-Device-Id header or payload device_id),
+    else client IP (legacy devices all map to the default device id)
+    """
+    device_id = request.headers.get('X-Device-Id')
+    if not device_id and isinstance(payload, dict):
+        device_id = payload.get('device_id')
+    if device_id:
+        return f"device:{str(device_id).strip()[:64]}"
+
+    return f"ip:{client_ip()}"
+
+
+def too_many_requests(wait: float):
+    retry_after = max(1, math.ceil(wait))
+    resp = make_response(jsonify({
+        "status": "error",
+        "message": "Rate limit exceeded",
+        "retry_after": retry_after,
+    }), 429)
+    resp.headers['Retry-After'] = str(retry_after)
+    return resp
+
+
+def server_busy():
+    resp = make_response(jsonify({
+        "status": "error",
+        "message": "Server busy, retry later",
+    }), 503)
+    resp.headers['Retry-After'] = '1'
+    return resp
+
+
+def admission_control(limiter: TokenBucketLimiter, in_flight: InFlightLimiter):
+    """
+    Decorator for the ingest view: the global in-flight slot first (held for
+    the whole request, so a saturated server rejects without touching the
+    DB), then the per-device bucket
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not in_flight.try_acquire():
+                return server_busy()
+            try:
+                payload = request.get_json(silent=True) if request.is_json else None
+                wait = limiter.acquire(client_key(payload))
+                if wait > 0:
+                    return too_many_requests(wait)
+                return view(*args, **kwargs)
+            finally:
+                in_flight.release()
+
+        return wrapper
+    return decorator
+
+
+def create_ingest_limiter(get_connection=None) -> TokenBucketLimiter:
+    if RATE_LIMIT_BACKEND == 'postgres' and get_connection is not None:
+        return PostgresTokenBucketLimiter(INGEST_RATE_PER_SEC, INGEST_RATE_BURST, get_connection)
+    return TokenBucketLimiter(INGEST_RATE_PER_SEC, INGEST_RATE_BURST)
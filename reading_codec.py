@@ -0,0 +1,186 @@
+"""
+Reading Codec - Compact binary uplink format for ESP8266 field nodes
+A frame carries one or many readings as fixed-size scaled integers plus
+epoch seconds, decoded a whole frame at a time with a NumPy structured dtype
+instead of JSON parsing, strptime fallbacks and per-field float()/int()
+
+Frame (little-endian), Content-Type: application/x-pione-readings
+    offset  size  field
+    0       2     magic b"PR"
+    2       1     version (1)
+    3       1     device_id length N (0 = default device / X-Device-Id)
+    4       2     record count (uint16)
+    6       N     device_id (UTF-8)
+    6+N     26*k  records
+
+Record v1 (26 bytes, C: struct __attribute__((packed)))
+    uint32  epoch_s            UTC seconds
+    int16   soil_temperature   x10  (°C)
+    uint16  soil_moisture      x10  (%)
+    uint16  conductivity           (µS/cm)
+    uint16  ph                 x100
+    uint16  nitrogen               (mg/kg)
+    uint16  phosphorus             (mg/kg)
+    uint16  potassium              (mg/kg)
+    uint16  salt                   (mg/L)
+    int16   air_temperature    x10  (°C)
+    uint16  air_humidity       x10  (%)
+    uint8   flags                  bit0 = is_raining
+    uint8   reserved
+
+A JSON reading is ~230 bytes; a v1 record is 26 (+6 header per frame).
+New versions append fields or change scales under a new version number;
+the decoder keeps every published layout.
+"""
+
+import struct
+
+import numpy as np
+
+from ingest_common import DEFAULT_DEVICE_ID
+
+CONTENT_TYPE = "application/x-pione-readings"
+
+MAGIC = b"PR"
+HEADER = struct.Struct("<2sBBH")
+
+# Giới hạn số bản ghi / frame (ESP8266 gom tối đa vài giờ dữ liệu khi mất mạng)
+MAX_RECORDS_PER_FRAME = 4096
+
+RECORD_DTYPES = {
+    1: np.dtype([
+        ("epoch_s", "<u4"),
+        ("soil_temperature", "<i2"),
+        ("soil_moisture", "<u2"),
+        ("conductivity", "<u2"),
+        ("ph", "<u2"),
+        ("nitrogen", "<u2"),
+        ("phosphorus", "<u2"),
+        ("potassium", "<u2"),
+        ("salt", "<u2"),
+        ("air_temperature", "<i2"),
+        ("air_humidity", "<u2"),
+        ("flags", "u1"),
+        ("reserved", "u1"),
+    ]),
+}
+
+# Scaled integer fields -> divisor back to physical units
+SCALES = {
+    1: {
+        "soil_temperature": 10,
+        "soil_moisture": 10,
+        "ph": 100,
+        "air_temperature": 10,
+        "air_humidity": 10,
+    },
+}
+
+# Giờ Việt Nam (UTC+7), giống normalize_measured_at_vn
+VN_OFFSET = np.timedelta64(7, "h")
+
+
+class FrameDecodeError(ValueError):
+    """Malformed binary frame (HTTP 400)"""
+
+
+def decode_frame(frame: bytes, header_device_id: str | None = None) -> list[dict]:
+    """
+    Decode a binary frame into sensor_readings rows (same shape as parse_reading)
+    """
+    if len(frame) < HEADER.size:
+        raise FrameDecodeError("Frame too short")
+
+    magic, version, id_len, count = HEADER.unpack_from(frame)
+    if magic != MAGIC:
+        raise FrameDecodeError("Bad frame magic")
+    if version not in RECORD_DTYPES:
+        raise FrameDecodeError(f"Unsupported frame version {version}")
+    if count == 0 or count > MAX_RECORDS_PER_FRAME:
+        raise FrameDecodeError(f"Invalid record count {count}")
+
+    dtype = RECORD_DTYPES[version]
+    offset = HEADER.size + id_len
+    expected = offset + count * dtype.itemsize
+    if len(frame) != expected:
+        raise FrameDecodeError(f"Frame length {len(frame)} != expected {expected}")
+
+    device_id = frame[HEADER.size:offset].decode("utf-8", errors="replace").strip()
+    device_id = (device_id or header_device_id or DEFAULT_DEVICE_ID).strip()[:64] or DEFAULT_DEVICE_ID
+
+    records = np.frombuffer(frame, dtype=dtype, count=count, offset=offset)
+    if not records["epoch_s"].all():
+        raise FrameDecodeError("Record without timestamp (epoch_s = 0)")
+
+    # Whole-frame conversions: one vectorized op per column
+    measured = (records["epoch_s"].astype("datetime64[s]") + VN_OFFSET).astype(str)
+    measured = np.char.replace(measured, "T", " ")
+
+    scales = SCALES[version]
+    columns = {
+        name: (records[name] / scales[name]).round(2) if name in scales else records[name]
+        for name in dtype.names
+    }
+    is_raining = (records["flags"] & 1).astype(bool)
+
+    return [
+        {
+            "device_id": device_id,
+            "measured_at_vn": m,
+            "soil_temperature_c": st,
+            "soil_moisture_pct": sm,
+            "conductivity_us_cm": ec,
+            "ph_value": ph,
+            "nitrogen_mg_kg": n,
+            "phosphorus_mg_kg": p,
+            "potassium_mg_kg": k,
+            "salt_mg_l": salt,
+            "air_temperature_c": at,
+            "air_humidity_pct": ah,
+            "is_raining": rain,
+        }
+        for m, st, sm, ec, ph, n, p, k, salt, at, ah, rain in zip(
+            measured.tolist(),
+            columns["soil_temperature"].tolist(),
+            columns["soil_moisture"].tolist(),
+            columns["conductivity"].tolist(),
+            columns["ph"].tolist(),
+            columns["nitrogen"].tolist(),
+            columns["phosphorus"].tolist(),
+            columns["potassium"].tolist(),
+            columns["salt"].tolist(),
+            columns["air_temperature"].tolist(),
+            columns["air_humidity"].tolist(),
+            is_raining.tolist(),
+        )
+    ]
+
+
+def encode_frame(readings: list[dict], device_id: str = "", version: int = 1) -> bytes:
+    """
+    Encode payload-style readings (temperature, humidity, ..., epoch "timestamp")
+    into a frame; reference implementation for firmware and benchmarks
+    """
+    dtype = RECORD_DTYPES[version]
+    scales = SCALES[version]
+    records = np.zeros(len(readings), dtype=dtype)
+    payload_fields = {
+        "soil_temperature": "temperature",
+        "soil_moisture": "humidity",
+        "conductivity": "conductivity",
+        "ph": "ph",
+        "nitrogen": "nitrogen",
+        "phosphorus": "phosphorus",
+        "potassium": "potassium",
+        "salt": "salt",
+        "air_temperature": "air_temperature",
+        "air_humidity": "air_humidity",
+    }
+    records["epoch_s"] = [int(r["timestamp"]) for r in readings]
+    for name, field in payload_fields.items():
+        values = np.array([float(r[field]) for r in readings]) * scales.get(name, 1)
+        records[name] = np.rint(values)
+    records["flags"] = [1 if r.get("is_raining") else 0 for r in readings]
+
+    device_bytes = device_id.encode("utf-8")[:64]
+    return HEADER.pack(MAGIC, version, len(device_bytes), len(readings)) + device_bytes + records.tobytes()
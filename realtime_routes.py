@@ -0,0 +1,195 @@
+"""
+Realtime Routes - Server-Sent Events push for realtime dashboard
+New readings are published with Postgres NOTIFY from /api/data and fanned out
+to every connected dashboard by a single LISTEN connection per worker process
+"""
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import psycopg2
+import psycopg2.extensions
+import os
+import json
+import queue
+import select
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+realtime_bp = Blueprint('realtime', __name__, url_prefix='/api/realtime')
+
+# Postgres channel used by /api/data to announce new sensor readings
+NOTIFY_CHANNEL = 'sensor_readings_new'
+
+# Seconds between SSE comments so proxies don't close idle streams
+KEEPALIVE_SECONDS = 15
+
+# Max buffered events per client (slow clients drop the oldest reading)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Seconds to wait before reconnecting the LISTEN connection after an error
+LISTEN_RETRY_SECONDS = 5
+
+
+# Database connection helper
+def get_db_connection():
+    return psycopg2.connect(
+        host=os.getenv('PGHOST'),
+        port=os.getenv('PGPORT'),
+        database=os.getenv('PGDATABASE'),
+        user=os.getenv('PGUSER'),
+        password=os.getenv('PGPASSWORD')
+    )
+
+
+class ReadingBroadcaster:
+    """
+    Fan out NOTIFY payloads to all SSE subscribers of this process
+
+    The LISTEN thread is started lazily on the first subscriber, so workers
+    that never serve a dashboard never hold an extra DB connection.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(q)
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen_forever,
+                    name='realtime-listener',
+                    daemon=True
+                )
+                self._listener.start()
+        return q
+
+    def unsubscribe(self, q: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, payload: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                # Client is lagging: drop the oldest reading, keep the newest
+                try:
+                    q.get_nowait()
+                    q.put_nowait(payload)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def _listen_forever(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = get_db_connection()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+                print(f"✅ Realtime listener subscribed to '{NOTIFY_CHANNEL}'")
+
+                while True:
+                    if select.select([conn], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.publish(notify.payload)
+
+            except Exception as e:
+                print(f"❌ Realtime listener error: {e}")
+                time.sleep(LISTEN_RETRY_SECONDS)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+broadcaster = ReadingBroadcaster()
+
+
+def notify_new_reading(cur, reading: dict) -> None:
+    """
+    Queue a NOTIFY for a freshly inserted reading on the caller's cursor
+
+    Postgres delivers it only when the surrounding transaction commits, so
+    listeners in every worker see the reading exactly once and never before
+    it is visible in sensor_readings.
+    """
+    cur.execute(
+        "SELECT pg_notify(%s, %s)",
+        (NOTIFY_CHANNEL, json.dumps(reading, default=str))
+    )
+
+
+@realtime_bp.route('/stream', methods=['GET'])
+def stream_readings():
+    """
+    GET /api/realtime/stream?device_id=node-01
+
+    Server-Sent Events stream of new sensor readings. Each event has the same
+    shape as "latest" in /api/dashboard/realtime-iot:
+
+    event: reading
+    data: {"device_id": "default", "measured_at": "2025-10-29 16:30:00", ...}
+
+    Query params:
+    - device_id: Only forward readings from this device (default: all devices)
+    """
+    device_id = request.args.get('device_id')
+
+    def event_stream():
+        q = broadcaster.subscribe()
+        try:
+            yield f"retry: {LISTEN_RETRY_SECONDS * 1000}\n\n"
+            while True:
+                try:
+                    payload = q.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if device_id and json.loads(payload).get('device_id') != device_id:
+                    continue
+                yield f"event: reading\ndata: {payload}\n\n"
+        finally:
+            broadcaster.unsubscribe(q)
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@realtime_bp.route('/status', methods=['GET'])
+def get_realtime_status():
+    """
+    GET /api/realtime/status
+
+    Returns number of SSE clients connected to this worker
+    """
+    return jsonify({
+        "success": True,
+        "channel": NOTIFY_CHANNEL,
+        "subscribers": broadcaster.subscriber_count()
+    }), 200
@@ -0,0 +1,163 @@
+"""
+Response Format - Columnar chart payloads and gzip/brotli negotiation
+For chart endpoints whose row objects repeat every key name per row
+
+?format=columnar returns one array per field instead of one object per row,
+with the time field delta-encoded as epoch seconds:
+
+    {
+      "format": "columnar",
+      "count": 3,
+      "time": {"field": "date", "start": 1761670800, "deltas": [0, 86400, 86400]},
+      "columns": {"score": [75, 76, 78], "rating": ["GOOD", "GOOD", "GOOD"]}
+    }
+
+Timestamps in the DB are Vietnam wall-clock (naive); epochs here are real
+UTC seconds, so clients decode with new Date((start + sum(deltas)) * 1000).
+Other datetime/date columns are sent as plain epoch seconds.
+"""
+
+from flask import request, make_response
+from functools import wraps
+from datetime import date, datetime, timedelta
+import calendar
+import gzip
+import os
+
+from cache_utils import TTLCache
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Giờ Việt Nam (UTC+7) của cột *_vn / date_vn
+VN_UTC_OFFSET = timedelta(hours=7)
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Compressed bodies per (ETag, encoding): cached responses are compressed once
+_compressed_cache = TTLCache(float(os.getenv('DASHBOARD_CACHE_TTL', '300')))
+
+
+def wants_columnar() -> bool:
+    return request.args.get('format') == 'columnar'
+
+
+def to_epoch(value):
+    """VN wall-clock datetime/date -> UTC epoch seconds"""
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        return calendar.timegm((value - VN_UTC_OFFSET).timetuple())
+    return int(value.timestamp())
+
+
+def to_columnar(rows: list, time_field: str) -> dict:
+    """Row dicts -> one array per field, time_field delta-encoded"""
+    fields = [f for f in (rows[0].keys() if rows else ()) if f != time_field]
+    columns = {f: [] for f in fields}
+    deltas = []
+    start = None
+    previous = None
+
+    for row in rows:
+        epoch = to_epoch(row.get(time_field))
+        if epoch is None:
+            deltas.append(None)
+        elif previous is None:
+            start = previous = epoch
+            deltas.append(0)
+        else:
+            deltas.append(epoch - previous)
+            previous = epoch
+
+        for f in fields:
+            value = row[f]
+            if isinstance(value, date):
+                value = to_epoch(value)
+            columns[f].append(value)
+
+    return {
+        "format": "columnar",
+        "count": len(rows),
+        "time": {"field": time_field, "start": start, "deltas": deltas},
+        "columns": columns,
+    }
+
+
+def shape_rows(rows: list, time_field: str, formats: dict = None):
+    """
+    Columnar payload when ?format=columnar, otherwise the row list with the
+    given datetime fields rendered through strftime (the existing format)
+    """
+    if wants_columnar():
+        return to_columnar(rows, time_field)
+
+    for row in rows:
+        for field, fmt in (formats or {}).items():
+            value = row.get(field)
+            row[field] = value.strftime(fmt) if value else None
+    return rows
+
+
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compressed(view):
+    """
+    Decorator compressing 200 responses with brotli or gzip per Accept-Encoding
+
+    Apply above conditional_cached: 304s pass through untouched, and a
+    compressed response's ETag becomes weak (If-None-Match uses weak
+    comparison, so revalidation keeps working for both representations).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        resp = make_response(view(*args, **kwargs))
+        resp.vary.add('Accept-Encoding')
+
+        if (resp.status_code != 200 or resp.direct_passthrough
+                or 'Content-Encoding' in resp.headers):
+            return resp
+
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return resp
+
+        data = resp.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return resp
+
+        etag, _ = resp.get_etag()
+        body = _compressed_cache.get((etag, encoding)) if etag else None
+        if body is None:
+            body = _compress(data, encoding)
+            if etag:
+                _compressed_cache.set((etag, encoding), body)
+
+        resp.set_data(body)
+        resp.headers['Content-Encoding'] = encoding
+        if etag:
+            resp.set_etag(etag, weak=True)
+        return resp
+
+    return wrapper
@@ -200,7 +200,7 @@ app.post("/api/data", async (req, res) => {
         phosphorus_mg_kg, potassium_mg_kg, salt_mg_l
       )
       VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-      ON CONFLICT (measured_at_vn) DO NOTHING
+      ON CONFLICT (device_id, measured_at_vn) DO NOTHING
       RETURNING id
     `;
     const result = await dbPool.query(insertSql, [
@@ -0,0 +1,200 @@
+"""
+Service Client - Pooled keep-alive HTTP client for service-to-service calls
+One requests.Session per process (per-host connection pools, keep-alive),
+per-service timeouts and a circuit breaker, so calls to the AI service and
+the Node bridge reuse connections and a dead downstream is refused in
+microseconds instead of costing the full timeout on every request
+
+Shared by the ingest servers and the AI service (ai/ai_service imports it
+from the repo root); per-service timeouts come from the environment.
+
+    from service_client import get_service
+
+    resp = get_service('ai_service').post_json(url, payload)   # raises CircuitOpenError when open
+
+Breaker: after SERVICE_BREAKER_FAILURES consecutive failures (connection
+errors, timeouts, 5xx) the service is "open" for SERVICE_BREAKER_RESET_SECONDS;
+then one trial call is let through ("half_open") and its result closes or
+re-opens the breaker. 4xx responses are the caller's fault and do not count.
+"""
+
+from collections import deque
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Hosts with a kept-alive pool, and connections kept per host
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', '8'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+
+SERVICE_BREAKER_FAILURES = int(os.getenv('SERVICE_BREAKER_FAILURES', '5'))
+SERVICE_BREAKER_RESET_SECONDS = float(os.getenv('SERVICE_BREAKER_RESET_SECONDS', '30'))
+
+# Latency samples kept per service for the percentiles in metrics()
+LATENCY_WINDOW = 256
+
+# (connect, read) timeouts in seconds per downstream service
+SERVICE_TIMEOUTS = {
+    'ai_service': (
+        float(os.getenv('AI_SERVICE_CONNECT_TIMEOUT', '1')),
+        float(os.getenv('AI_SERVICE_TIMEOUT', '10')),
+    ),
+    'node_bridge': (
+        float(os.getenv('NODE_BRIDGE_CONNECT_TIMEOUT', '1')),
+        float(os.getenv('NODE_BRIDGE_TIMEOUT', '30')),
+    ),
+}
+DEFAULT_TIMEOUT = (1.0, 10.0)
+
+
+class CircuitOpenError(Exception):
+    """The downstream service is marked down; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open -> closed"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        if self.state != 'open':
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+
+class ServiceClient:
+    """Calls to one downstream service through the shared session"""
+
+    def __init__(self, name: str, timeout: tuple = DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(SERVICE_BREAKER_FAILURES, SERVICE_BREAKER_RESET_SECONDS)
+
+        self.calls_total = 0
+        self.failures_total = 0
+        self.rejected_total = 0
+        self.last_error = None
+        self._latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        """
+        Send one request; raises CircuitOpenError when the breaker is open,
+        requests exceptions on transport errors and HTTPError on 4xx/5xx
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected_total += 1
+            raise CircuitOpenError(
+                f"{self.name} unavailable (circuit open, retry in {self.breaker.retry_after():.0f}s)"
+            )
+
+        start = time.perf_counter()
+        try:
+            resp = _session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except Exception as e:
+            # Any error (not only transport ones) must be recorded, or a
+            # half-open trial would stay in flight and block the breaker
+            self._record(start, failed=True, error=e)
+            raise
+
+        self._record(start, failed=resp.status_code >= 500, error=None if resp.ok else f"HTTP {resp.status_code}")
+        resp.raise_for_status()
+        return resp
+
+    def post_json(self, url: str, payload, timeout=None) -> requests.Response:
+        return self.request('POST', url, json=payload, timeout=timeout)
+
+    def _record(self, start: float, failed: bool, error) -> None:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        with self._lock:
+            self.calls_total += 1
+            self._latencies_ms.append(elapsed_ms)
+            if failed:
+                self.failures_total += 1
+            if error is not None:
+                self.last_error = str(error)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            samples = sorted(self._latencies_ms)
+            stats = {
+                "calls_total": self.calls_total,
+                "failures_total": self.failures_total,
+                "rejected_total": self.rejected_total,
+                "last_error": self.last_error,
+            }
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2) if samples else None
+
+        return {
+            "breaker": self.breaker.state,
+            "retry_after_s": round(self.breaker.retry_after(), 1),
+            "timeout_s": {"connect": self.timeout[0], "read": self.timeout[1]},
+            **stats,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_service(name: str) -> ServiceClient:
+    with _services_lock:
+        client = _services.get(name)
+        if client is None:
+            client = _services[name] = ServiceClient(name, SERVICE_TIMEOUTS.get(name, DEFAULT_TIMEOUT))
+        return client
+
+
+def service_metrics() -> dict:
+    with _services_lock:
+        clients = list(_services.values())
+    return {client.name: client.metrics() for client in clients}